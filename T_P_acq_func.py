@@ -13,17 +13,23 @@ Imports
 """
 
 import csv
-from time import sleep
-from sys import stdout
 import numpy as np
 from datetime import datetime
 import RPi.GPIO as GPIO
 from RPLCD import CharLCD, cleared, cursor
 
 
-from daqhats import mcc128, OptionFlags, mcc134, HatIDs, HatError, TcTypes, AnalogInputMode, AnalogInputRange
+from daqhats import mcc128, OptionFlags, mcc134, HatIDs, HatError, TcTypes, AnalogInputMode, AnalogInputRange, TriggerModes
 from daqhats_utils import select_hat_device, tc_type_to_string, \
-enum_mask_to_string, input_mode_to_string, input_range_to_string #daqhats_utils needs to be in the same folders as this script
+enum_mask_to_string, input_mode_to_string, input_range_to_string, chan_list_to_mask, PollBackoff #daqhats_utils needs to be in the same folders as this script
+from acq_scheduler import DeadlineScheduler #acq_scheduler needs to be in the same folders as this script
+from acq_writer import CSVWriterThread, FSYNC_CLOSE #acq_writer needs to be in the same folders as this script
+from acq_binary import BinaryRecordWriter, BinaryWriterThread, open_recording #acq_binary needs to be in the same folders as this script
+from acq_calibration import Calibration, load_calibration #acq_calibration needs to be in the same folders as this script
+from acq_display import get_renderer, monitoring_layout, TerminalRenderer #acq_display needs to be in the same folders as this script
+from acq_alarm import AlarmEngine, AlarmRule #acq_alarm needs to be in the same folders as this script
+from acq_temperature import TemperaturePoller, MCC134_UPDATE_INTERVAL, STALE_INTERVALS #acq_temperature needs to be in the same folders as this script
+from acq_shared import TemperatureBuffer, TEMPERATURE_BUFFER_NAME #acq_shared needs to be in the same folders as this script
 
 
 ################################################
@@ -43,9 +49,231 @@ system_shutdown_pin = 22
 GPIO.setup(alarm_pin, GPIO.OUT)
 GPIO.setup(system_shutdown_pin, GPIO.OUT)
 
+### Pressure alarm rule, see acq_alarm.py
+pressure_alarm_hysteresis = 2 # bar, the alarm is released when all pressures are below pressure_alarm - hysteresis
+pressure_alarm_debounce = 1 # Number of consecutive samples above pressure_alarm needed to raise the alarm
+pressure_alarm_latch = False # If True, the alarm stays on until HatSession.reset_alarm()
+
 ### Linear conversion coefficient for Volt_bar func, to adjust later on with calibration protocol and/or functions
 pressure_slope, pressure_offset = 50, 0 # bar_value = volt_value * slope + offset
 
+### CSV reader constants
+csv_units = ("Hz", "s", "ms", "bar", "C", "V") # Unit cells that may follow a value in the acquisition parameters row of a data CSV file
+
+### Scan mode constants
+READ_ALL_AVAILABLE = -1 # a_in_scan_read() request size that returns every sample currently in the scan buffer
+scan_read_timeout = 5.0 # Seconds, timeout of a_in_scan_read() calls in scan mode
+
+### LCD screens, field positions computed once for 2 T and 2 P channels
+lcd_monitoring_layout = monitoring_layout(2, 2, status='IN>READY')
+lcd_acquisition_layout = monitoring_layout(2, 2, status='IN>ACQ', counter=True)
+
+
+################################################
+"""
+Hardware session
+"""
+
+class HatSession:
+    """
+    Long-lived handle on the MCC 128 and MCC 134 boards.
+
+    The boards are looked up (select_hat_device), opened and configured once, when the session
+    is created. The configuration is cached, so the configuration setters only write to a board
+    when a value actually changes. Create one session at the beginning of a script and pass it
+    to get_current_T_P(), T_P_disp(), T_P_acq_csv(), T_P_acq_scan() and T_P_acq_frames(), so that no setup is paid
+    between a trigger and the first sample. The session also holds the pressure calibration
+    (see acq_calibration.py) used by all these functions to convert volts to bar, and the pressure
+    alarm engine (see acq_alarm.py), so the alarm state is kept from one call to the next.
+    With a safety watchdog attached (see safety_watchdog.py), the pressures are read from the watchdog
+    and the alarm pins are left to it. With a temperature poller started (see acq_temperature.py), the
+    temperatures are read from its cache instead of waiting for the MC134 at each sample.
+
+    Args:
+        channels_134 (tuple, optional): Thermocouple channels on MC134. Defaults to (0, 1).
+        channels_128 (tuple, optional): Pressure sensors channels on MC128. Defaults to (0, 1).
+        input_mode (AnalogInputMode, optional): MC128 analog input mode. Defaults to AnalogInputMode.SE.
+        input_range (AnalogInputRange, optional): MC128 analog input range. Defaults to AnalogInputRange.BIP_5V,
+            current pressure sensor (RS: 797-4986) range is 0-5V.
+        tc_type (TcTypes, optional): Thermocouple type of the MC134 channels. Defaults to TcTypes.TYPE_K,
+            current sensors (RS: 847-9665) are type K.
+        calibration (Calibration or str, optional): Pressure calibration, or name of a calibration file to load.
+            Defaults to None, calibration.json next to this script is then loaded.
+
+    Raises:
+        HatError: A board is not found.
+        ValueError: Invalid HAT selection.
+    """
+
+    def __init__(self, channels_134=(0, 1), channels_128=(0, 1), input_mode=AnalogInputMode.SE,
+                 input_range=AnalogInputRange.BIP_5V, tc_type=TcTypes.TYPE_K, calibration=None):
+        self.channels_134 = tuple(channels_134)
+        self.channels_128 = tuple(channels_128)
+
+        # Pressure calibration shared by every acquisition path using this session
+        if not isinstance(calibration, Calibration):
+            calibration = load_calibration(calibration)
+        self.calibration = calibration
+
+        # Initialisation of MC128
+        self.address_128 = select_hat_device(HatIDs.MCC_128)
+        self.hat_128 = mcc128(self.address_128)
+        self.input_mode = None
+        self.input_range = None
+        self.set_input(input_mode, input_range)
+
+        # Initialisation of MC134
+        self.address_134 = select_hat_device(HatIDs.MCC_134)
+        self.hat_134 = mcc134(self.address_134)
+        self.tc_types = {} # Thermocouple type written in MC134 memory, per channel
+        for channel in self.channels_134:
+            self.set_tc_type(channel, tc_type)
+
+        # Pressure alarm, created on first use
+        self.alarm_engine = None
+        self.pressure_alarm = None
+        self.watchdog = None
+        self.temperature_poller = None
+
+    def get_alarm(self, pressure_alarm):
+        """
+        Returns the pressure alarm engine of the session, created again only if the threshold changes.
+
+        Args:
+            pressure_alarm (float): Pressure threshold in bar for safety alarm and system shutdown.
+
+        Returns:
+            AlarmEngine: Engine driving the alarm and system shutdown pins, None if a safety watchdog owns them.
+        """
+        if self.watchdog is not None:
+            return None
+        if self.alarm_engine is None or pressure_alarm != self.pressure_alarm:
+            self.alarm_engine = pressure_alarm_engine(pressure_alarm)
+            self.pressure_alarm = pressure_alarm
+        return self.alarm_engine
+
+    def reset_alarm(self):
+        """
+        Releases the pressure alarm, latched or not. It is raised again by the next pressure above the threshold.
+        """
+        if self.alarm_engine is not None:
+            self.alarm_engine.reset()
+
+    def attach_watchdog(self, watchdog):
+        """
+        Reads the pressures from a running safety watchdog instead of the MC128, which is scanned by the watchdog.
+        The alarm and system shutdown pins are then driven by the watchdog only.
+
+        Args:
+            watchdog (SafetyWatchdog): Started watchdog process, see safety_watchdog.py.
+        """
+        watchdog.wait_ready()
+        self.watchdog = watchdog
+        self.alarm_engine = None
+
+    def start_temperature_poller(self, interval=MCC134_UPDATE_INTERVAL, publish=False, T_hot_wall=None,
+                                 buffer_seconds=3600, name=TEMPERATURE_BUFFER_NAME):
+        """
+        Starts polling the MC134 channels of the session on a separate thread, which is then the only one reading the MC134.
+
+        Args:
+            interval (float, optional): Period of the readings in seconds. Defaults to MCC134_UPDATE_INTERVAL,
+                the update interval of the MC134.
+            publish (bool, optional): If True, the readings are also published in a shared memory TemperatureBuffer,
+                e.g. for the live dashboard (T_P_dashboard.py). Defaults to False.
+            T_hot_wall (float, optional): Hot wall temperature of the run in Celsius, published with the readings.
+                Defaults to None (unknown).
+            buffer_seconds (float, optional): Duration of the published readings in seconds. Defaults to 3600.
+            name (str, optional): Name of the shared memory block. Defaults to TEMPERATURE_BUFFER_NAME.
+
+        Returns:
+            TemperaturePoller: The poller, the running one if it was already started.
+        """
+        if self.temperature_poller is None:
+            buffer = None
+            if publish:
+                buffer = TemperatureBuffer.create(self.channels_134, max(int(buffer_seconds / interval), 1), interval,
+                                                  T_hot_wall, name=name)
+            self.temperature_poller = TemperaturePoller(self.hat_134, self.channels_134, interval, buffer=buffer)
+            self.temperature_poller.start()
+        return self.temperature_poller
+
+    def stop_temperature_poller(self):
+        """
+        Stops the temperature poller, the MC134 is then read again at each call of read_temperatures(). Its shared
+        memory buffer, if published, is removed.
+        """
+        if self.temperature_poller is not None:
+            self.temperature_poller.stop()
+            if self.temperature_poller.buffer is not None:
+                self.temperature_poller.buffer.close()
+            self.temperature_poller = None
+
+    def read_temperatures(self, channels):
+        """
+        Reads the temperatures of MC134 channels.
+
+        Args:
+            channels (tuple): MC134 channels.
+
+        Returns:
+            numpy.ndarray: Temperatures in Celsius, or MC134 error values. The last ones polled if the temperature
+            poller is started (sample and hold), without waiting for the MC134, NaN if the poller has not read the
+            MC134 for STALE_INTERVALS intervals.
+        """
+        if self.temperature_poller is not None:
+            poller = self.temperature_poller
+            return poller.latest_values(channels, max_age=STALE_INTERVALS * poller.interval)
+        return np.array([self.hat_134.t_in_read(channel) for channel in channels])
+
+    def read_pressures(self, channels):
+        """
+        Reads the pressures of MC128 channels, converted with the session calibration.
+
+        Args:
+            channels (tuple): MC128 channels.
+
+        Returns:
+            numpy.ndarray: Pressures in bar, the last ones scanned by the safety watchdog if one is attached.
+        """
+        if self.watchdog is not None:
+            return self.watchdog.latest_pressures(channels)
+        P_volts = [self.hat_128.a_in_read(channel) for channel in channels]
+        return self.calibration.convert(P_volts, channels)
+
+    def set_input(self, input_mode, input_range):
+        """
+        Writes the MC128 input mode and range, only if they differ from the current ones.
+
+        Args:
+            input_mode (AnalogInputMode): Analog input mode.
+            input_range (AnalogInputRange): Analog input range.
+        """
+        if input_mode != self.input_mode:
+            self.hat_128.a_in_mode_write(input_mode)
+            self.input_mode = input_mode
+        if input_range != self.input_range:
+            self.hat_128.a_in_range_write(input_range)
+            self.input_range = input_range
+
+    def set_tc_type(self, channel, tc_type):
+        """
+        Writes the thermocouple type of a MC134 channel, only if it differs from the current one.
+
+        Args:
+            channel (int): MC134 channel.
+            tc_type (TcTypes): Thermocouple type.
+        """
+        if self.tc_types.get(channel) != tc_type:
+            self.hat_134.tc_type_write(channel, tc_type)
+            self.tc_types[channel] = tc_type
+
+    def __str__(self):
+        return ('MC128 at address {}: {}, {}, channels {} | MC134 at address {}: type {} thermocouples, channels {}'.format(
+            self.address_128, input_mode_to_string(self.input_mode), input_range_to_string(self.input_range),
+            self.channels_128, self.address_134,
+            ', '.join(tc_type_to_string(self.tc_types[channel]) for channel in self.channels_134), self.channels_134))
+
 
 ################################################
 """
@@ -100,6 +328,36 @@ def no_system_shutdown():
     """
     #set stop system digital output pin to low
     GPIO.output(system_shutdown_pin, GPIO.LOW)
+
+
+def pressure_alarm_engine(pressure_alarm, hysteresis = pressure_alarm_hysteresis, debounce = pressure_alarm_debounce,
+                          latch = pressure_alarm_latch):
+    """
+    Creates the alarm engine raising the sound alarm and the system shutdown when any pressure goes above pressure_alarm.
+    The pins are only written when the alarm state changes (see acq_alarm.py).
+
+    Args:
+        pressure_alarm (float): Pressure threshold in bar.
+        hysteresis (float, optional): The alarm is released when all pressures are below pressure_alarm - hysteresis.
+            Defaults to pressure_alarm_hysteresis.
+        debounce (int, optional): Number of consecutive samples above pressure_alarm needed to raise the alarm.
+            Defaults to pressure_alarm_debounce.
+        latch (bool, optional): Whether the alarm stays on until reset. Defaults to pressure_alarm_latch.
+
+    Returns:
+        AlarmEngine: Engine to evaluate with blocks of pressures in bar, one column per channel.
+    """
+    def print_warning(output, active):
+        if output == 'alarm' and active:
+            print('\nWarning : Pressure above ', pressure_alarm, ' bar')
+        elif output == 'alarm':
+            print('\nPressure back below ', pressure_alarm - hysteresis, ' bar')
+
+    rule = AlarmRule('pressure above {} bar'.format(pressure_alarm), pressure_alarm, ('alarm', 'shutdown'),
+                     hysteresis=hysteresis, debounce=debounce, latch=latch)
+    return AlarmEngine([rule], outputs={'alarm': (sound_alarm, no_sound_alarm),
+                                        'shutdown': (system_shutdown, no_system_shutdown)},
+                       on_transition=print_warning)
     
     
 ################################################
@@ -111,6 +369,7 @@ Utility functions
 def volt_to_bar(volt_value, slope = pressure_slope, offset = pressure_offset):
     """
     Converts a voltage value to a bar value using linear conversion.
+    Nominal conversion only, the acquisition functions use the per-channel calibration of the session instead (see acq_calibration.py).
 
     Args:
         volt_value (float): The voltage value to convert.
@@ -126,39 +385,45 @@ def volt_to_bar(volt_value, slope = pressure_slope, offset = pressure_offset):
     return bar_value
 
 
-def get_current_T_P(hat_134, hat_128, pressure_alarm, channels_T, channels_P):
+def get_current_T_P(session, pressure_alarm, channels_T, channels_P, out=None):
     """
         
     Retrieves current temperature and pressure values from specified channels of MCC 128 and MCC 134.
-    Shutdown system and rings alarm if pressure is getting to higj, ie. above pressure_alarm threshold
+    Shutdown system and rings alarm if pressure is getting to higj, ie. above pressure_alarm threshold on any channel
 
     Parameters:
-        hat_134 (object): An MCC 134 object (mcc134 class) used to measure temperature.
-        hat_128 (object): An MCC 128 object (mcc128 class) used to measure pressure.
+        session (HatSession): Open session on the MCC 134 (temperature) and MCC 128 (pressure) boards.
         pressure_alarm (float): Pressure threshold for safety alarm and system shutdown
         channels_T (tuple): A tuple containing the channels MCC 134 from which temperature values should be read. 
         channels_P (tuple): A tuple containing the channels of the MCC 128 from which pressure values should be read. 
+        out (numpy.ndarray, optional): Array of length len(channels_T) + len(channels_P), e.g. a row of a SampleStore,
+            in which the values are written in place instead of building a new list. Defaults to None.
 
     Returns:
-        current_T_P_values (list): A list containing the retrieved temperature and pressure values at the time that the function is called.
+        current_T_P_values (list or numpy.ndarray): The retrieved temperature values followed by the pressure values
+        at the time that the function is called. out itself if it was given.
     """
     
-    T_values = []
-    P_values = []
-    
-    for channel in channels_T:
-        T_values.append(hat_134.t_in_read(channel))
+    # From the temperature poller cache if it is started, see HatSession.read_temperatures()
+    if out is not None:
+        # In place: T values first, then P values, no list is built
+        out[:len(channels_T)] = session.read_temperatures(channels_T)
+        P_values = out[len(channels_T):]
+    else:
+        T_values = session.read_temperatures(channels_T).tolist()
+        P_values = [0.0] * len(channels_P)
     
-    for channel in channels_P:
-        P = volt_to_bar(hat_128.a_in_read(channel))
-        P_values.append(P)
-        if P > pressure_alarm:
-            sound_alarm()
-            system_shutdown()
-        else:
-            no_sound_alarm()
-            no_system_shutdown()
+    # All pressure channels are converted to bar in one call
+    P_values[:] = session.read_pressures(channels_P).tolist()
+
+    # All channels checked together, the pins are only written when the alarm state changes
+    alarm = session.get_alarm(pressure_alarm)
+    if alarm is not None:
+        alarm.evaluate(P_values)
     
+    if out is not None:
+        return out
+
     current_T_P_values = T_values + P_values
     
     return current_T_P_values
@@ -168,8 +433,131 @@ def get_current_T_P(hat_134, hat_128, pressure_alarm, channels_T, channels_P):
 """
 CSV Read and Write functions
 """
+
+def parse_acquisition_params(acquisition_params):
+    """
+    Converts the ragged acquisition parameters row of a data CSV file into a dictionary,
+    e.g. ["Date and time", "2023-06-19 18:12:57", "Number of measures: ", "50", "Acquisition frequency: ", "10", "Hz"]
+    gives {"Date and time": "2023-06-19 18:12:57", "Number of measures": 50, "Acquisition frequency [Hz]": 10}.
+
+    Args:
+        acquisition_params (list): First row of the CSV file, alternating names and values, a value being
+            optionally followed by its unit (see csv_units).
+
+    Returns:
+        dict: Parameter names (with their unit in brackets) and values, converted to int or float when possible.
+    """
+    metadata = {}
+    i = 0
+    while i < len(acquisition_params):
+        key = acquisition_params[i].strip().rstrip(':').strip()
+        value = acquisition_params[i + 1] if i + 1 < len(acquisition_params) else ''
+        i += 2
+
+        # Numbers are stored as numbers
+        for number_type in (int, float):
+            try:
+                value = number_type(value)
+                break
+            except ValueError:
+                pass
+
+        if i < len(acquisition_params) and acquisition_params[i].strip() in csv_units:
+            key = '{} [{}]'.format(key, acquisition_params[i].strip())
+            i += 1
+
+        if key:
+            metadata[key] = value
+
+    return metadata
+
+
+def _select_columns(column_headers, columns):
+    """
+    Converts a list of column names or indices into a list of indices.
+    """
+    if columns is None:
+        return None
+    return [column_headers.index(column) if isinstance(column, str) else column for column in columns]
+
+
+def _parse_csv_lines(lines, number_of_columns):
+    """
+    Converts data lines of a CSV file into a float64 array of shape (rows, number_of_columns).
+    The whole block is parsed in a single numpy call, with a slower cell by cell fallback
+    when the block contains empty or non numeric cells (converted to nan).
+    """
+    text = ''.join(lines).replace('\r', '').strip().replace('\n', ',')
+    if not text:
+        return np.empty((0, number_of_columns))
+
+    values = np.fromstring(text, dtype=np.float64, sep=',')
+    if values.size == text.count(',') + 1 and values.size % number_of_columns == 0:
+        return values.reshape(-1, number_of_columns)
+
+    # Fallback for ragged or non numeric rows
+    rows = ''.join(lines).splitlines()
+    block = np.full((len(rows), number_of_columns), np.nan)
+    for row_index, row in enumerate(csv.reader(rows)):
+        for column_index, cell in enumerate(row[:number_of_columns]):
+            try:
+                block[row_index, column_index] = float(cell)
+            except ValueError:
+                pass
+    return block
+
+
+def csv_data_chunks(file_name, chunk_size = 10000, columns = None, header_rows = 2):
+    """
+    Reads the data of a data CSV file chunk by chunk, as float64 arrays. Memory stays bounded by
+    the chunk size whatever the size of the file. Use read_csv_header() to get the header rows.
+
+    Args:
+        file_name (str): The name of the CSV file to read.
+        chunk_size (int, optional): Maximum number of rows per chunk. Defaults to 10000.
+        columns (list, optional): Names or indices of the columns to return, in this order. Defaults to None (all columns).
+        header_rows (int, optional): Number of header rows before the data: 2 for the files of T_P_acq_csv() and
+            T_P_acq_scan() (acquisition parameters and column names), 1 for the trigger script logs (column names). Defaults to 2.
+
+    Yields:
+        numpy.ndarray: float64 array of shape (rows, columns), rows <= chunk_size.
+    """
+    from itertools import islice
+
+    with open(file_name, "r", newline="") as file:
+        header = [next(csv.reader([file.readline()])) for _ in range(header_rows)]
+        column_headers = header[-1]
+        number_of_columns = len(column_headers)
+        selection = _select_columns(column_headers, columns)
+
+        while True:
+            lines = list(islice(file, chunk_size))
+            if not lines:
+                break
+            block = _parse_csv_lines(lines, number_of_columns)
+            yield block if selection is None else block[:, selection]
+
+
+def read_csv_header(file_name, header_rows = 2):
+    """
+    Reads the header rows of a data CSV file.
+
+    Args:
+        file_name (str): The name of the CSV file to read.
+        header_rows (int, optional): Number of header rows, see csv_data_chunks(). Defaults to 2.
+
+    Returns:
+        tuple: Acquisition parameters as a dictionary (empty if header_rows is 1), and column headers as a list.
+    """
+    with open(file_name, "r", newline="") as file:
+        header = [next(csv.reader([file.readline()])) for _ in range(header_rows)]
+
+    metadata = parse_acquisition_params(header[0]) if header_rows > 1 else {}
+
+    return metadata, header[-1]
+
         
-def csv_data_reader(file_name, terminal_output = True):
+def csv_data_reader(file_name, terminal_output = True, fast = False, columns = None, cache = False):
     
     """
     Reads data from a data CSV file and returns acquisition parameters, column headers, and data as arrays.
@@ -178,11 +566,50 @@ def csv_data_reader(file_name, terminal_output = True):
         file_name (str): The name of the CSV file to read.
         terminal_output (bool): Flag to determine whether to print the acquired data to the terminal.
                                Default is False.
+        fast (bool, optional): If True, the data is parsed in a single numpy call and returned as a float64 array,
+            and the acquisition parameters as a dictionary (see parse_acquisition_params()). If False, data is
+            returned as an array of strings and the acquisition parameters as a list. Defaults to False.
+        columns (list, optional): With fast=True, names or indices of the columns to return. Defaults to None (all columns).
+        cache (bool, optional): With fast=True, keeps a binary copy of the data next to the CSV file
+            (file_name + '.cache', see acq_binary.py). The next loads memory-map it instead of parsing the text,
+            which is orders of magnitude faster on large recordings. The cache is rebuilt when the CSV file is newer.
+            Defaults to False.
 
     Returns:
         tuple: A tuple containing the acquisition parameters, column headers, and data as arrays.
 
     """
+
+    if fast:
+        import os
+
+        cache_filename = file_name + '.cache'
+        if cache and os.path.exists(cache_filename) and os.path.getmtime(cache_filename) >= os.path.getmtime(file_name):
+            recording = open_recording(cache_filename)
+            acquisition_params = recording.metadata['acquisition_params']
+            column_headers = recording.columns
+            data = recording.data
+        else:
+            with open(file_name, "r", newline="") as file:
+                acquisition_params = next(csv.reader([file.readline()]))
+                column_headers = next(csv.reader([file.readline()]))
+                data = _parse_csv_lines([file.read()], len(column_headers))
+            if cache:
+                with BinaryRecordWriter(cache_filename, column_headers, metadata={'acquisition_params': acquisition_params}) as record:
+                    record.write_block(data)
+
+        selection = _select_columns(column_headers, columns)
+        if selection is not None:
+            data = data[:, selection]
+            column_headers = [column_headers[i] for i in selection]
+
+        if terminal_output:
+            print("Acquisition Parameters:", parse_acquisition_params(acquisition_params))
+            print("Column Headers:", column_headers)
+            print("Data:")
+            print(data)
+
+        return parse_acquisition_params(acquisition_params), column_headers, data
     
     # Specify the path to the CSV file
     csv_file = file_name
@@ -252,7 +679,8 @@ def LCD_print_in_monitoring(lcd, T_hot_wall, temperature1, temperature2, pressur
     
     """
     Display temperature and pressure readings on the LCD screen durin T and P monitoring.
-    Hardcoded for 2 T sensors and 2 P sensors
+    Hardcoded for 2 T sensors and 2 P sensors, use acq_display.monitoring_layout() for other channel counts.
+    Only the characters that changed since the previous update are written (see acq_display.py), the screen is never cleared.
 
     Args:
         lcd (object of Charlcd class): An object representing the LCD screen.
@@ -265,73 +693,27 @@ def LCD_print_in_monitoring(lcd, T_hot_wall, temperature1, temperature2, pressur
     Returns:
         None
     """
-    # Clear the LCD screen
-    lcd.clear()
-
-    # Format temperature and pressure strings
-    temperature1_str = "{:<1}={:>3.1f}".format("T1", temperature1)
-    temperature2_str = "{:<1}={:>3.1f}".format("T2", temperature2)
-    pressure1_str = "{:<1}={:>5.2f}".format("P1", pressure1)
-    pressure2_str = "{:<1}={:>5.2f}".format("P2", pressure2)
-    T_hot_wall_str = "{:<1}={:>3.1f}".format("TH", T_hot_wall)
-    ready_str = "IN>READY"
-
-    # Display temperature and pressure on the LCD screen
-    lcd.cursor_pos = (0, 0)
-    lcd.write_string(temperature1_str)
-
-    lcd.cursor_pos = (0, 10)
-    lcd.write_string(pressure1_str)
-
-    lcd.cursor_pos = (1, 0)
-    lcd.write_string(temperature2_str)
-
-    lcd.cursor_pos = (1, 10)
-    lcd.write_string(pressure2_str)
-
-    lcd.cursor_pos = (2, 0)
-    lcd.write_string(T_hot_wall_str)
-
-    lcd.cursor_pos = (3, 0)
-    lcd.write_string(ready_str)
-
-
+    get_renderer(lcd).draw(lcd_monitoring_layout.render((temperature1, temperature2, T_hot_wall, pressure1, pressure2)))
 
 
 def LCD_print_in_acquisition(lcd, N, T_hot_wall, temperature1, temperature2, pressure1, pressure2):
-    # Clear the LCD screen
-	lcd.clear()
-
-	# Format temperature and pressure strings
-	temperature1_str = "{:<1}={:>3.1f}".format("T1", temperature1)
-	temperature2_str = "{:<1}={:>3.1f}".format("T2", temperature2)
-	pressure1_str = "{:<1}={:>5.2f}".format("P1", pressure1)
-	pressure2_str = "{:<1}={:>5.2f}".format("P2", pressure2)
-	T_hot_wall_str = "{:<1}={:>3.1f}".format("TH", T_hot_wall)
-	ready_str = "IN>ACQ"
-	N_str = "{:<1}={:>4.0f}".format("N", N)
-
-	# Display temperature and pressure on the LCD screen
-	lcd.cursor_pos = (0, 0)
-	lcd.write_string(temperature1_str)
-
-	lcd.cursor_pos = (0, 10)
-	lcd.write_string(pressure1_str)
-
-	lcd.cursor_pos = (1, 0)
-	lcd.write_string(temperature2_str)
-
-	lcd.cursor_pos = (1, 10)
-	lcd.write_string(pressure2_str)
-
-	lcd.cursor_pos = (2, 0)
-	lcd.write_string(T_hot_wall_str)
+    """
+    Display temperature and pressure readings and the measure counter on the LCD screen during an acquisition.
+    Hardcoded for 2 T sensors and 2 P sensors. Only the characters that changed are written.
 
-	lcd.cursor_pos = (3, 0)
-	lcd.write_string(ready_str)
+    Args:
+        lcd (object of Charlcd class): An object representing the LCD screen.
+        N (int): Measure counter.
+        T_hot_wall (float): Hot wall temperature value.
+        temperature1 (float): Temperature value 1.
+        temperature2 (float): Temperature value 2.
+        pressure1 (float): Pressure value 1.
+        pressure2 (float): Pressure value 2.
 
-	lcd.cursor_pos = (3, 10)
-	lcd.write_string(N_str)
+    Returns:
+        None
+    """
+    get_renderer(lcd).draw(lcd_acquisition_layout.render((temperature1, temperature2, T_hot_wall, pressure1, pressure2, N)))
 
 
 ################################################
@@ -340,39 +722,51 @@ Main acquisition and display functions
 """
 
 def T_P_acq_csv(channels_134, channels_128, acq_frequency, N_measures, terminal_output=True,
-                data_filename="data.csv", alarm_on = True, pressure_alarm = 130):
+                data_filename="data.csv", alarm_on = True, pressure_alarm = 130, session = None, fsync = FSYNC_CLOSE,
+                binary_filename = None, binary_dtype = 'float64', terminal_fps = 10):
     """
     Acquires Pressure and Temperature data with specified acquisition frequency and number of measures
     and writes it to a CSV file. Right now hardcoded only for 2 Pressure sensors
-    and 2 Temperature sensors.
+    and 2 Temperature sensors. Samples are paced on absolute deadlines (see acq_scheduler.py),
+    the actual time of each sample is written in the last column and a timing report is printed at the end.
+    Rows are written by a background writer thread (see acq_writer.py), so disk stalls never delay a read.
+    The same rows can also be written to a binary recording file (see acq_binary.py).
+    The temperatures are polled by a separate thread at the MC134 update interval (see acq_temperature.py) and each
+    row gets the last values polled (sample and hold), so the sampling loop never waits for a thermocouple conversion.
 
     Args:
         channels_134 (tuple, optional): Sensors channels on MC134.
         channels_128 (tuple, optional): Sensors channels on MC128.
         acq_frequency (int, optional): Acquisition frequency in Hz.
         N_measures (int, optional): Number of measures.
-        terminal_output (bool, optional): Whether to display terminal output, ie here real time T and P values as well as acquisition parameters. Defaults to True.
+        terminal_output (bool, optional): Whether to display terminal output, ie here real time T and P values as well as acquisition parameters.
+            The values are printed by a TerminalRenderer thread (see acq_display.py), False runs headless, without this thread. Defaults to True.
         data_filename (str, optional): Name of the data CSV file. Defaults to "data.csv".
         alarm_on (bool, optional):  Wheter to activate the safety alarm. Default to True
         pressure_alarm (float, optional): Pressure alarm threshold in bars. Default to 130 bars
+        session (HatSession, optional): Open session on the boards. Defaults to None, a new session is then opened.
+        fsync (str, optional): fsync policy of the CSV writer, FSYNC_NEVER, FSYNC_FLUSH or FSYNC_CLOSE from acq_writer. Defaults to FSYNC_CLOSE.
+        binary_filename (str, optional): Name of the binary recording file, None to skip it. Defaults to None.
+        binary_dtype (str, optional): Data type of the binary recording, 'float32' or 'float64'. Defaults to 'float64'.
+        terminal_fps (float, optional): Terminal refresh rate in Hz, independent of acq_frequency. Defaults to 10.
         
     
     """
     import datetime
 
+    binary_record = None
+    terminal = None
+    own_poller = False
+
     try:
-        # Initialisation of MC128
-        address = select_hat_device(HatIDs.MCC_128)
-        hat_128 = mcc128(address)
-        input_mode = AnalogInputMode.SE
-        input_range = AnalogInputRange.BIP_5V
-        hat_128.a_in_mode_write(input_mode)
-        hat_128.a_in_range_write(input_range)
+        # Boards are opened and configured once per session, not per acquisition
+        if session is None:
+            session = HatSession(channels_134, channels_128)
+        alarm = session.get_alarm(pressure_alarm) if alarm_on else None
 
-        # Initialisation of MC134
-        address_134 = select_hat_device(HatIDs.MCC_134)
-        hat_134 = mcc134(address_134)
-        tc_type = TcTypes.TYPE_K
+        # Temperatures polled at the MC134 update interval, unless the session already polls them
+        own_poller = session.temperature_poller is None
+        session.start_temperature_poller()
 
         # Initialisation of P and T data arrays
         T_array = np.zeros((N_measures, len(channels_134)))
@@ -382,97 +776,84 @@ def T_P_acq_csv(channels_134, channels_128, acq_frequency, N_measures, terminal_
         current_datetime = datetime.datetime.now()
         formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
         
-        # delay_between_reads corresponds to the sleep time of the Pi between each mesures 
-        delay_between_reads = 1 / acq_frequency
+        # Samples are taken at t0 + i / acq_frequency, whatever the time spent reading and writing
+        scheduler = DeadlineScheduler(acq_frequency)
         
-        #csv file initialisation
-        with open(data_filename, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            
-            #Writes header
-            writer.writerow(["Date and time", formatted_datetime, "Number of measures: ", N_measures,
-                             "Acquisition frequency: ", acq_frequency, "Hz"])
-            # to modify here if we want more sensors
-            writer.writerow(["N_measure", "Pressure 1", "Temperature 1", "Pressure 2", "Temperature 2"])
+        #csv header, to modify here if we want more sensors
+        header_rows = [["Date and time", formatted_datetime, "Number of measures: ", N_measures,
+                        "Acquisition frequency: ", acq_frequency, "Hz"],
+                       ["N_measure", "Pressure 1", "Temperature 1", "Pressure 2", "Temperature 2", "Time"]]
+
+        #binary file initialisation, same columns as the csv file and acquisition parameters as metadata. Written by a background thread too
+        if binary_filename is not None:
+            binary_record = BinaryWriterThread(binary_filename, header_rows[1], dtype=binary_dtype,
+                                               metadata={'date_and_time': formatted_datetime, 'number_of_measures': N_measures,
+                                                         'acquisition_frequency': acq_frequency})
+            binary_record.start()
+
+        #csv file initialisation, the file is written by a background thread
+        with CSVWriterThread(data_filename, header_rows, fsync=fsync) as writer:
 
             if terminal_output:
                 print('\nAcquiring data ... Press Ctrl-C to abort')
                 print('\nNumber of measures:', N_measures, 'Acquisition frequency:', acq_frequency, 'Hz')
                 print('\nDate and time:', formatted_datetime)
-                print('\n  Sample', end='')
-                for channel in channels_128:
-                    print('     Channel Temperature', channel, end='')
-                for channel in channels_134:
-                    print('     Channel Pressure', channel, end='')
-                print('')
+                # Values, sample count, rate and dropped samples printed by a separate thread, never from the sampling loop
+                terminal = TerminalRenderer(channels_134, channels_128, fps=terminal_fps, writer=writer)
+                terminal.start()
 
             #Initialisation of samples count, displayed in the first column of the csv fils
             samples_per_channel = 0
             
             # Data acquisition
             for i in range(N_measures):
-                # Set the status of the alarm and shutdown routine to off
-                no_sound_alarm()
-                no_system_shutdown()
+                # Wait for the deadline of this sample
+                sample_time = scheduler.wait()
                 
                 #Updates the sample count for each new measurent
                 samples_per_channel += 1
-                if terminal_output:
-                    print('\r{:8d}'.format(samples_per_channel), end='')
                 
-                # Temperature measurement
-                for channel in channels_134:
-                    hat_134.tc_type_write(channel, tc_type)
-                    value_T = hat_134.t_in_read(channel)
-                    T_array[i, channel] = value_T
-
-                    if terminal_output:
-                        if value_T == mcc134.OPEN_TC_VALUE:
-                            print('     Open     ', end='')
-                        elif value_T == mcc134.OVERRANGE_TC_VALUE:
-                            print('     OverRange', end='')
-                        elif value_T == mcc134.COMMON_MODE_TC_VALUE:
-                            print('   Common Mode', end='')
-                        else:
-                            print('{:12.2f} C'.format(value_T), end='')
-
-                # Pressure measurement
-                for channel in channels_128:
-                    value_P_volt = hat_128.a_in_read(channel)
-                    value_P_bar = volt_to_bar(value_P_volt)
-                    P_array[i, channel] = value_P_bar
+                # Temperature measurement, last values polled
+                T_array[i, :] = session.read_temperatures(channels_134)
+
+                # Pressure measurement, all channels converted to bar in one call
+                P_array[i, :] = session.read_pressures(channels_128)
                 
-                # Pressure alarm check    
-                if alarm_on:
-                    if value_P_bar > pressure_alarm:
-                        #call pressure_alarm function
-                        sound_alarm()
-                        #call system_shutdown function
-                        system_shutdown()
-                        
-                        print('Warning : Pressure above ', pressure_alarm,' bar')
-                   
-                    else:
-                        no_sound_alarm()
-                        no_system_shutdown()
-                        
-                    if terminal_output:
-                        print('{:12.2f} bar'.format(value_P_bar), end='')
-
-                stdout.flush()
-                # Delay between reads
-                sleep(delay_between_reads)
+                # Pressure alarm check over all channels, the pins are only written when the alarm state changes
+                if alarm is not None:
+                    alarm.evaluate(P_array[i])
+
+                # Rows i of the arrays are complete, the renderer only keeps a reference to them
+                if terminal is not None:
+                    terminal.update(T_array[i], P_array[i], samples_per_channel, scheduler.missed_slots)
                 
                 # Writes the row of data to the csv file, to modify here if we want more sensors
-                row = [i, P_array[i, 0], T_array[i, 0], P_array[i, 1], T_array[i, 1]]
-                writer.writerow(row)
+                row = [i, P_array[i, 0], T_array[i, 0], P_array[i, 1], T_array[i, 1], sample_time]
+                writer.write_row(row)
+                if binary_record is not None:
+                    binary_record.write_block(row)
+
+            if terminal is not None:
+                terminal.close()
+
+        if terminal_output:
+            scheduler.print_report()
+            writer.print_report()
 
     except (HatError, ValueError) as error:
         print('\n', error)
         GPIO.cleanup() #Needed in order to clear GPIO pin assignement
 
+    finally:
+        if terminal is not None:
+            terminal.close()
+        if binary_record is not None:
+            binary_record.close()
+        if own_poller:
+            session.stop_temperature_poller()
+
 
-def T_P_disp(lcd, T_hot_wall, channels_134=(0, 1), channels_128=(0, 1), delay_between_reads=0.1, alarm_on = True, pressure_alarm = 150, terminal_output = True, lcd_output = False):
+def T_P_disp(lcd, T_hot_wall, channels_134=(0, 1), channels_128=(0, 1), delay_between_reads=0.1, alarm_on = True, pressure_alarm = 150, terminal_output = True, lcd_output = False, session = None, engine = None, terminal_fps = 10):
     """
     TD : ADD FLAG TERMINAL OUTPUT IN THE CODE
     
@@ -483,130 +864,409 @@ def T_P_disp(lcd, T_hot_wall, channels_134=(0, 1), channels_128=(0, 1), delay_be
         T_hot_wall (float): Temperature of the hot wall of the channel
         channels_134 (tuple, optional): Sensors channels on MC134. Defaults to (0, 1).
         channels_128 (tuple, optional): Sensors channels on MC128. Defaults to (0, 1).
-        delay_between_reads (float, optional): Delay between sensor readings in seconds. Defaults to 0.1.
+        delay_between_reads (float, optional): Period of the sensor readings in seconds, paced on absolute deadlines. Defaults to 0.1.
         alarm_on (bool, optional):  Wheter to activate the safety alarm. Default to True
         pressure_alarm (float, optional): Pressure alarm threshold. Default to 130 bars
         terminal_output (bool, optional): Whether to display terminal output, ie here real time T and P values as well as acquisition parameters. Defaults to True.
         lcd_output (bool, optional): Whether to display lcd output, ie here real time T and P values as well as acquisition parameters. Defaults to True.
+        session (HatSession, optional): Open session on the boards. Defaults to None, a new session is then opened.
+        engine (AcquisitionThread, optional): Acquisition thread owning the boards (see acq_engine.py). If given, the
+            values displayed are the latest snapshot published by this thread, the boards are never read from here
+            and the pressure alarm is left to the acquisition thread. Defaults to None, the boards are then read directly.
+        terminal_fps (float, optional): Terminal refresh rate in Hz, the values are printed by a TerminalRenderer thread. Defaults to 10.
     """
     import datetime
 
-    try:
-        # Initialisation of MC128
-        address = select_hat_device(HatIDs.MCC_128)
-        hat_128 = mcc128(address)
-        input_mode = AnalogInputMode.SE
-        input_range = AnalogInputRange.BIP_5V
-        hat_128.a_in_mode_write(input_mode)
-        hat_128.a_in_range_write(input_range)
+    scheduler = None
+    terminal = None
+    own_poller = False
 
-        # Initialisation of MC134
-        address_134 = select_hat_device(HatIDs.MCC_134)
-        hat_134 = mcc134(address_134)
-        tc_type = TcTypes.TYPE_K
+    try:
+        # Boards are opened and configured once per session, not per call
+        if engine is not None:
+            session = engine.session
+        elif session is None:
+            session = HatSession(channels_134, channels_128)
+        # Pressure alarm, evaluated by the acquisition thread when there is one
+        alarm = session.get_alarm(pressure_alarm) if alarm_on and engine is None else None
+        # Temperatures polled at the MC134 update interval, unless the session already polls them
+        if engine is None:
+            own_poller = session.temperature_poller is None
+            session.start_temperature_poller()
         
         #Date initialisation for cvs header
         current_datetime = datetime.datetime.now()
         formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
-
-        # Writes the thermocouple type in MC134 memory
-        for channel in channels_134:
-            hat_134.tc_type_write(channel, tc_type)
         
-        # Display the header row for the data table.
-        for channel in channels_128:
-            print('     Channel Temperature', channel, end='')
-        for channel in channels_134:
-            print('     Channel Pressure', channel, end='')
-        print('')
+        # The terminal is refreshed by a separate thread at terminal_fps, whatever the reading rate
+        if terminal_output:
+            terminal = TerminalRenderer(channels_134, channels_128, fps=terminal_fps)
+            terminal.start()
 
+        # Readings are taken at t0 + k * delay_between_reads, whatever the time spent reading and displaying
+        scheduler = DeadlineScheduler(1 / delay_between_reads, history=10000)
 
         while True:
-            pressures = []
-            temperatures = []
-            no_sound_alarm()
-            no_system_shutdown()
+            scheduler.wait()
+
+            if engine is not None:
+                # Values published by the acquisition thread, the boards are not touched from this thread
+                snapshot = engine.latest
+                if snapshot is None:
+                    continue
+                temperatures = snapshot.T
+                pressures = snapshot.P
+            else:
+                # Temperature measurement, from the temperature poller cache if the session has one
+                temperatures = session.read_temperatures(channels_134)
+
+                # Pressure measurement, all channels converted to bar in one call
+                pressures = session.read_pressures(channels_128)
             
-            # Temperature measurement
-            for channel in channels_134:
-                value_T = hat_134.t_in_read(channel)
-
-                if terminal_output:
-                    if value_T == mcc134.OPEN_TC_VALUE:
-                        print('     Open     ', end='')
-                    elif value_T == mcc134.OVERRANGE_TC_VALUE:
-                        print('     OverRange', end='')
-                    elif value_T == mcc134.COMMON_MODE_TC_VALUE:
-                        print('   Common Mode', end='')
-                    else:
-                        print('{:12.2f} C'.format(value_T), end='')
-                    
-                temperatures.append(value_T)
-                    
-            # Pressure measurement
-            for channel in channels_128:
-                value_P_volt = hat_128.a_in_read(channel)
-                value_P_bar = volt_to_bar(value_P_volt)
-                
-                # Pressure alarm check 
-                if alarm_on:
-                    if value_P_bar > pressure_alarm:
-                        #call pressure_alarm function
-                        sound_alarm()
-                        #call system_shutdown function
-                        system_shutdown()
-                        print('Warning : Pressure above ', pressure_alarm,' bar')
-
-                if terminal_output:     
-                    #This is here in order to print continuously T and P values over the same line
-                    if channel == channels_128[-1]:
-                        print('{:12.2f} bar'.format(value_P_bar), end='\r')
-                    else:
-                        print('{:12.2f} bar'.format(value_P_bar), end='')
-                
-                pressures.append(value_P_bar)
+            # Pressure alarm check over all channels, the pins are only written when the alarm state changes
+            if alarm is not None:
+                alarm.evaluate(pressures)
+
+            if terminal is not None:
+                terminal.update(temperatures, pressures, scheduler.samples, scheduler.missed_slots)
                 
             # To modify here if we want more sensors, but we need to modify also LCD_print_in_monitoring() and change LCD display
             LCD_print_in_monitoring(lcd, T_hot_wall, temperatures[0], temperatures[1], pressures[0], pressures[1])
-            stdout.flush()
-            sleep(delay_between_reads)
 
     except (HatError, ValueError) as error:
         print('\n', error)
         GPIO.cleanup() #Needed in order to clear GPIO pin assignement
 
-################################################
-
-
-    
-
-
-
-
-
-
-
-
+    finally:
+        # Also reached on Ctrl-C, the KeyboardInterrupt is then handled by the calling script
+        if terminal is not None:
+            terminal.close()
+        if terminal_output and scheduler is not None:
+            scheduler.print_report()
+        if own_poller:
+            session.stop_temperature_poller()
 
+################################################
 
+def T_P_acq_scan(channels_128, scan_rate, N_measures, terminal_output=True, data_filename="data_scan.csv",
+                 binary_filename=None, alarm_on = True, pressure_alarm = 130, session = None, fsync = FSYNC_CLOSE,
+                 binary_dtype = 'float64', terminal_fps = 10):
+    """
+    Acquires Pressure data with a hardware-clocked scan of the MCC 128 (a_in_scan_start / a_in_scan_read)
+    instead of software-timed a_in_read() calls, and writes it to a CSV file and optionally to a binary file.
+    The sample clock is generated by the board, so kHz acquisition rates are reachable and the time axis
+    is exact. The requested and actual scan rate (a_in_scan_actual_rate) are both written in the file header.
+    No temperature is acquired in this mode, the MCC 134 is far too slow to follow a scan.
 
+    The binary file is a binary recording (see acq_binary.py, read it with open_recording()), with the
+    same columns as the CSV file and the acquisition parameters, including both scan rates, as metadata.
 
+    Args:
+        channels_128 (tuple): Sensors channels on MC128.
+        scan_rate (float): Requested scan rate in Hz, per channel.
+        N_measures (int): Number of measures per channel.
+        terminal_output (bool, optional): Whether to display terminal output, ie here the last P values of each block and acquisition parameters. Defaults to True.
+        data_filename (str, optional): Name of the data CSV file, None to skip the CSV file. Defaults to "data_scan.csv".
+        binary_filename (str, optional): Name of the binary recording file, None to skip the binary file. Defaults to None.
+        binary_dtype (str, optional): Data type of the binary recording, 'float32' or 'float64'. Defaults to 'float64'.
+        alarm_on (bool, optional):  Wheter to activate the safety alarm. Default to True
+        pressure_alarm (float, optional): Pressure alarm threshold in bars. Default to 130 bars
+        session (HatSession, optional): Open session on the boards. Defaults to None, a new session is then opened.
+        fsync (str, optional): fsync policy of the CSV writer, FSYNC_NEVER, FSYNC_FLUSH or FSYNC_CLOSE from acq_writer. Defaults to FSYNC_CLOSE.
+        terminal_fps (float, optional): Terminal refresh rate in Hz, the values are printed by a TerminalRenderer thread. Defaults to 10.
 
+    Returns:
+        float: The actual scan rate in Hz.
+    """
+    import datetime
 
+    hat_128 = None
+    csv_writer = None
+    binary_record = None
+    terminal = None
 
+    try:
+        # Boards are opened and configured once per session, not per acquisition
+        if session is None:
+            session = HatSession(channels_128=channels_128)
+        if session.watchdog is not None:
+            raise ValueError('Error: The MC128 is scanned by the safety watchdog, stop it before a scan acquisition')
+        hat_128 = session.hat_128
+        input_mode = session.input_mode
+        input_range = session.input_range
+
+        channel_mask = chan_list_to_mask(channels_128)
+        num_channels = len(channels_128)
+        actual_scan_rate = hat_128.a_in_scan_actual_rate(num_channels, scan_rate)
+
+        #Date initialisation for file header
+        current_datetime = datetime.datetime.now()
+        formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
 
+        acquisition_params = ["Date and time", formatted_datetime, "Number of measures: ", N_measures,
+                              "Requested scan rate: ", scan_rate, "Hz", "Actual scan rate: ", actual_scan_rate, "Hz"]
+        column_headers = ["N_measure", "Time"] + ["Pressure {}".format(i + 1) for i in range(num_channels)]
+
+        #csv and binary files initialisation, both start with the same header rows. Each file is written by a background thread
+        if data_filename is not None:
+            csv_writer = CSVWriterThread(data_filename, [acquisition_params, column_headers], fsync=fsync)
+            csv_writer.start()
+        if binary_filename is not None:
+            binary_record = BinaryWriterThread(binary_filename, column_headers, dtype=binary_dtype,
+                                               metadata={'date_and_time': formatted_datetime, 'number_of_measures': N_measures,
+                                                         'requested_scan_rate': scan_rate, 'actual_scan_rate': actual_scan_rate,
+                                                         'input_mode': input_mode_to_string(input_mode),
+                                                         'input_range': input_range_to_string(input_range)})
+            binary_record.start()
+
+        if terminal_output:
+            print('\nAcquiring data in scan mode ... Press Ctrl-C to abort')
+            print('\nNumber of measures:', N_measures)
+            print('Requested scan rate:', scan_rate, 'Hz', 'Actual scan rate:', actual_scan_rate, 'Hz')
+            print('Input mode:', input_mode_to_string(input_mode), 'Input range:', input_range_to_string(input_range))
+            print('\nDate and time:', formatted_datetime)
+            terminal = TerminalRenderer((), channels_128, fps=terminal_fps, writer=csv_writer)
+            terminal.start()
+
+        # Finite scan, the board buffer is sized for the whole acquisition
+        hat_128.a_in_scan_start(channel_mask, N_measures, scan_rate, OptionFlags.DEFAULT)
+
+        samples_per_channel = 0
+        backoff = PollBackoff(min_interval=0.001, max_interval=0.01) # Waits between empty reads, bounded by 10 ms
+        alarm = session.get_alarm(pressure_alarm) if alarm_on else None
+
+        while samples_per_channel < N_measures:
+            read_result = hat_128.a_in_scan_read(READ_ALL_AVAILABLE, scan_read_timeout)
+
+            # Check for an overrun error
+            if read_result.hardware_overrun:
+                print('\n\nHardware overrun\n')
+                break
+            elif read_result.buffer_overrun:
+                print('\n\nBuffer overrun\n')
+                break
+
+            samples_read = len(read_result.data) // num_channels
+            if samples_read == 0:
+                if not read_result.running:
+                    break
+                backoff.sleep()
+                continue
+            backoff.reset()
+
+            # One row per scan: sample index, time from the first sample, then pressures in bar
+            block = np.empty((samples_read, num_channels + 2))
+            block[:, 0] = np.arange(samples_per_channel, samples_per_channel + samples_read)
+            block[:, 1] = block[:, 0] / actual_scan_rate
+            block[:, 2:] = session.calibration.convert(np.asarray(read_result.data).reshape(samples_read, num_channels), channels_128)
+            samples_per_channel += samples_read
+
+            # Pressure alarm check over the whole block, sample by sample for the debounce and hysteresis
+            if alarm is not None:
+                alarm.evaluate(block[:, 2:])
+
+            if csv_writer is not None:
+                csv_writer.write_rows(block.tolist())
+            if binary_record is not None:
+                binary_record.write_block(block)
+
+            # The block is not modified afterwards, the renderer only keeps a reference to its last row
+            if terminal is not None:
+                terminal.update((), block[-1, 2:], samples_per_channel)
+
+        if terminal is not None:
+            terminal.close()
+
+        if csv_writer is not None:
+            csv_writer.close()
+            if terminal_output:
+                csv_writer.print_report()
 
+        return actual_scan_rate
 
+    except (HatError, ValueError) as error:
+        print('\n', error)
+        GPIO.cleanup() #Needed in order to clear GPIO pin assignement
 
+    finally:
+        if terminal is not None:
+            terminal.close()
+        if hat_128 is not None:
+            hat_128.a_in_scan_stop()
+            hat_128.a_in_scan_cleanup()
+        if csv_writer is not None:
+            csv_writer.close()
+        if binary_record is not None:
+            binary_record.close()
 
 
+################################################
 
+def T_P_acq_frames(channels_128, scan_rate, samples_per_frame, N_frames=None, trigger_mode=TriggerModes.RISING_EDGE,
+                   terminal_output=True, data_filename="data_frames.csv", binary_filename=None, alarm_on = True,
+                   pressure_alarm = 130, session = None, fsync = FSYNC_CLOSE, binary_dtype = 'float64', terminal_fps = 10):
+    """
+    Acquires one hardware-timed block of Pressure data per trigger pulse received on the TRIG input of the
+    MCC 128, ie. one block per camera frame when the synchronisation box is wired to TRIG, and streams the
+    blocks to a CSV file and optionally to a binary file.
 
+    Each frame is a finite scan of samples_per_frame samples per channel started with OptionFlags.EXTTRIGGER:
+    the board waits for the trigger edge and clocks the samples itself, so the first sample of every block
+    is taken within one sample period of the edge, whatever the Linux scheduling latency. Once the block is
+    read, the scan is stopped and armed again for the next frame. Triggers received while a block is acquired
+    or while the board is armed again (a few ms) are missed, so samples_per_frame / scan_rate must stay
+    shorter than the frame period minus this re-arm time. Only complete blocks are written.
 
+    The rows of the files are: frame index, sample index in the frame, time from the trigger edge in s
+    (sample index / actual scan rate), then the pressures in bar.
 
+    Args:
+        channels_128 (tuple): Sensors channels on MC128.
+        scan_rate (float): Requested scan rate in Hz, per channel.
+        samples_per_frame (int): Number of measures per channel acquired after each trigger.
+        N_frames (int, optional): Number of frames to acquire. Defaults to None, frames are then acquired until Ctrl-C.
+        trigger_mode (TriggerModes, optional): Trigger condition of the TRIG input. Defaults to TriggerModes.RISING_EDGE.
+        terminal_output (bool, optional): Whether to display terminal output, ie here the frame count, last P values of each frame and acquisition parameters. Defaults to True.
+        data_filename (str, optional): Name of the data CSV file, None to skip the CSV file. Defaults to "data_frames.csv".
+        binary_filename (str, optional): Name of the binary recording file, None to skip the binary file. Defaults to None.
+        alarm_on (bool, optional):  Wheter to activate the safety alarm. Default to True
+        pressure_alarm (float, optional): Pressure alarm threshold in bars. Default to 130 bars
+        session (HatSession, optional): Open session on the boards. Defaults to None, a new session is then opened.
+        fsync (str, optional): fsync policy of the CSV writer, FSYNC_NEVER, FSYNC_FLUSH or FSYNC_CLOSE from acq_writer. Defaults to FSYNC_CLOSE.
+        binary_dtype (str, optional): Data type of the binary recording, 'float32' or 'float64'. Defaults to 'float64'.
+        terminal_fps (float, optional): Terminal refresh rate in Hz, the values are printed by a TerminalRenderer thread. Defaults to 10.
 
+    Returns:
+        int: The number of complete frames acquired.
+    """
+    import datetime
 
+    hat_128 = None
+    csv_writer = None
+    binary_record = None
+    terminal = None
+    frame = 0
 
+    try:
+        # Boards are opened and configured once per session, not per frame
+        if session is None:
+            session = HatSession(channels_128=channels_128)
+        if session.watchdog is not None:
+            raise ValueError('Error: The MC128 is scanned by the safety watchdog, stop it before a scan acquisition')
+        hat_128 = session.hat_128
+        input_mode = session.input_mode
+        input_range = session.input_range
+
+        channel_mask = chan_list_to_mask(channels_128)
+        num_channels = len(channels_128)
+        actual_scan_rate = hat_128.a_in_scan_actual_rate(num_channels, scan_rate)
+
+        #Date initialisation for file header
+        current_datetime = datetime.datetime.now()
+        formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
 
+        acquisition_params = ["Date and time", formatted_datetime, "Samples per frame: ", samples_per_frame,
+                              "Requested scan rate: ", scan_rate, "Hz", "Actual scan rate: ", actual_scan_rate, "Hz",
+                              "Trigger mode: ", trigger_mode.name]
+        column_headers = ["Frame", "N_measure", "Time"] + ["Pressure {}".format(i + 1) for i in range(num_channels)]
+
+        #csv and binary files initialisation, both start with the same header rows. Each file is written by a background thread
+        if data_filename is not None:
+            csv_writer = CSVWriterThread(data_filename, [acquisition_params, column_headers], fsync=fsync)
+            csv_writer.start()
+        if binary_filename is not None:
+            binary_record = BinaryWriterThread(binary_filename, column_headers, dtype=binary_dtype,
+                                               metadata={'date_and_time': formatted_datetime, 'samples_per_frame': samples_per_frame,
+                                                         'requested_scan_rate': scan_rate, 'actual_scan_rate': actual_scan_rate,
+                                                         'trigger_mode': trigger_mode.name,
+                                                         'input_mode': input_mode_to_string(input_mode),
+                                                         'input_range': input_range_to_string(input_range)})
+            binary_record.start()
+
+        if terminal_output:
+            print('\nAcquiring data frames on the MCC 128 TRIG input ... Press Ctrl-C to stop')
+            print('\nSamples per frame:', samples_per_frame, 'Trigger mode:', trigger_mode.name)
+            print('Requested scan rate:', scan_rate, 'Hz', 'Actual scan rate:', actual_scan_rate, 'Hz')
+            print('Input mode:', input_mode_to_string(input_mode), 'Input range:', input_range_to_string(input_range))
+            print('\nDate and time:', formatted_datetime)
+            terminal = TerminalRenderer((), channels_128, fps=terminal_fps, writer=csv_writer, count_label='Frames')
+            terminal.start()
+
+        # Frame block, allocated once: sample index and time from the trigger are the same for every frame
+        block = np.empty((samples_per_frame, num_channels + 3))
+        block[:, 1] = np.arange(samples_per_frame)
+        block[:, 2] = block[:, 1] / actual_scan_rate
+        volts = np.empty((samples_per_frame, num_channels))
+
+        hat_128.trigger_mode(trigger_mode)
+        alarm = session.get_alarm(pressure_alarm) if alarm_on else None
+
+        while N_frames is None or frame < N_frames:
+            # Arm the board, the scan starts by itself on the next trigger edge
+            hat_128.a_in_scan_start(channel_mask, samples_per_frame, scan_rate, OptionFlags.EXTTRIGGER)
+
+            samples_read = 0
+            overrun = False
+            while samples_read < samples_per_frame:
+                # Blocks in the driver until the samples are there, no data before the trigger
+                read_result = hat_128.a_in_scan_read(samples_per_frame - samples_read, scan_read_timeout)
+
+                # Check for an overrun error
+                if read_result.hardware_overrun:
+                    print('\n\nHardware overrun\n')
+                    overrun = True
+                    break
+                elif read_result.buffer_overrun:
+                    print('\n\nBuffer overrun\n')
+                    overrun = True
+                    break
+
+                new_samples = len(read_result.data) // num_channels
+                volts[samples_read:samples_read + new_samples] = np.asarray(read_result.data).reshape(new_samples, num_channels)
+                samples_read += new_samples
+                if new_samples == 0 and not read_result.running:
+                    break
+
+            # Re-arm for the next frame
+            hat_128.a_in_scan_stop()
+            hat_128.a_in_scan_cleanup()
+
+            if overrun or samples_read < samples_per_frame:
+                break
+
+            block[:, 0] = frame
+            block[:, 3:] = session.calibration.convert(volts, channels_128)
+            frame += 1
+
+            # Pressure alarm check over the whole frame, sample by sample for the debounce and hysteresis
+            if alarm is not None:
+                alarm.evaluate(block[:, 3:])
+
+            # The block is reused for the next frame: both writers queue a copy
+            if csv_writer is not None:
+                csv_writer.write_rows(block.tolist())
+            if binary_record is not None:
+                binary_record.write_block(block)
+
+            # The block is reused by the next frame, the renderer gets a copy of the last row
+            if terminal is not None:
+                terminal.update((), tuple(block[-1, 3:]), frame)
+
+        return frame
 
+    except (HatError, ValueError) as error:
+        print('\n', error)
+        GPIO.cleanup() #Needed in order to clear GPIO pin assignement
 
+    finally:
+        if terminal is not None:
+            terminal.close()
+        if hat_128 is not None:
+            hat_128.a_in_scan_stop()
+            hat_128.a_in_scan_cleanup()
+        if csv_writer is not None:
+            csv_writer.close()
+            if terminal_output:
+                csv_writer.print_report()
+        if binary_record is not None:
+            binary_record.close()
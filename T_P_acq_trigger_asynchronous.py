@@ -6,8 +6,11 @@ not a trigger signal at each frame
 """
 
 
+import threading
 import RPi.GPIO as GPIO
-from T_P_acq_func import T_P_acq_csv, T_P_disp
+from T_P_acq_func import T_P_acq_csv, HatSession
+from acq_engine import AcquisitionThread
+from acq_monitor import run_monitor
 from RPLCD import CharLCD, cleared, cursor
 
 """
@@ -16,11 +19,15 @@ Purpose:
 
     Description:
         This script displays real time T and P data with the function
-        T_P_disp() (see doc in source file T_P_acq_func). When a trigger
+        run_monitor() (see doc in source file acq_monitor). When a trigger
         input is detected, a csv file containing a recording of T and P
         values is saved. You can change acquisition parameters by modifying 
         T_P_acq_csv() arguments
 
+        The boards are only read by an AcquisitionThread (see acq_engine.py):
+        the trigger callback hands the recording over to it and returns at
+        once, and the display shows the latest values it published.
+
 """
 ################################################
 
@@ -28,6 +35,10 @@ Purpose:
 Hardware initialisation
 """
 
+### MCC HATS INITIALISATION
+# Both boards are opened and configured once here, so the trigger callback starts sampling without any setup
+session = HatSession(channels_134=(0, 1), channels_128=(0, 1))
+
 # Set the GPIO mode to BCM
 GPIO.setmode(GPIO.BCM)
 
@@ -57,19 +68,41 @@ Data stucture initialisation
 T_hot_wall = 50 # Hot wall temperature in Celcius, to specify, in Celcius, to measure later directly on the Peltier module
 pressure_alarm = 130 #Pressure alarm threshold in bar for alarm and system shutdown
 
+# Single owner of the boards, monitoring samples for the display and recordings when triggered
+engine = AcquisitionThread(session, channels_T=(0, 1), channels_P=(0, 1), monitor_period=0.1, pressure_alarm=pressure_alarm)
+recording = threading.Event() # Set while a recording is queued or running, further triggers are then ignored
+
 ################################################
 
 
+def record(session):
+    """
+    Recording job, run by the acquisition thread.
+
+    Args:
+        session (HatSession): Session on the boards, owned by the acquisition thread.
+    """
+    try:
+        print("Acquiring temperature and pressure data in csv...")
+        T_P_acq_csv(channels_134=(0, 1), channels_128=(0, 1), acq_frequency=10, N_measures=50, terminal_output=True, data_filename="data.csv", alarm_on = True, pressure_alarm = 130, session = session, binary_filename="data.bin")
+        print("Data saved in csv!")
+    finally:
+        recording.clear()
+
+
 def data_array_update(channel):
     """
-    Callback function to be executed when the trigger input is detected.
+    Callback function to be executed when the trigger input is detected. Queues the recording for the
+    acquisition thread and returns immediately.
 
     Args:
         channel (int): The GPIO channel number that triggered the callback.
     """
-    print("Acquiring temperature and pressure data in csv...")
-    T_P_acq_csv(channels_134=(0, 1), channels_128=(0, 1), acq_frequency=10, N_measures=50, terminal_output=True, data_filename="data.csv", alarm_on = True, pressure_alarm = 130)
-    print("Data saved in csv!")
+    if not recording.is_set():
+        recording.set()
+        engine.submit(record)
+
+engine.start()
 
 # Add the event detection for the rising edge of the trigger input
 GPIO.add_event_detect(trigger_pin, GPIO.RISING, callback=data_array_update)
@@ -77,9 +110,10 @@ GPIO.add_event_detect(trigger_pin, GPIO.RISING, callback=data_array_update)
 
 try:
     print("Waiting for trigger input...")
-    while True:
-        T_P_disp(lcd, T_hot_wall, channels_134=(0, 1), channels_128=(0, 1), delay_between_reads=1, alarm_on = True, pressure_alarm = 130)
+    run_monitor(engine = engine, channels_T = (0, 1), channels_P = (0, 1), lcd = lcd, T_hot_wall = T_hot_wall, terminal_rate = 1, lcd_rate = 1)
 
 except KeyboardInterrupt:
     print("Exiting...")
+    GPIO.remove_event_detect(trigger_pin)
+    engine.stop()
     GPIO.cleanup()
@@ -0,0 +1,33 @@
+import RPi.GPIO as GPIO
+from daqhats import TriggerModes
+from T_P_acq_func import T_P_acq_frames, HatSession
+
+"""
+Purpose:
+    Record a hardware-timed block of P data for every frame of the synchronisation box
+
+    Description:
+        The synchronisation signal must be wired to the TRIG input of the
+        MCC 128 (not to a GPIO pin). For each trigger pulse, the board
+        acquires samples_per_frame samples per channel at scan_rate, timed by
+        its own clock from the trigger edge, then T_P_acq_frames() arms it
+        again for the next frame (see doc in source file T_P_acq_func).
+        Blocks are streamed to the csv and binary files with their frame
+        index until Ctrl-C. You can change acquisition parameters by
+        modifying T_P_acq_frames() arguments
+
+"""
+
+# Both boards are opened and configured once here
+session = HatSession(channels_134=(0, 1), channels_128=(0, 1))
+
+try:
+    print("Waiting for trigger input on the MCC 128 TRIG terminal...")
+    T_P_acq_frames(channels_128=(0, 1), scan_rate=10000, samples_per_frame=100, N_frames=None, trigger_mode=TriggerModes.RISING_EDGE, terminal_output=True, data_filename="data_frames.csv", binary_filename="data_frames.bin", alarm_on=True, pressure_alarm=130, session=session)
+
+except KeyboardInterrupt:
+    pass
+
+finally:
+    print("Exiting...")
+    GPIO.cleanup()
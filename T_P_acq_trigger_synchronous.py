@@ -6,7 +6,7 @@ from __future__ import print_function #Must be at the beginning of the file for
 
 Description:
 
-This script performs data acquisition and logging of temperature and pressure measurements triggered by an external input signal. It initializes the hardware components, sets up the GPIO pins, and defines the data structures and constants used in the script. The main logic of the script includes a callback function that is executed when the trigger input is detected, updating the data array with a new line for each trigger event. The script continuously displays temperature and pressure data on an LCD screen while waiting for trigger events. If a keyboard interrupt signal is received, the data array is saved as a CSV file, and the script terminates by cleaning up the GPIO pins.
+This script performs data acquisition and logging of temperature and pressure measurements triggered by an external input signal. It initializes the hardware components, sets up the GPIO pins, and defines the data structures and constants used in the script. The main logic of the script includes a callback function that is executed when the trigger input is detected: it only timestamps the trigger and hands it over to the acquisition thread, which owns the boards, reads the sample and streams a new line to the CSV log for each trigger event. The script continuously displays temperature and pressure data on an LCD screen while waiting for trigger events. When the script stops, whatever the reason (Ctrl-C, kill, exception), the log is closed and the script terminates by cleaning up the GPIO pins. After a power cut, the log left open is recovered at the next start.
 
 Note: The code contains placeholders for implementing threading and a timeout delay for data acquisition, which can be implemented later.
 
@@ -14,31 +14,43 @@ Imported Libraries:
 - RPi.GPIO: Library for controlling GPIO pins on Raspberry Pi.
 - time: Library for time-related functions.
 - csv: Library for CSV file handling.
+- signal: Library to turn a kill (SIGTERM) into a clean exit.
 - sys: Library for system-specific parameters and functions.
 - numpy: Library for array manipulation.
+- acq_buffer: Custom library for preallocated NumPy sample storage.
+- acq_binary: Custom library for the binary recording format.
 - RPLCD: Library for controlling LCD displays.
 - T_P_acq_func: Custom library for temperature and pressure acquisition functions.
 - daqhats: Library for interacting with MCC DAQ HATs.
 - daqhats_utils: Library for utility functions related to MCC DAQ HATs.
+- acq_writer: Custom library for background and crash-safe CSV writing.
+- acq_engine: Custom library for the acquisition thread owning the MCC HATs.
+- acq_monitor: Custom library for the asyncio terminal and LCD monitor.
+- safety_watchdog: Custom library for the overpressure watchdog process.
 
 Hardware Initialization:
-- MCC HATS: Initialization of MCC 128 and MCC 134 DAQ HATs, setting input modes and ranges.
+- MCC HATS: Opening of a HatSession on the MCC 128 and MCC 134 DAQ HATs, setting input modes, ranges and thermocouple types once for the whole script. The session is only used by the acquisition thread.
+- Safety watchdog: Separate process scanning the MCC 128 pressure channels and driving the alarm and system shutdown pins, whatever the rest of the script is doing. The session reads its pressures from the watchdog.
+- Temperature poller: Thread reading the MCC 134 at its update interval, a triggered sample takes the last temperatures polled instead of waiting for the thermocouple conversions. Started after the watchdog process. The readings are published in shared memory, with T_hot_wall, for the live dashboard (T_P_dashboard.py).
 - GPIO Pins: Setting up the GPIO pins on Raspberry Pi for trigger input.
 - LCD Setup: Initializing the LCD object with pin configurations.
 
 Data Structure Initialization:
-- data_array: Initializing an empty array to store temperature and pressure measurements.
-- header: A list containing column names for the data array.
-- filename: Name of the CSV file to save the data.
+- data_log: Crash-safe streaming CSV log storing temperature and pressure measurements, flushed to disk every second.
+- data_binary: Binary recording with the same rows as the data log, for fast loading of long experiments.
+- data_store: Preallocated circular NumPy block keeping the last triggered rows in memory, filled in place without per-trigger allocation.
+- header: A list containing column names for the data log.
+- filename: Name of the CSV log.
 - T_hot_wall: Hot wall temperature in Celsius.
 - pressure_alarm: Threshold value for pressure alarm and system shutdown.
 - rising_edge_counter: Counter for the number of trigger events.
 
 Main Script Logic:
-- data_array_update: Callback function executed when the trigger input is detected. It updates the data array with a new line containing the index, relative time, and current temperature and pressure measurements.
+- triggered_sample: Trigger handler run by the acquisition thread. It streams a new line containing the index, relative time (from the edge timestamps), current temperature and pressure measurements, and the perf_counter_ns stamps of the trigger callback entry and of the end of the read (relative to the first trigger), to the data log.
+- data_array_update: Callback function executed when the trigger input is detected. It only queues the trigger for the acquisition thread and returns immediately.
 - GPIO event detection: Adding event detection for the rising edge of the trigger input, calling the data_array_update function.
-- Main loop: Continuously displays temperature and pressure data on the LCD screen while waiting for trigger events.
-- KeyboardInterrupt handling: If a keyboard interrupt signal is received, the data array is saved as a CSV file, and the script exits after cleaning up the GPIO pins.
+- Main loop: Continuously displays the latest temperature and pressure data published by the acquisition thread on the terminal and the LCD screen, each at its own refresh rate, while waiting for trigger events.
+- Exit handling: On Ctrl-C, kill or any exception, the acquisition thread is stopped, the data log is closed, the trigger to sample latency report (p50/p95/p99/max and histogram) and the watchdog report are printed, and the script exits after stopping the watchdog and cleaning up the GPIO pins.
 """
 
 
@@ -52,6 +64,9 @@ Imports
 import RPi.GPIO as GPIO
 import time
 import csv
+import os
+import signal
+import sys
 from sys import stdout
 import numpy as np
 from RPLCD import CharLCD, cleared, cursor
@@ -59,9 +74,15 @@ from RPLCD import CharLCD, cleared, cursor
 
 #DAQ HATS Specific library
 from T_P_acq_func import *
-from daqhats import mcc128, OptionFlags, mcc134, HatIDs, HatError, TcTypes, AnalogInputMode, AnalogInputRange
-from daqhats_utils import select_hat_device, tc_type_to_string, \
+from daqhats import OptionFlags, HatError, TcTypes, AnalogInputMode, AnalogInputRange
+from daqhats_utils import tc_type_to_string, \
 enum_mask_to_string, input_mode_to_string, input_range_to_string 
+from acq_writer import StreamingCSVLog
+from acq_buffer import SampleStore
+from acq_binary import BinaryWriterThread
+from acq_engine import AcquisitionThread
+from acq_monitor import run_monitor
+from safety_watchdog import SafetyWatchdog
 
 #daqhats_utils needs to be in the same folders as this script
 
@@ -72,26 +93,32 @@ Hardware initialisation
 """
 
 ### MCC HATS INITIALISATION
-# Initialisation of MC128
 channels_128=(0, 1) #Hardware channel on which the sensors are connected to the MC 128 board. Check MCC Documentation for references
-address = select_hat_device(HatIDs.MCC_128) #Initialisation of HAT adress
-hat_128 = mcc128(address) #Creation of board object of class mcc128
+channels_134=(0, 1) #Hardware channel on which the sensors are connected to the MC 134 board. Check MCC Documentation for references
 input_mode = AnalogInputMode.SE #Selection of input mode between Single ended and Differential mode for Analog read of the sensor input. Check MCC Documentation for references
 input_range = AnalogInputRange.BIP_5V # Selection of analog input voltage range. For current pressure sensor (RS: 797-4986), range is 0-5V
-hat_128.a_in_mode_write(input_mode) #Write the input mode to the HAT board
-hat_128.a_in_range_write(input_range) #Write the input range to the HAT board
+tc_type = TcTypes.TYPE_K #Selection of thermocouple type for MCC 134. Current sensor (RS: 847-9665) are type K
 
-channels_T = channels_128 #MCC 128 channels are used for pressure measurment
+# Both boards are opened and configured once here, the session is then used by the acquisition thread only
+session = HatSession(channels_134, channels_128, input_mode, input_range, tc_type)
+T_hot_wall = 50 # Hot wall temperature in Celcius, to specify, in Celcius, to measure later directly on the Peltier module
 
-# Initialisation of MC134
-channels_134=(0, 1) #Hardware channel on which the sensors are connected to the MC 134 board. Check MCC Documentation for references
-address_134 = select_hat_device(HatIDs.MCC_134) #Initialisation of HAT adress
-hat_134 = mcc134(address_134) #Creation of board object of class mcc134
-tc_type = TcTypes.TYPE_K #Selection of thermocouple type for MCC 134. Current sensor (RS: 847-9665) are type K
-for chan in channels_134: # Write the Thermocouple type to the channels of MC 134
-    hat_134.tc_type_write(chan, tc_type)
-    
-channels_P = channels_134 #MCC 134 channels are used for temperature measurment
+channels_T = channels_134 #MCC 134 channels are used for temperature measurment
+channels_P = channels_128 #MCC 128 channels are used for pressure measurment
+
+### SAFETY WATCHDOG
+pressure_alarm = 130 #Pressure alarm threshold in bar for alarm and system shutdown
+watchdog_scan_rate = 1000 # Hz, scan rate of the pressure channels in the watchdog process
+
+# Independent process owning the MCC 128 scan and the alarm and shutdown pins, the session reads its pressures from it
+watchdog = SafetyWatchdog(session, pressure_alarm=pressure_alarm, scan_rate=watchdog_scan_rate)
+watchdog.start()
+session.attach_watchdog(watchdog)
+
+# The MCC 134 is polled at its update interval (once per second) by its own thread, triggered samples read its cache.
+# Started after the watchdog, so the watchdog process is not forked while this thread uses the MCC 134 library.
+# The readings and T_hot_wall are published in shared memory for the live dashboard (T_P_dashboard.py)
+session.start_temperature_poller(publish=True, T_hot_wall=T_hot_wall)
 
 ### GPIO pins set up
 # Set the GPIO mode to BCM indexing (vs Physical indexing). Check Raspberry Pi pinout for references
@@ -120,17 +147,31 @@ lcd = CharLCD(pin_rs=19, pin_e=6, pins_data=[23, 24, 22, 27],
 Data stucture initialisation
 """
 
-### Initialisation of data_array
-header = ['Index', 'Time', 'T1', 'T2', 'P1', 'P2'] # To modify as desired
+### Initialisation of the data log
+# Trigger_ns: time.perf_counter_ns() at the entry of the trigger callback, Sample_ns: same clock when T and P are read.
+# Both are stored relative to the first trigger, like Time, so they stay exact in float64 for 104 days (2**53 ns) of run
+header = ['Index', 'Time', 'T1', 'T2', 'P1', 'P2', 'Trigger_ns', 'Sample_ns'] # To modify as desired, keep the last two columns
 filename = 'data_single_read_trigger.csv'
-data_array = []
-
-### Definition of script constants
-T_hot_wall = 50 # Hot wall temperature in Celcius, to specify, in Celcius, to measure later directly on the Peltier module
-pressure_alarm = 130 #Pressure alarm threshold in bar for alarm and system shutdown
+binary_filename = 'data_single_read_trigger.bin' # Same rows in binary recording format, read it with acq_binary.open_recording()
+# Rows are streamed to disk as they come and fsynced every second, only the last rows are kept in memory (data_store).
+# If the previous run was killed or lost power, its log is recovered (renamed) first instead of being overwritten
+data_log = StreamingCSVLog(filename, header_rows=[header], flush_interval=1.0, queue_size=10000)
+# Last triggered rows kept in memory in a preallocated circular block, filled in place at each trigger.
+# Its capacity must stay larger than the log queue size: a row handed to the log is then written long before its slot is reused
+data_store = SampleStore(header, capacity=100000, circular=True)
+# Binary copy of the log, row count committed every second. After a crash, open it with open_recording(binary_filename, recover=True)
+if data_log.recovered_filename is not None and os.path.exists(binary_filename):
+    # Keep the binary file of the interrupted run next to its recovered log
+    os.rename(binary_filename, os.path.splitext(data_log.recovered_filename)[0] + '.bin')
+# Written by its own thread like the log, the acquisition thread only queues a copy of each row
+data_binary = BinaryWriterThread(binary_filename, header, dtype='float64', commit_interval=1.0, queue_size=10000,
+                                 metadata={'trigger_pin': trigger_pin, 'pressure_alarm': pressure_alarm})
+data_binary.start()
 
 #Initialisation of rising_edge_counter, ie. number of trigger signal received, indicate the index of the current measure
 rising_edge_counter = 0
+sample_counter = 0 # Number of triggered samples already read by the acquisition thread
+first_trigger_ns = None # time.perf_counter_ns() of the first rising edge, origin of the relative time
 
 
 ################################################
@@ -139,56 +180,96 @@ rising_edge_counter = 0
 Main script logic
 """
 
+#Function executed by the acquisition thread for each trigger event
+def triggered_sample(session, index, trigger_ns):
+    """
+    Trigger handler of the acquisition thread. Reads the boards and streams a new line to the data log each time it is called.
+
+    Args:
+        session (HatSession): Session on the boards, owned by the acquisition thread.
+        index (int): Index of the trigger event, given by the GPIO callback.
+        trigger_ns (int): time.perf_counter_ns() value taken by the GPIO callback at the rising edge.
+
+    Returns:
+        numpy.ndarray: Temperature and pressure values of the row, published as the latest snapshot.
+    """
+    global first_trigger_ns
+    global sample_counter
+
+    #Timer start at first measure, ie first rising edge
+    if first_trigger_ns is None:
+        first_trigger_ns = trigger_ns
+
+    # Retrieve the current temperature and pressure measurement values, written in place in the next row of the store
+    new_row = data_store.next_row()
+    new_row[0] = index
+    new_row[1] = (trigger_ns - first_trigger_ns) * 1e-9 # Time of the edge, not of the read, so queueing delay does not shift the time base
+    get_current_T_P(session, pressure_alarm, channels_T, channels_P, out=new_row[2:-2])
+    sample_ns = time.perf_counter_ns()
+    # Relative to the first edge: absolute perf_counter_ns values lose precision in float64 after 104 days of uptime
+    new_row[-2] = trigger_ns - first_trigger_ns
+    new_row[-1] = sample_ns - first_trigger_ns
+    data_store.commit()
+    engine.latency.record(trigger_ns, sample_ns)
+
+    # Queue the row for the writer thread, the acquisition thread never waits on the disk
+    data_log.write_row(new_row)
+    data_binary.write_block(new_row)
+
+    sample_counter += 1
+    return new_row[2:-2]
+
+# Single owner of the boards: monitoring samples for the display and triggered samples for the log
+engine = AcquisitionThread(session, channels_T, channels_P, monitor_period=0.1, pressure_alarm=pressure_alarm,
+                           on_trigger=triggered_sample)
+
 #Function executed at each trigger event
 def data_array_update(trigger_pin):
     """
-    Callback function to be executed when the trigger input is detected. Updates the data array with a new line each time it is called. 
-    
+    Callback function to be executed when the trigger input is detected. Hands the trigger over to the acquisition
+    thread and returns immediately, the boards are read by triggered_sample().
 
     Args:
         channel (int): The GPIO channel number that triggered the callback.
         
     """
     
-    #I need to set this variables as global because I want to update data_array and rising_edge_counter through this trigger_callback function
-    global data_array
-    global start_time
+    #I need to set this variable as global because I want to update rising_edge_counter through this trigger_callback function
     global rising_edge_counter
     
-    #Timer start at first measure, ie first rising edge
-    if rising_edge_counter == 0:
-        start_time = time.time()
-    
-    relative_time = time.time() - start_time
-    
-    # Retrieve the current temperature and pressure measurement values
-    new_row = [rising_edge_counter] + [relative_time] + get_current_T_P(hat_134, hat_128, pressure_alarm, channels_T, channels_P)
-    
-    # If the array is empty (first measurement), create a new array with the first measurement
-    if data_array == []:
-        data_array = [new_row]
-    else:
-        data_array.append(new_row)
-    
-    
+    engine.trigger(rising_edge_counter)
     rising_edge_counter += 1
 
+engine.start()
+
 # Add the event detection for the rising edge of the trigger input
 GPIO.add_event_detect(trigger_pin, GPIO.RISING, callback=data_array_update)
 
+# A kill (SIGTERM) exits through the finally clause below, like Ctrl-C, so the log is closed cleanly
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
 try:
     #While no trigger event, just display the pressure and temperature data
-    while True:
-        #Function that display T and P data continuoulsy, Pressure alarm in bar
-        #Need to pay attention to the refresh rate COMPARED TO acquisition rate
-        T_P_disp(lcd, T_hot_wall, channels_134=(0, 1), channels_128=(0, 1), delay_between_reads=0.5, alarm_on = False, pressure_alarm = 130, terminal_output = True, lcd_output = True)
+    #Terminal and LCD refresh at their own rates, a slow LCD redraw never delays the acquisition thread
+    run_monitor(engine = engine, channels_T = channels_T, channels_P = channels_P, lcd = lcd, T_hot_wall = T_hot_wall, terminal_rate = 2, lcd_rate = 2, terminal_output = True)
 
 
 
 except KeyboardInterrupt:
-    # Save data array as a csv, print it if you want and clean data_array
-    save_data_to_csv(data_array, header, filename)
-    data_array = []    
+    pass
+
+finally:
+    # Stop the triggers first, then the acquisition thread once the queued triggers are read, then write the remaining rows and close the log
+    GPIO.remove_event_detect(trigger_pin)
+    engine.stop()
+    data_log.close()
+    data_binary.close()
+    print(f"CSV file '{filename}' saved successfully, {sample_counter} rows.")
+    engine.latency.print_report()
+    # The watchdog keeps the shutdown pin until the very end
+    watchdog.stop()
+    watchdog.print_report()
+    watchdog.close()
+    session.stop_temperature_poller()
     print("Exiting...")
     GPIO.cleanup()
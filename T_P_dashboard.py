@@ -0,0 +1,434 @@
+"""
+Purpose:
+    Live web dashboard of the T_P acquisition: pressures, temperatures, alarm and watchdog state.
+
+    Description:
+        The dashboard reads the shared memory buffers published by the acquisition (see acq_shared.py) and never
+        opens the boards, so any number of browsers can watch a run without a single additional HAT read:
+            - the pressures in bar scanned by the safety watchdog (WatchdogBuffer), with its alarm and shutdown
+              state, scan rate, overruns and reaction latency,
+            - the temperatures read by the temperature poller (TemperatureBuffer) and the hot wall temperature of
+              the run.
+        It shows P1/P2 in bar and T1/T2/T_hot_wall in Celsius, on two strip charts sharing the same time axis, and
+        a table of the latest values, the alarm state, the effective sample rate and the overrun counters.
+
+        Start the acquisition first (T_P_acq_trigger_synchronous.py publishes both buffers), then run this script
+        on the same Raspberry Pi and open http://<host>:8050 in a web browser. The dashboard waits for the
+        buffers, and attaches again when the acquisition is restarted.
+
+        Each browser keeps its own cursors into the buffers and each update only sends the rows written since
+        its previous update. The pressure rows are reduced to their minimum and maximum per bucket, so pressure
+        spikes stay visible while the chart holds a fixed number of points whatever the scan rate.
+
+        Requires Dash: pip install dash
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import json
+import socket
+import threading
+import time
+import numpy as np
+from dash import Dash, no_update
+from dash.dependencies import Input, Output, State
+import dash_core_components as dcc
+import dash_html_components as html
+import plotly.graph_objs as go
+
+from acq_shared import WatchdogBuffer, TemperatureBuffer, WATCHDOG_BUFFER_NAME, TEMPERATURE_BUFFER_NAME, \
+STATUS_NAMES, STATUS_RUNNING #acq_shared needs to be in the same folders as this script
+from acq_temperature import TC_ERROR_VALUES #acq_temperature needs to be in the same folders as this script
+
+
+################################################
+"""
+Dashboard parameters
+"""
+
+dashboard_port = 8050
+update_interval = 0.5 # Seconds between two updates of each browser
+window_seconds = 60 # Duration displayed on the strip charts, in seconds
+points_per_window = 2000 # Pressure points per channel on the chart, two (min and max) per bucket of samples
+rate_interval = 1.0 # Seconds between two updates of the effective sample rate
+heartbeat_timeout = 0.5 # Seconds without a scan read before the watchdog is reported as stalled
+tc_error_names = dict(zip(TC_ERROR_VALUES, ('Open TC', 'Over range', 'Common mode error')))
+
+_origin_ns = time.perf_counter_ns() # Origin of the time axis, the perf_counter clock is the same in all processes
+
+
+################################################
+"""
+Shared buffers
+"""
+
+class AcquisitionBuffers:
+    """
+    Attachment to the shared buffers of the acquisition, shared by the callbacks of all the browsers.
+
+    A buffer is attached again when the acquisition is restarted: a stopped watchdog buffer, or a temperature
+    buffer without a reading for several intervals, is replaced by the buffer currently published under its name,
+    if this one is running. Each (re)attachment increments the epoch of the buffer, so the browsers reset their
+    charts and cursors.
+
+    The callbacks read the buffers with lock held: a replaced buffer is closed by get(), which takes the same lock,
+    so it is never closed while another browser reads it.
+
+    Args:
+        pressure_name (str, optional): Name of the watchdog buffer. Defaults to WATCHDOG_BUFFER_NAME.
+        temperature_name (str, optional): Name of the temperature buffer. Defaults to TEMPERATURE_BUFFER_NAME.
+    """
+
+    def __init__(self, pressure_name=WATCHDOG_BUFFER_NAME, temperature_name=TEMPERATURE_BUFFER_NAME):
+        self.pressure_name = pressure_name
+        self.temperature_name = temperature_name
+        self.pressure = None
+        self.temperature = None
+        self.pressure_epoch = 0
+        self.temperature_epoch = 0
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _attach(buffer_class, name):
+        try:
+            return buffer_class.attach(name)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _temperature_running(buffer):
+        readings, time_ns, temperatures = buffer.latest()
+        return readings > 0 and (time.perf_counter_ns() - time_ns) * 1e-9 < 3 * buffer.interval
+
+    def get(self):
+        """
+        Returns the current buffers, attached again if the acquisition was restarted.
+
+        Returns:
+            tuple: WatchdogBuffer (None if not published), its epoch, TemperatureBuffer (None if not published)
+            and its epoch.
+        """
+        with self.lock:
+            if self.pressure is None or self.pressure.status != STATUS_RUNNING:
+                candidate = self._attach(WatchdogBuffer, self.pressure_name)
+                if candidate is not None and (self.pressure is None or candidate.status == STATUS_RUNNING):
+                    if self.pressure is not None:
+                        self.pressure.close()
+                    self.pressure = candidate
+                    self.pressure_epoch += 1
+                elif candidate is not None:
+                    candidate.close()
+
+            if self.temperature is None or not self._temperature_running(self.temperature):
+                candidate = self._attach(TemperatureBuffer, self.temperature_name)
+                if candidate is not None and (self.temperature is None or self._temperature_running(candidate)):
+                    if self.temperature is not None:
+                        self.temperature.close()
+                    self.temperature = candidate
+                    self.temperature_epoch += 1
+                elif candidate is not None:
+                    candidate.close()
+
+            return self.pressure, self.pressure_epoch, self.temperature, self.temperature_epoch
+
+
+_buffers = AcquisitionBuffers()
+
+
+################################################
+"""
+Data reduction
+"""
+
+def min_max_envelope(first, block, bucket_size):
+    """
+    Reduces rows to the minimum and maximum of each bucket of rows, in time order, so spikes stay visible.
+
+    Args:
+        first (int): Row number of the first row of the block.
+        block (numpy.ndarray): One row per sample, one column per channel.
+        bucket_size (int): Number of rows per bucket, the last bucket may be shorter.
+
+    Returns:
+        tuple: Row numbers and values of the points, numpy.ndarray with two rows per bucket and one column
+        per channel.
+    """
+    number_of_rows, number_of_channels = block.shape
+    if bucket_size <= 1:
+        return np.repeat(first + np.arange(number_of_rows)[:, np.newaxis], number_of_channels, axis=1), block
+
+    rows = []
+    values = []
+    full = number_of_rows // bucket_size * bucket_size
+    for start, part in ((0, block[:full]), (full, block[full:])):
+        if len(part) == 0:
+            continue
+        size = min(bucket_size, len(part))
+        buckets = part.reshape(-1, size, number_of_channels)
+        index_min = buckets.argmin(axis=1)
+        index_max = buckets.argmax(axis=1)
+        index = np.stack((np.minimum(index_min, index_max), np.maximum(index_min, index_max)), axis=1)
+        values.append(np.take_along_axis(buckets, index, axis=1).reshape(-1, number_of_channels))
+        rows.append((first + start + size * np.arange(len(buckets))[:, np.newaxis, np.newaxis]
+                     + index).reshape(-1, number_of_channels))
+    return np.concatenate(rows), np.concatenate(values)
+
+
+def pressure_times(buffer, samples, read_ns, row_numbers):
+    """
+    Converts row numbers of the watchdog scan to seconds on the dashboard time axis.
+
+    The last row scanned is dated by the scan read of the watchdog that returned it, the previous ones one scan
+    period apart.
+
+    Args:
+        buffer (WatchdogBuffer): Buffer of the watchdog.
+        samples (int): Number of rows scanned so far.
+        read_ns (int): time.perf_counter_ns() of the scan read of the last row, read with the rows.
+        row_numbers (numpy.ndarray): Row numbers of the scan.
+
+    Returns:
+        numpy.ndarray: Times in seconds.
+    """
+    return (read_ns - _origin_ns) * 1e-9 - (samples - 1 - row_numbers) / buffer.scan_rate
+
+
+def temperature_values(temperatures):
+    """
+    Replaces the MCC 134 error values by None, i.e. gaps on the chart.
+
+    Args:
+        temperatures (numpy.ndarray): Temperatures in Celsius or MCC 134 error values.
+
+    Returns:
+        list: Temperatures, None for the errors.
+    """
+    return [None if value in TC_ERROR_VALUES else value for value in temperatures.tolist()]
+
+
+################################################
+"""
+User interface
+"""
+
+def chart_figure(labels, title, unit):
+    """
+    Creates a strip chart with one empty serie per channel, filled by the extendData updates.
+
+    Args:
+        labels (list): Name of each serie.
+        title (str): Title of the chart.
+        unit (str): Title of the Y axis.
+
+    Returns:
+        dict: Figure of a dcc.Graph.
+    """
+    colors = ['#DD3222', '#3482CB', '#FFC000', '#75B54A']
+    return {'data': [go.Scatter(x=[], y=[], name=label, mode='lines', marker={'color': colors[index % len(colors)]})
+                     for index, label in enumerate(labels)],
+            'layout': go.Layout(title=title, xaxis=dict(title='Time (s)', autorange=True), yaxis=dict(title=unit),
+                                margin={'l': 60, 'r': 40, 't': 50, 'b': 40}, showlegend=True)}
+
+
+def pressure_labels(buffer):
+    return ['P{}'.format(index + 1) for index in range(len(buffer.channels))]
+
+
+def temperature_labels(buffer):
+    return ['T{}'.format(index + 1) for index in range(len(buffer.channels))]
+
+
+def initial_cursors(pressure, pressure_epoch, temperature, temperature_epoch):
+    """
+    Creates the cursors of a browser into the buffers, from the oldest rows still in the buffers.
+
+    Returns:
+        dict: Epoch and rows already sent for each buffer, rows missed, and effective sample rate measurement.
+    """
+    samples = int(pressure.latest()[0]) if pressure is not None else 0
+    readings = int(temperature.latest()[0]) if temperature is not None else 0
+    return {'pressure_epoch': pressure_epoch if pressure is not None else -1,
+            'samples': max(samples - pressure.capacity, 0) if pressure is not None else 0,
+            'missed': 0,
+            'rate_samples': samples, 'rate_ns': time.perf_counter_ns(), 'rate': None,
+            'temperature_epoch': temperature_epoch if temperature is not None else -1,
+            'readings': max(readings - temperature.capacity, 0) if temperature is not None else 0}
+
+
+def serve_layout():
+    """
+    Creates the HTML layout for each browser loading the page, with charts for the channels currently published.
+
+    Returns:
+        html.Div: The root element of the user interface.
+    """
+    with _buffers.lock:
+        pressure, pressure_epoch, temperature, temperature_epoch = _buffers.get()
+        cursors = initial_cursors(pressure, pressure_epoch, temperature, temperature_epoch)
+        pressure_names = pressure_labels(pressure) if pressure is not None else []
+        temperature_names = temperature_labels(temperature) if temperature is not None else []
+    return html.Div([
+        html.H1('T/P acquisition dashboard'),
+        html.Div(id='values', style={'font-size': 18, 'margin-bottom': 10}),
+        dcc.Graph(id='pressureChart', style={'height': 400},
+                  figure=chart_figure(pressure_names, 'Pressure', 'Pressure (bar)')),
+        dcc.Graph(id='temperatureChart', style={'height': 400},
+                  figure=chart_figure(temperature_names, 'Temperature', 'Temperature (C)')),
+        dcc.Interval(id='timer', interval=update_interval * 1000, n_intervals=0),
+        html.Div(id='cursors', style={'display': 'none'}, children=json.dumps(cursors)),
+    ])
+
+
+def values_table(pressure, temperature, cursors):
+    """
+    Creates the table of the latest values, alarm state, effective sample rate and overrun counters.
+
+    Returns:
+        html.Table: The table.
+    """
+    cells = []
+    if pressure is None:
+        cells.append(('Pressure', 'waiting for the safety watchdog'))
+    else:
+        stats = pressure.stats()
+        samples, pressures = pressure.latest()
+        if pressures is not None:
+            for label, value in zip(pressure_labels(pressure), pressures.tolist()):
+                cells.append((label, '{:.2f} bar'.format(value)))
+        age = pressure.heartbeat_age()
+        status = stats['status']
+        if stats['status'] == STATUS_NAMES[STATUS_RUNNING] and (age is None or age > heartbeat_timeout):
+            status = 'stalled'
+        cells.append(('Alarm', 'SHUTDOWN' if stats['shutdown'] else 'off'))
+        cells.append(('Threshold', '{:.1f} bar, {} trips'.format(pressure.threshold, stats['trips'])))
+        cells.append(('Watchdog', '{} ({})'.format(status, stats['policy'])))
+        rate = cursors['rate']
+        cells.append(('Sample rate', '{} / {:.1f} Hz'.format('-' if rate is None else '{:.1f}'.format(rate),
+                                                             pressure.scan_rate)))
+        cells.append(('Overruns', '{} scan, {} rows missed'.format(stats['overruns'], cursors['missed'])))
+        cells.append(('Latency', '{:.2f} ms, max {:.2f} ms'.format(stats['latency_last'] * 1e3,
+                                                                 stats['latency_max'] * 1e3)))
+
+    if temperature is None:
+        cells.append(('Temperature', 'waiting for the temperature poller'))
+    else:
+        readings, time_ns, temperatures = temperature.latest()
+        if temperatures is not None:
+            for label, value in zip(temperature_labels(temperature), temperatures.tolist()):
+                cells.append((label, tc_error_names.get(value, '{:.1f} C'.format(value))))
+        T_hot_wall = temperature.T_hot_wall
+        cells.append(('T_hot_wall', '-' if T_hot_wall is None else '{:.1f} C'.format(T_hot_wall)))
+
+    alarm_style = {'color': 'red', 'font-weight': 'bold'}
+    return html.Table([html.Tr([html.Th(name, style={'text-align': 'left', 'padding-right': 20}),
+                                html.Td(value, style=alarm_style if value == 'SHUTDOWN' else {})])
+                       for name, value in cells])
+
+
+################################################
+"""
+Callbacks
+"""
+
+_app = Dash(__name__)
+_app.layout = serve_layout
+
+
+@_app.callback(
+    [Output('cursors', 'children'),
+     Output('pressureChart', 'extendData'),
+     Output('temperatureChart', 'extendData'),
+     Output('pressureChart', 'figure'),
+     Output('temperatureChart', 'figure'),
+     Output('values', 'children')],
+    [Input('timer', 'n_intervals')],
+    [State('cursors', 'children')]
+)
+def update_dashboard(_n_intervals, cursors_json):
+    """
+    Sends the rows written since the previous update of the browser, and the latest values.
+
+    Args:
+        _n_intervals (int): Number of timer intervals - triggers the callback.
+        cursors_json (str): JSON cursors of the browser into the buffers, see initial_cursors().
+
+    Returns:
+        tuple: Updated cursors, extendData of the pressure and temperature charts, new figures when a buffer was
+        attached again (no_update otherwise), and the table of values.
+    """
+    cursors = json.loads(cursors_json)
+    with _buffers.lock:
+        pressure, pressure_epoch, temperature, temperature_epoch = _buffers.get()
+        pressure_extend = temperature_extend = pressure_figure = temperature_figure = no_update
+        now_ns = time.perf_counter_ns()
+
+        if pressure is not None:
+            if cursors['pressure_epoch'] != pressure_epoch:
+                # New acquisition: new chart, its history is sent at the next update
+                fresh = initial_cursors(pressure, pressure_epoch, None, -1)
+                cursors.update({key: fresh[key] for key in ('pressure_epoch', 'samples', 'missed', 'rate_samples',
+                                                            'rate_ns', 'rate')})
+                pressure_figure = chart_figure(pressure_labels(pressure), 'Pressure', 'Pressure (bar)')
+            else:
+                samples, block, read_ns = pressure.read_since(cursors['samples'])
+                first = samples - len(block)
+                cursors['missed'] += first - cursors['samples']
+                cursors['samples'] = samples
+                if len(block):
+                    window_rows = int(window_seconds * pressure.scan_rate)
+                    bucket_size = max(1, -(-window_rows // (points_per_window // 2)))
+                    row_numbers, values = min_max_envelope(first, block, bucket_size)
+                    times = pressure_times(pressure, samples, read_ns, row_numbers)
+                    pressure_extend = ({'x': times.T.tolist(), 'y': values.T.tolist()},
+                                       list(range(values.shape[1])), points_per_window)
+                if (now_ns - cursors['rate_ns']) * 1e-9 >= rate_interval:
+                    cursors['rate'] = (samples - cursors['rate_samples']) / ((now_ns - cursors['rate_ns']) * 1e-9)
+                    cursors['rate_samples'] = samples
+                    cursors['rate_ns'] = now_ns
+
+        if temperature is not None:
+            if cursors['temperature_epoch'] != temperature_epoch:
+                fresh = initial_cursors(None, -1, temperature, temperature_epoch)
+                cursors.update({key: fresh[key] for key in ('temperature_epoch', 'readings')})
+                temperature_figure = chart_figure(temperature_labels(temperature), 'Temperature', 'Temperature (C)')
+            else:
+                readings, times_ns, temperatures = temperature.read_since(cursors['readings'])
+                cursors['readings'] = readings
+                if len(times_ns):
+                    times = ((times_ns - _origin_ns) * 1e-9).tolist()
+                    max_points = max(int(window_seconds / temperature.interval), 1)
+                    temperature_extend = ({'x': [times] * temperatures.shape[1],
+                                           'y': [temperature_values(column) for column in temperatures.T]},
+                                          list(range(temperatures.shape[1])), max_points)
+
+        return (json.dumps(cursors), pressure_extend, temperature_extend, pressure_figure, temperature_figure,
+                values_table(pressure, temperature, cursors))
+
+
+################################################
+"""
+Main script logic
+"""
+
+def get_ip_address():
+    """
+    Returns the IP address of the Raspberry Pi on the local network, localhost if there is no network.
+    """
+    ip_address = '127.0.0.1'
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(('1.1.1.1', 1)) # Does not have to be reachable
+        ip_address = sock.getsockname()[0]
+    except OSError:
+        pass
+    finally:
+        sock.close()
+    return ip_address
+
+
+if __name__ == '__main__':
+    _app.run_server(host=get_ip_address(), port=dashboard_port)
@@ -0,0 +1,51 @@
+"""
+Checks that a pressure spike shorter than one block drives the alarm outputs of AlarmEngine (see acq_alarm.py).
+Runs without the HATs: the GPIO writes are replaced by a list of (output, state) writes.
+Run it with: python3 -m pytest Test/alarm_spike_test.py, or python3 Test/alarm_spike_test.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from acq_alarm import AlarmEngine, AlarmRule #acq_alarm needs to be in the parent folder of this script
+
+
+def create_engine(writes, **rule_options):
+    rule = AlarmRule('overpressure', 130, ('alarm', 'shutdown'), **rule_options)
+    return AlarmEngine([rule], outputs={'alarm': (lambda: writes.append(('alarm', 1)),
+                                                  lambda: writes.append(('alarm', 0))),
+                                        'shutdown': (lambda: writes.append(('shutdown', 1)),
+                                                     lambda: writes.append(('shutdown', 0)))})
+
+
+def test_spike_inside_one_block():
+    writes = []
+    transitions = []
+    engine = create_engine(writes)
+    engine.on_transition = lambda output, active: transitions.append((output, active))
+
+    assert engine.evaluate([[100, 100], [135, 100], [140, 100], [100, 100], [100, 100]])
+    assert engine.rules[0].trips == 1
+    assert not engine.active
+    assert writes == [('alarm', 1), ('shutdown', 1)]
+    assert transitions == [('alarm', True), ('shutdown', True)]
+
+    # Released at the next evaluation
+    assert not engine.evaluate([[100, 100]])
+    assert writes[2:] == [('alarm', 0), ('shutdown', 0)]
+    assert transitions[2:] == [('alarm', False), ('shutdown', False)]
+
+
+def test_spike_shorter_than_debounce():
+    writes = []
+    engine = create_engine(writes, debounce=3)
+    assert not engine.evaluate([[100, 100], [135, 100], [140, 100], [100, 100]])
+    assert writes == [('alarm', 0), ('shutdown', 0)]
+
+
+if __name__ == '__main__':
+    test_spike_inside_one_block()
+    test_spike_shorter_than_debounce()
+    print('OK')
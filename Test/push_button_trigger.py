@@ -1,5 +1,6 @@
 import RPi.GPIO as GPIO
 from T_P_acq_func import T_P_acq_csv, T_P_disp
+from acq_wait import EdgeWaiter
 
 """
 Purpose:
@@ -23,27 +24,20 @@ GPIO.setup(trigger_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
 
 
-def trigger_callback(channel):
-    """
-    Purpose:
-
-    Args:
-
-    """
-    pin_state = GPIO.input(trigger_pin)
-    print('Button Pushed', pin_state)
-
-
-
-# Add the event detection for the falling edge of the trigger input
-GPIO.add_event_detect(trigger_pin, GPIO.RISING, callback=trigger_callback)
+# Add the event detection for the rising edge of the trigger input, the edges are handed over to the main loop below
+waiter = EdgeWaiter(trigger_pin, GPIO.RISING)
 
 
 try:
     print("Waiting for trigger input...")
     while True:
-        pass
+        # Sleeps until the next edge, no CPU is used while waiting
+        waiter.wait()
+        pin_state = GPIO.input(trigger_pin)
+        print('Button Pushed', pin_state)
 
 except KeyboardInterrupt:
     print("Exiting...")
+    waiter.close()
+    waiter.latency.print_report('Edge to main loop latency')
     GPIO.cleanup()
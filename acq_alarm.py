@@ -0,0 +1,255 @@
+"""
+Purpose:
+    Pressure alarm rules evaluated over whole blocks of samples.
+
+    Description:
+        AlarmEngine evaluates a list of AlarmRule over a NumPy block of
+        pressures (one row per sample, one column per channel) instead of one
+        value at a time. A rule is active as soon as the highest of its
+        channels stays above its threshold for debounce consecutive samples,
+        and becomes inactive when this value falls below threshold - hysteresis.
+        A latched rule stays active until reset(). The state of every rule is
+        kept from one block to the next, so the result does not depend on how
+        the samples are split into blocks.
+
+        Each output (e.g. the alarm pin and the system shutdown pin) is active
+        while at least one of its rules is active, whatever the channel. It is
+        only written on a state transition, so a safe reading on one channel
+        never clears an alarm raised by another, and the GPIO pins are not
+        rewritten at every sample. A rule that trips and clears within one
+        block still drives its outputs for this block, they are released at
+        the next evaluation. The evaluation time of every rule is measured.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import time
+import numpy as np
+
+
+################################################
+"""
+Rules
+"""
+
+class AlarmRule:
+    """
+    Threshold rule with hysteresis, debounce and optional latching.
+
+    Args:
+        name (str): Name of the rule, used in the messages and report.
+        threshold (float): The rule trips when the value goes above threshold.
+        outputs (tuple): Names of the AlarmEngine outputs driven by the rule, e.g. ('alarm', 'shutdown').
+        columns (list, optional): Columns of the block checked by the rule, their highest value is compared
+            with the threshold. Defaults to None (all columns).
+        hysteresis (float, optional): The rule clears when the value goes below threshold - hysteresis. Defaults to 0.
+        debounce (int, optional): Number of consecutive samples above threshold needed to trip. Defaults to 1.
+        latch (bool, optional): If True, the rule stays active once tripped, until AlarmEngine.reset(). Defaults to False.
+    """
+
+    def __init__(self, name, threshold, outputs, columns=None, hysteresis=0.0, debounce=1, latch=False):
+        if debounce < 1:
+            raise ValueError('Error: Alarm rule debounce must be at least 1 sample')
+        if hysteresis < 0:
+            raise ValueError('Error: Alarm rule hysteresis must be positive')
+        self.name = name
+        self.threshold = threshold
+        self.outputs = tuple(outputs)
+        self.columns = None if columns is None else list(columns)
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+        self.latch = latch
+
+        # State, kept between blocks
+        self.active = False
+        self.count_above = 0 # Consecutive samples above threshold at the end of the last block
+        self.trips = 0
+        self.tripped = False # Tripped during the last block, even if cleared before its end
+
+        # Evaluation cost
+        self.evaluations = 0
+        self.total_time_ns = 0
+        self.max_time_ns = 0
+
+    def reset(self):
+        """
+        Clears the state of the rule, including a latched trip.
+        """
+        self.active = False
+        self.count_above = 0
+        self.tripped = False
+
+    def evaluate(self, block):
+        """
+        Updates the state of the rule with a block of samples.
+
+        Args:
+            block (numpy.ndarray): 2D array, one row per sample, one column per channel.
+
+        Returns:
+            bool: True if the rule is active after the last sample of the block.
+        """
+        start = time.perf_counter_ns()
+
+        values = block if self.columns is None else block[:, self.columns]
+        values = values.max(axis=1)
+        above = values > self.threshold
+        below = values < self.threshold - self.hysteresis
+        number_of_samples = values.shape[0]
+        trips_before = self.trips
+
+        # Walk from transition to transition, each step is a vectorised search over the rest of the block
+        position = 0
+        while position < number_of_samples:
+            if not self.active:
+                # Length of the run of samples above threshold ending at each sample, run carried over from the last block
+                remaining = above[position:]
+                index = np.arange(remaining.shape[0])
+                last_below = np.maximum.accumulate(np.where(remaining, -1 - self.count_above, index))
+                run_length = index - last_below
+                tripped = run_length >= self.debounce
+                if not tripped.any():
+                    self.count_above = int(run_length[-1])
+                    break
+                position += int(np.argmax(tripped)) + 1
+                self.active = True
+                self.count_above = 0
+                self.trips += 1
+            else:
+                if self.latch:
+                    break
+                cleared = below[position:]
+                if not cleared.any():
+                    break
+                position += int(np.argmax(cleared)) + 1
+                self.active = False
+                self.count_above = 0
+
+        self.tripped = self.trips > trips_before
+        elapsed = time.perf_counter_ns() - start
+        self.evaluations += 1
+        self.total_time_ns += elapsed
+        if elapsed > self.max_time_ns:
+            self.max_time_ns = elapsed
+
+        return self.active
+
+
+################################################
+"""
+Engine
+"""
+
+class AlarmEngine:
+    """
+    Evaluates alarm rules and drives their outputs on state transitions only.
+
+    Typical use:
+        engine = AlarmEngine([AlarmRule('overpressure', 130, ('alarm', 'shutdown'), hysteresis=2)],
+                             outputs={'alarm': (sound_alarm, no_sound_alarm),
+                                      'shutdown': (system_shutdown, no_system_shutdown)})
+        engine.evaluate(pressure_block) # For each block or sample
+
+    Args:
+        rules (list): AlarmRule objects.
+        outputs (dict): Output name to (on, off) pair of functions without arguments, e.g. the GPIO writes.
+        on_transition (callable, optional): Called as on_transition(output, active) after each output change,
+            e.g. to print a warning. Defaults to None.
+    """
+
+    def __init__(self, rules, outputs, on_transition=None):
+        self.rules = list(rules)
+        self.outputs = dict(outputs)
+        self.on_transition = on_transition
+        for rule in self.rules:
+            for output in rule.outputs:
+                if output not in self.outputs:
+                    raise ValueError('Error: Alarm rule {} drives unknown output {}'.format(rule.name, output))
+
+        self.output_state = {output: None for output in self.outputs} # None: not written yet
+        self.transitions = 0
+
+    @property
+    def active(self):
+        """
+        bool: True if at least one rule is active.
+        """
+        return any(rule.active for rule in self.rules)
+
+    def evaluate(self, block):
+        """
+        Evaluates all rules over a block of pressures and writes the outputs that changed.
+
+        An output is on if one of its rules is active after the block or tripped during the block, so a peak
+        shorter than a block is never missed. It is released at a later evaluation.
+
+        Args:
+            block (numpy.ndarray or list): Pressures, one value per channel (1D) or one row per sample (2D).
+
+        Returns:
+            bool: True if at least one rule is active after the block or tripped during it.
+        """
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            block = block.reshape(1, -1)
+        if block.shape[0] == 0:
+            return self.active
+
+        for rule in self.rules:
+            rule.evaluate(block)
+        self._write_outputs()
+        return any(rule.active or rule.tripped for rule in self.rules)
+
+    def reset(self):
+        """
+        Clears every rule, latched ones included, and writes the outputs that changed.
+        """
+        for rule in self.rules:
+            rule.reset()
+        self._write_outputs()
+
+    def _write_outputs(self):
+        for output, (on, off) in self.outputs.items():
+            state = any(rule.active or rule.tripped for rule in self.rules if output in rule.outputs)
+            if state == self.output_state[output]:
+                continue
+            if state:
+                on()
+            else:
+                off()
+            # The first write of an inactive output is the initial state, not a transition
+            changed = state or self.output_state[output] is not None
+            self.output_state[output] = state
+            if changed:
+                self.transitions += 1
+                if self.on_transition is not None:
+                    self.on_transition(output, state)
+
+    def stats(self):
+        """
+        Returns the state and evaluation cost of every rule.
+
+        Returns:
+            dict: Rule name to a dict with active state, number of trips, number of evaluations,
+            mean and max evaluation time in seconds.
+        """
+        return {rule.name: {'active': rule.active,
+                            'trips': rule.trips,
+                            'evaluations': rule.evaluations,
+                            'mean_time': rule.total_time_ns / rule.evaluations * 1e-9 if rule.evaluations else 0.0,
+                            'max_time': rule.max_time_ns * 1e-9}
+                for rule in self.rules}
+
+    def print_report(self):
+        """
+        Prints the state and evaluation cost of every rule in the terminal.
+        """
+        print('\nAlarm report: {} output transitions'.format(self.transitions))
+        for name, stats in self.stats().items():
+            print('{}: {}, {} trips, {} evaluations, mean {:.1f} us, max {:.1f} us'.format(
+                name, 'ACTIVE' if stats['active'] else 'inactive', stats['trips'], stats['evaluations'],
+                stats['mean_time'] * 1e6, stats['max_time'] * 1e6))
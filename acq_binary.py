@@ -0,0 +1,421 @@
+"""
+Purpose:
+    Compact binary recording format and its memory-mapped reader.
+
+    Description:
+        A recording file is made of:
+            - a fixed 32 bytes header, little-endian:
+                magic b'TPACQBIN' (8 bytes), format version (uint16), size in bytes of one
+                value, 4 or 8 (uint16), number of columns (uint32), length of the JSON
+                metadata (uint32), number of committed rows (uint64), 4 padding bytes
+            - the JSON metadata (column names, creation date, acquisition parameters, ...)
+            - zero padding up to the next multiple of 64 bytes
+            - the data rows, back to back, as little-endian float32 or float64 values
+
+        BinaryRecordWriter appends the rows chunk by chunk (one scan block or one
+        triggered row at a time) and commits the row count in the header at most
+        every commit_interval seconds and on close. A crash therefore loses at most
+        the last uncommitted chunks, and the reader never sees a partial row.
+        BinaryWriterThread runs a BinaryRecordWriter on its own thread, fed through
+        a bounded queue like CSVWriterThread (see acq_writer.py), so the writes and
+        commits never delay the acquisition loop.
+
+        open_recording() memory-maps the file and returns NumPy views on the rows
+        and columns: nothing is parsed or copied, so a multi-GB session opens
+        instantly and only the pages actually used are read from disk.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import json
+import os
+import struct
+import time
+import datetime
+import threading
+import queue
+import numpy as np
+
+
+################################################
+"""
+Constants
+"""
+
+MAGIC = b'TPACQBIN'
+FORMAT_VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sHHIIQ4x') # magic, version, itemsize, number of columns, metadata length, committed rows
+ROW_COUNT_OFFSET = 20 # Offset of the committed rows field in the header
+DATA_ALIGNMENT = 64
+
+_STOP = object() # Queue sentinel asking the writer thread to finish
+
+
+################################################
+"""
+Writer
+"""
+
+class BinaryRecordWriter:
+    """
+    Writes acquisition rows to a binary recording file.
+
+    Typical use:
+        with BinaryRecordWriter("data.bin", ["N_measure", "Time", "Pressure 1"], metadata=params) as record:
+            record.write_block(block)
+
+    Args:
+        filename (str): Name of the binary file.
+        columns (list): Column names.
+        dtype (str, optional): 'float32' or 'float64'. Defaults to 'float64'.
+        metadata (dict, optional): JSON serialisable acquisition parameters stored in the header. Defaults to None.
+        commit_interval (float, optional): Maximum time in seconds between two updates of the committed
+            row count in the header. 0 commits after every chunk. Defaults to 1.0.
+    """
+
+    def __init__(self, filename, columns, dtype='float64', metadata=None, commit_interval=1.0):
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        if self.dtype.kind != 'f' or self.dtype.itemsize not in (4, 8):
+            raise ValueError('Error: Binary recording dtype must be float32 or float64')
+        self.filename = filename
+        self.columns = list(columns)
+        self.commit_interval = commit_interval
+        self.rows = 0
+        self.committed_rows = 0
+        self._last_commit = time.monotonic()
+
+        full_metadata = {'columns': self.columns,
+                         'dtype': self.dtype.name,
+                         'created': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if metadata is not None:
+            full_metadata.update(metadata)
+        metadata_bytes = json.dumps(full_metadata, default=str).encode('utf-8')
+
+        header = HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION, self.dtype.itemsize, len(self.columns),
+                                    len(metadata_bytes), 0)
+        data_offset = _data_offset(len(metadata_bytes))
+
+        self.file = open(filename, 'wb')
+        self.file.write(header)
+        self.file.write(metadata_bytes)
+        self.file.write(b'\0' * (data_offset - HEADER_STRUCT.size - len(metadata_bytes)))
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_block(self, block):
+        """
+        Appends a chunk of rows.
+
+        Args:
+            block (numpy.ndarray or list): 2D array of shape (rows, len(columns)), or a single 1D row.
+        """
+        block = np.asarray(block, dtype=self.dtype)
+        if block.ndim == 1:
+            block = block.reshape(1, -1)
+        if block.shape[1] != len(self.columns):
+            raise ValueError('Error: Block has {} columns, recording has {}'.format(block.shape[1], len(self.columns)))
+
+        block.tofile(self.file)
+        self.rows += block.shape[0]
+
+        if time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """
+        Flushes the written rows and updates the committed row count in the header.
+        """
+        self.file.flush()
+        position = self.file.tell()
+        self.file.seek(ROW_COUNT_OFFSET)
+        self.file.write(struct.pack('<Q', self.rows))
+        self.file.seek(position)
+        self.file.flush()
+        self.committed_rows = self.rows
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        """
+        Commits the remaining rows and closes the file.
+        """
+        if not self.file.closed:
+            self.commit()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+
+class BinaryWriterThread(threading.Thread):
+    """
+    Background binary recording writer fed through a bounded queue.
+
+    The acquisition loop only queues a copy of each chunk, the writer thread appends the chunks with a
+    BinaryRecordWriter and commits the row count every commit_interval seconds, also when no chunk comes in.
+
+    Typical use:
+        with BinaryWriterThread("data.bin", ["N_measure", "Time", "Pressure 1"], metadata=params) as record:
+            for block in blocks:
+                record.write_block(block)
+
+    Args:
+        filename (str): Name of the binary file.
+        columns (list): Column names.
+        dtype (str, optional): 'float32' or 'float64'. Defaults to 'float64'.
+        metadata (dict, optional): JSON serialisable acquisition parameters stored in the header. Defaults to None.
+        commit_interval (float, optional): Maximum time in seconds between two updates of the committed
+            row count in the header. 0 commits after every chunk. Defaults to 1.0.
+        queue_size (int, optional): Maximum number of queued chunks. Defaults to 10000.
+        block_when_full (bool, optional): If True, write_block() waits when the queue is full.
+            If False, the chunk is dropped and counted in dropped_rows, so the acquisition loop
+            is never delayed. Defaults to False.
+    """
+
+    def __init__(self, filename, columns, dtype='float64', metadata=None, commit_interval=1.0, queue_size=10000,
+                 block_when_full=False):
+        threading.Thread.__init__(self, name='BinaryWriterThread', daemon=True)
+
+        # The file and header are created right away, so an invalid path fails in the caller thread
+        self.record = BinaryRecordWriter(filename, columns, dtype=dtype, metadata=metadata,
+                                         commit_interval=commit_interval)
+        self.filename = filename
+        self.block_when_full = block_when_full
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # Counters, written by the writer thread and read by anyone
+        self.dropped_rows = 0
+        self.max_queue_depth = 0
+        self.write_count = 0
+        self.total_write_time = 0.0
+        self.max_write_time = 0.0
+        self.error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def queue_depth(self):
+        """
+        int: Number of chunks currently waiting in the queue.
+        """
+        return self.queue.qsize()
+
+    def write_block(self, block):
+        """
+        Queues a copy of a chunk of rows. Called from the acquisition loop, which may reuse its block afterwards.
+
+        Args:
+            block (numpy.ndarray or list): 2D array of shape (rows, len(columns)), or a single 1D row.
+
+        Returns:
+            bool: True if the chunk was queued, False if it was dropped because the queue was full.
+        """
+        block = np.array(block, dtype=self.record.dtype)
+        if block.ndim == 1:
+            block = block.reshape(1, -1)
+        if block.shape[1] != len(self.record.columns):
+            raise ValueError('Error: Block has {} columns, recording has {}'.format(block.shape[1],
+                                                                                   len(self.record.columns)))
+        try:
+            self.queue.put(block, block=self.block_when_full)
+        except queue.Full:
+            self.dropped_rows += block.shape[0]
+            return False
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def run(self):
+        """
+        Writer thread loop: waits for chunks, appends them and commits the row count periodically.
+        """
+        record = self.record
+        timeout = record.commit_interval if record.commit_interval > 0 else None
+        running = True
+
+        try:
+            while running:
+                try:
+                    batch = [self.queue.get(timeout=timeout)]
+                except queue.Empty:
+                    batch = []
+
+                # Take everything already waiting
+                while True:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if batch and batch[-1] is _STOP:
+                    batch.pop()
+                    running = False
+
+                write_start = time.perf_counter()
+                for block in batch:
+                    record.write_block(block)
+                # Rows left uncommitted by the last chunk are committed even if no chunk follows
+                if record.rows > record.committed_rows and time.monotonic() - record._last_commit >= record.commit_interval:
+                    record.commit()
+                if batch:
+                    write_time = time.perf_counter() - write_start
+                    self.write_count += 1
+                    self.total_write_time += write_time
+                    if write_time > self.max_write_time:
+                        self.max_write_time = write_time
+
+        except OSError as error:
+            # Storage error, keep the message for the caller and stop writing
+            self.error = error
+            print('\nBinary writer error:', error)
+
+        finally:
+            try:
+                record.close()
+            except OSError:
+                pass
+
+    def close(self):
+        """
+        Writes the remaining chunks, commits them, closes the file and waits for the writer thread to finish.
+        """
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join()
+        else:
+            # Thread never started or stopped on an error
+            self.record.close()
+
+    def stats(self):
+        """
+        Returns the writer counters.
+
+        Returns:
+            dict: Rows written, committed and dropped, current and max queue depth,
+            mean and max write latency in seconds.
+        """
+        return {'rows_written': self.record.rows,
+                'committed_rows': self.record.committed_rows,
+                'dropped_rows': self.dropped_rows,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'mean_write_time': self.total_write_time / self.write_count if self.write_count else 0.0,
+                'max_write_time': self.max_write_time}
+
+    def print_report(self):
+        """
+        Prints the writer counters in the terminal.
+        """
+        stats = self.stats()
+        print('\nBinary writer report ({}): {} rows written, {} rows dropped, max queue depth {}'.format(
+            self.filename, stats['rows_written'], stats['dropped_rows'], stats['max_queue_depth']))
+        print('Write latency: mean {:.3f} ms, max {:.3f} ms'.format(
+            stats['mean_write_time'] * 1e3, stats['max_write_time'] * 1e3))
+
+
+################################################
+"""
+Reader
+"""
+
+class Recording:
+    """
+    Memory-mapped view of a binary recording file, returned by open_recording().
+
+    Attributes:
+        metadata (dict): JSON metadata of the recording.
+        columns (list): Column names.
+        data (numpy.memmap): 2D array of shape (rows, columns), mapped on the file.
+    """
+
+    def __init__(self, filename, metadata, data):
+        self.filename = filename
+        self.metadata = metadata
+        self.columns = metadata['columns']
+        self.data = data
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, name):
+        """
+        Returns a column as a view of the mapped file (no copy).
+
+        Args:
+            name (str or int): Column name or index (Python or numpy integer).
+
+        Returns:
+            numpy.ndarray: 1D view of the column.
+        """
+        if not isinstance(name, (int, np.integer)):
+            name = self.columns.index(name)
+        return self.data[:, name]
+
+    def column_views(self):
+        """
+        Returns all columns as views of the mapped file (no copy).
+
+        Returns:
+            dict: Column name to 1D numpy.ndarray view.
+        """
+        return {name: self.data[:, i] for i, name in enumerate(self.columns)}
+
+
+def _data_offset(metadata_length):
+    end_of_metadata = HEADER_STRUCT.size + metadata_length
+    return -(-end_of_metadata // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def open_recording(filename, recover=False):
+    """
+    Opens a binary recording file by memory-mapping it.
+
+    Args:
+        filename (str): Name of the binary file.
+        recover (bool, optional): If True, the number of rows is computed from the file size instead
+            of the committed row count, to read rows written after the last commit of a session
+            that did not end cleanly. Incomplete trailing rows are ignored. Defaults to False.
+
+    Returns:
+        Recording: The memory-mapped recording.
+
+    Raises:
+        ValueError: The file is not a binary recording file.
+    """
+    with open(filename, 'rb') as file:
+        header = file.read(HEADER_STRUCT.size)
+        if len(header) < HEADER_STRUCT.size:
+            raise ValueError('Error: {} is not a binary recording file'.format(filename))
+        magic, version, itemsize, number_of_columns, metadata_length, committed_rows = HEADER_STRUCT.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('Error: {} is not a binary recording file'.format(filename))
+        if version > FORMAT_VERSION:
+            raise ValueError('Error: Unsupported binary recording version {}'.format(version))
+        metadata = json.loads(file.read(metadata_length).decode('utf-8'))
+
+    data_offset = _data_offset(metadata_length)
+    dtype = np.dtype('<f{}'.format(itemsize))
+    row_size = itemsize * number_of_columns
+
+    rows = committed_rows
+    if recover:
+        rows = max(0, (os.path.getsize(filename) - data_offset) // row_size)
+
+    if rows == 0:
+        data = np.zeros((0, number_of_columns), dtype=dtype)
+    else:
+        data = np.memmap(filename, dtype=dtype, mode='r', offset=data_offset, shape=(rows, number_of_columns))
+
+    return Recording(filename, metadata, data)
@@ -0,0 +1,169 @@
+"""
+Purpose:
+    Preallocated NumPy storage for acquired rows.
+
+    Description:
+        SampleStore keeps acquisition rows (e.g. index, relative time, T1..Tn,
+        P1..Pn) in one preallocated float64 block instead of a list of Python
+        lists. A new row is written in place in the next free slot of the block,
+        so an append is O(1) and allocates nothing. The store is either growable
+        (the block doubles when full, amortised O(1)) or circular (the oldest
+        rows are overwritten, memory stays bounded). The rows are exported to
+        CSV or binary straight from views of the block, without copying them.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import numpy as np
+
+
+################################################
+"""
+Sample store
+"""
+
+class SampleStore:
+    """
+    Fixed-dtype block store for acquisition rows.
+
+    Typical use, the row is filled in place:
+        store = SampleStore(['Index', 'Time', 'T1', 'T2', 'P1', 'P2'], capacity=100000, circular=True)
+        row = store.next_row()
+        row[0] = index
+        row[1] = relative_time
+        get_current_T_P(session, pressure_alarm, channels_T, channels_P, out=row[2:])
+        store.commit()
+
+    Args:
+        columns (list): Column names, one per value of a row.
+        capacity (int, optional): Number of rows allocated at creation. Defaults to 4096.
+        circular (bool, optional): If True, the store keeps the last capacity rows and overwrites
+            the oldest ones. If False, the block doubles its capacity when full. Defaults to False.
+        dtype (numpy dtype, optional): Data type of the values. Defaults to np.float64.
+    """
+
+    def __init__(self, columns, capacity=4096, circular=False, dtype=np.float64):
+        if capacity < 1:
+            raise ValueError('Error: SampleStore capacity must be at least 1')
+        self.columns = list(columns)
+        self.circular = circular
+        self.data = np.zeros((capacity, len(self.columns)), dtype=dtype)
+        self.total = 0 # Number of rows committed since creation, including overwritten ones
+        self._next = 0 # Slot of the next row
+
+    @property
+    def capacity(self):
+        """
+        int: Number of rows currently allocated.
+        """
+        return self.data.shape[0]
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def next_row(self):
+        """
+        Returns a view on the slot of the next row, to be filled in place then committed with commit().
+
+        Returns:
+            numpy.ndarray: 1D view of length len(columns).
+        """
+        if self._next == self.capacity:
+            if self.circular:
+                self._next = 0
+            else:
+                self._grow()
+        return self.data[self._next]
+
+    def commit(self):
+        """
+        Validates the row returned by the last next_row() call.
+        """
+        self._next += 1
+        self.total += 1
+
+    def append(self, values):
+        """
+        Copies a row of values in the next slot.
+
+        Args:
+            values (sequence): One value per column.
+        """
+        self.next_row()[:] = values
+        self.commit()
+
+    def _grow(self):
+        grown = np.zeros((2 * self.capacity, self.data.shape[1]), dtype=self.data.dtype)
+        grown[:self.capacity] = self.data
+        self.data = grown
+
+    def segments(self):
+        """
+        Returns the stored rows, oldest first, as views of the block (no copy).
+        A circular store that has wrapped around is returned in two segments.
+
+        Returns:
+            tuple: One or two 2D numpy.ndarray views.
+        """
+        if self.total <= self.capacity:
+            return (self.data[:self._next],)
+        return (self.data[self._next:], self.data[:self._next])
+
+    def last(self):
+        """
+        Returns the last committed row.
+
+        Returns:
+            numpy.ndarray: 1D view of the last row, or None if the store is empty.
+        """
+        if self.total == 0:
+            return None
+        return self.data[self._next - 1]
+
+    def to_array(self):
+        """
+        Returns the stored rows, oldest first, as one 2D array. This is a view when the rows
+        are contiguous, a copy only for a circular store that has wrapped around.
+
+        Returns:
+            numpy.ndarray: Array of shape (len(store), len(columns)).
+        """
+        segments = self.segments()
+        if len(segments) == 1:
+            return segments[0]
+        return np.concatenate(segments)
+
+    def to_csv(self, filename, header_rows=None, fmt='%.10g'):
+        """
+        Writes the stored rows to a CSV file, oldest first, without copying them.
+
+        Args:
+            filename (str): Name of the CSV file.
+            header_rows (list, optional): Rows written before the data. Defaults to the column names only.
+            fmt (str, optional): numpy.savetxt format of the values. Defaults to '%.10g'.
+        """
+        if header_rows is None:
+            header_rows = [self.columns]
+        with open(filename, 'w', newline='') as file:
+            for header_row in header_rows:
+                file.write(','.join(str(item) for item in header_row) + '\n')
+            for segment in self.segments():
+                np.savetxt(file, segment, fmt=fmt, delimiter=',')
+
+        print(f"CSV file '{filename}' saved successfully.")
+
+    def to_binary(self, filename):
+        """
+        Writes the stored rows to a raw binary file, oldest first, without copying them.
+        The values are written in native byte order, row after row.
+
+        Args:
+            filename (str): Name of the binary file.
+        """
+        with open(filename, 'wb') as file:
+            for segment in self.segments():
+                segment.tofile(file)
@@ -0,0 +1,226 @@
+"""
+Purpose:
+    Per-channel conversion of pressure sensor voltages to bar.
+
+    Description:
+        A Calibration holds one model per MCC 128 channel and converts whole
+        NumPy blocks of raw voltages to bar in one call, instead of one Python
+        call per value. Three models are supported:
+            - linear: bar = volt * slope + offset
+            - polynomial: bar = c0 + c1 * volt + c2 * volt**2 + ...
+            - table: piecewise linear interpolation in a lookup table of
+              (volt, bar) points measured during calibration
+
+        The models are loaded from a JSON calibration file, by default
+        calibration.json next to this script, e.g.:
+            {
+                "unit": "bar",
+                "channels": {
+                    "0": {"model": "linear", "slope": 50, "offset": 0},
+                    "1": {"model": "polynomial", "coefficients": [0.1, 49.8, 0.02]},
+                    "2": {"model": "table", "volts": [0, 1, 5], "values": [0, 50.5, 250]}
+                }
+            }
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import json
+import os
+import numpy as np
+
+
+################################################
+"""
+Constants
+"""
+
+DEFAULT_CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json')
+
+# Model used for the channels missing from the calibration file, current pressure sensor (RS: 797-4986) nominal conversion
+DEFAULT_MODEL = {'model': 'linear', 'slope': 50, 'offset': 0}
+
+MODELS = ('linear', 'polynomial', 'table')
+
+
+################################################
+"""
+Calibration engine
+"""
+
+class Calibration:
+    """
+    Per-channel volt to bar conversion.
+
+    Args:
+        models (dict): Channel number to model description, see the module docstring.
+        default_model (dict, optional): Model of the channels missing from models. Defaults to DEFAULT_MODEL.
+        unit (str, optional): Unit of the converted values. Defaults to 'bar'.
+
+    Raises:
+        ValueError: Invalid model description.
+    """
+
+    def __init__(self, models, default_model=DEFAULT_MODEL, unit='bar'):
+        self.unit = unit
+        self.default_model = _check_model(default_model)
+        self.models = {int(channel): _check_model(model) for channel, model in models.items()}
+        self._linear_cache = {}
+
+    def model(self, channel):
+        """
+        Returns the model of a channel.
+
+        Args:
+            channel (int): MCC 128 channel.
+
+        Returns:
+            dict: Model description.
+        """
+        return self.models.get(channel, self.default_model)
+
+    def convert(self, volts, channels):
+        """
+        Converts a block of voltages to bar.
+
+        Args:
+            volts (numpy.ndarray or list): Voltages, either one value per channel (shape (len(channels),))
+                or one row per sample and one column per channel (shape (samples, len(channels))).
+            channels (tuple): MCC 128 channel of each column.
+
+        Returns:
+            numpy.ndarray: float64 array of the same shape as volts, in bar.
+        """
+        volts = np.asarray(volts, dtype=np.float64)
+        channels = tuple(channels)
+
+        # All linear: a single multiply-add over the whole block
+        linear = self._linear_coefficients(channels)
+        if linear is not None:
+            slopes, offsets = linear
+            return volts * slopes + offsets
+
+        values = np.empty_like(volts)
+        for i, channel in enumerate(channels):
+            values[..., i] = _apply_model(self.model(channel), volts[..., i])
+        return values
+
+    def convert_channel(self, volt_value, channel):
+        """
+        Converts a single voltage, or a 1D block of voltages of the same channel, to bar.
+
+        Args:
+            volt_value (float or numpy.ndarray): Voltage(s).
+            channel (int): MCC 128 channel.
+
+        Returns:
+            float or numpy.ndarray: Value(s) in bar.
+        """
+        value = _apply_model(self.model(channel), np.asarray(volt_value, dtype=np.float64))
+        return float(value) if value.ndim == 0 else value
+
+    def _linear_coefficients(self, channels):
+        """
+        Returns the slope and offset arrays of the channels if all their models are linear, None otherwise.
+        The arrays are cached per channel tuple.
+        """
+        if channels not in self._linear_cache:
+            models = [self.model(channel) for channel in channels]
+            if all(model['model'] == 'linear' for model in models):
+                self._linear_cache[channels] = (np.array([model['slope'] for model in models], dtype=np.float64),
+                                                np.array([model['offset'] for model in models], dtype=np.float64))
+            else:
+                self._linear_cache[channels] = None
+        return self._linear_cache[channels]
+
+    def to_file(self, filename):
+        """
+        Writes the calibration to a JSON calibration file.
+
+        Args:
+            filename (str): Name of the calibration file.
+        """
+        description = {'unit': self.unit,
+                       'default': self.default_model,
+                       'channels': {str(channel): model for channel, model in sorted(self.models.items())}}
+        with open(filename, 'w') as file:
+            json.dump(description, file, indent=4)
+
+
+def _check_model(model):
+    """
+    Validates a model description and converts its coefficients to numbers or arrays.
+    """
+    kind = model.get('model')
+    if kind == 'linear':
+        return {'model': kind, 'slope': float(model['slope']), 'offset': float(model.get('offset', 0))}
+    if kind == 'polynomial':
+        coefficients = [float(coefficient) for coefficient in model['coefficients']]
+        if not coefficients:
+            raise ValueError('Error: Polynomial calibration model needs at least one coefficient')
+        return {'model': kind, 'coefficients': coefficients}
+    if kind == 'table':
+        volts = [float(volt) for volt in model['volts']]
+        values = [float(value) for value in model['values']]
+        if len(volts) != len(values) or len(volts) < 2:
+            raise ValueError('Error: Table calibration model needs at least 2 (volt, value) points')
+        if any(b <= a for a, b in zip(volts, volts[1:])):
+            raise ValueError('Error: Table calibration model volts must be increasing')
+        return {'model': kind, 'volts': volts, 'values': values}
+    raise ValueError('Error: Unknown calibration model {}, must be one of {}'.format(kind, ', '.join(MODELS)))
+
+
+def _apply_model(model, volts):
+    """
+    Applies a model to an array of voltages.
+    """
+    kind = model['model']
+    if kind == 'linear':
+        return volts * model['slope'] + model['offset']
+    if kind == 'polynomial':
+        # numpy.polyval expects the highest degree first
+        return np.polyval(model['coefficients'][::-1], volts)
+    # Table, values outside the table are extrapolated from the first and last segments
+    table_volts = model['volts']
+    table_values = model['values']
+    values = np.interp(volts, table_volts, table_values)
+    below = volts < table_volts[0]
+    above = volts > table_volts[-1]
+    if np.any(below):
+        slope = (table_values[1] - table_values[0]) / (table_volts[1] - table_volts[0])
+        values = np.where(below, table_values[0] + (volts - table_volts[0]) * slope, values)
+    if np.any(above):
+        slope = (table_values[-1] - table_values[-2]) / (table_volts[-1] - table_volts[-2])
+        values = np.where(above, table_values[-1] + (volts - table_volts[-1]) * slope, values)
+    return values
+
+
+def load_calibration(filename=None):
+    """
+    Loads a calibration from a JSON calibration file.
+
+    Args:
+        filename (str, optional): Name of the calibration file. Defaults to None, DEFAULT_CALIBRATION_FILE is then
+            used if it exists, otherwise every channel gets DEFAULT_MODEL.
+
+    Returns:
+        Calibration: The loaded calibration.
+
+    Raises:
+        ValueError: Invalid calibration file.
+    """
+    if filename is None:
+        filename = DEFAULT_CALIBRATION_FILE
+        if not os.path.exists(filename):
+            return Calibration({})
+
+    with open(filename, 'r') as file:
+        description = json.load(file)
+
+    return Calibration(description.get('channels', {}),
+                       default_model=description.get('default', DEFAULT_MODEL),
+                       unit=description.get('unit', 'bar'))
@@ -0,0 +1,432 @@
+"""
+Purpose:
+    Flicker-free LCD output and throttled terminal output.
+
+    Description:
+        Clearing the 20x4 character LCD and rewriting every field at each update
+        costs milliseconds of 4-bit GPIO bit-banging (clear() alone waits about
+        2 ms) and makes the screen flicker. LCDRenderer keeps a shadow copy of the
+        characters currently on the display and only writes the cells that
+        changed, one cursor move per run of changed cells. Between two updates
+        of the monitoring screen only a few digits change, so a few bytes are
+        sent instead of a clear and 80 characters.
+
+        The screens are described by an LCDLayout, computed once for the number
+        of temperature and pressure channels: every field has a fixed position
+        and width, so the static text never moves and never needs rewriting.
+
+        Printing and flushing every channel of every sample makes the terminal,
+        especially over SSH, the bottleneck of a recording. TerminalRenderer
+        prints on its own thread at a fixed frame rate instead: the sampling
+        loop only hands over its latest values with update(), a single
+        reference assignment, and the thread prints them with the sample
+        count, effective rate and dropped sample counters. Without terminal
+        output (headless mode), no renderer is created at all.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import sys
+import threading
+import time
+
+from daqhats import mcc134
+
+################################################
+"""
+Constants
+"""
+
+LCD_COLS = 20
+LCD_ROWS = 4
+FIELD_WIDTH = 10 # Characters per field, label and value, the last one is a separator
+
+
+################################################
+"""
+Layouts
+"""
+
+class LCDLayout:
+    """
+    Fixed positions and formats of the fields of a screen.
+
+    Args:
+        fields (list): (row, col, label, format_spec) tuples, one per value, in the order of the values
+            given to render(). format_spec is a format() specification of the value, e.g. '.1f'.
+        static (list, optional): (row, col, text) tuples of the text that never changes. Defaults to none.
+        cols (int, optional): Number of columns of the display. Defaults to LCD_COLS.
+        rows (int, optional): Number of rows of the display. Defaults to LCD_ROWS.
+        field_width (int, optional): Width of every field, label included. Defaults to FIELD_WIDTH.
+    """
+
+    def __init__(self, fields, static=(), cols=LCD_COLS, rows=LCD_ROWS, field_width=FIELD_WIDTH):
+        self.cols = cols
+        self.rows = rows
+
+        # Static characters of every row, the values are written over them
+        background = [[' '] * cols for _ in range(rows)]
+        for row, col, text in static:
+            background[row][col:col + len(text)] = list(text)[:cols - col]
+        self.background = [''.join(row) for row in background]
+
+        # (row, col, label, spec, value width) of each field, the value is right-aligned after its label
+        self.fields = []
+        for row, col, label, spec in fields:
+            if row >= rows or col + field_width > cols + 1:
+                raise ValueError('Error: LCD field {} at ({}, {}) is outside of the display'.format(label, row, col))
+            value_width = min(field_width, cols - col) - len(label) - 1
+            self.fields.append((row, col, label, spec, value_width))
+
+    def render(self, values):
+        """
+        Returns the text of every row of the screen.
+
+        Args:
+            values (sequence): One value per field, numbers or strings.
+
+        Returns:
+            list: One string of cols characters per row.
+        """
+        rows = [list(line) for line in self.background]
+        for (row, col, label, spec, value_width), value in zip(self.fields, values):
+            text = value if isinstance(value, str) else format(value, spec)
+            if len(text) > value_width:
+                text = '#' * value_width # Value too wide, never shift the next field
+            cell_text = label + text.rjust(value_width)
+            rows[row][col:col + len(cell_text)] = cell_text
+        return [''.join(row) for row in rows]
+
+
+def monitoring_layout(number_of_T, number_of_P, status='IN>READY', counter=False, cols=LCD_COLS, rows=LCD_ROWS):
+    """
+    Builds the layout of the T and P screen for any number of channels.
+
+    The fields fill the columns of FIELD_WIDTH characters from top to bottom, left column first:
+    T1..Tn, then the hot wall temperature TH, then P1..Pm. The last row holds the status text and,
+    with counter, the measure counter N. With 2 T and 2 P channels on a 20x4 display, this is the
+    layout of LCD_print_in_monitoring() and LCD_print_in_acquisition().
+
+    Args:
+        number_of_T (int): Number of temperature channels.
+        number_of_P (int): Number of pressure channels.
+        status (str, optional): Text of the status field. Defaults to 'IN>READY'.
+        counter (bool, optional): Whether to add the measure counter field N as last value. Defaults to False.
+        cols (int, optional): Number of columns of the display. Defaults to LCD_COLS.
+        rows (int, optional): Number of rows of the display. Defaults to LCD_ROWS.
+
+    Returns:
+        LCDLayout: The layout, its values are T1..Tn, TH, P1..Pm, then N with counter.
+
+    Raises:
+        ValueError: The channels do not fit on the display.
+    """
+    slots_per_column = rows - 1
+    columns = cols // FIELD_WIDTH
+    labels = (['T{}='.format(i + 1) for i in range(number_of_T)] + ['TH='] +
+              ['P{}='.format(i + 1) for i in range(number_of_P)])
+    specs = ['.1f'] * (number_of_T + 1) + ['.2f'] * number_of_P
+
+    if len(labels) > slots_per_column * columns:
+        raise ValueError('Error: {} T and {} P channels do not fit on a {}x{} LCD'.format(
+            number_of_T, number_of_P, cols, rows))
+
+    fields = [(slot % slots_per_column, (slot // slots_per_column) * FIELD_WIDTH, label, spec)
+              for slot, (label, spec) in enumerate(zip(labels, specs))]
+    if counter:
+        fields.append((rows - 1, FIELD_WIDTH, 'N=', '.0f'))
+
+    return LCDLayout(fields, static=[(rows - 1, 0, status)], cols=cols, rows=rows)
+
+
+################################################
+"""
+Renderer
+"""
+
+class LCDRenderer:
+    """
+    Differential writer of a character LCD.
+
+    Typical use:
+        renderer = LCDRenderer(lcd)
+        layout = monitoring_layout(2, 2)
+        renderer.draw(layout.render(T_values + [T_hot_wall] + P_values)) # At each update
+
+    Args:
+        lcd (object): CharLCD object (RPLCD), or any object with cursor_pos, write_string() and clear().
+        cols (int, optional): Number of columns of the display. Defaults to LCD_COLS.
+        rows (int, optional): Number of rows of the display. Defaults to LCD_ROWS.
+    """
+
+    def __init__(self, lcd, cols=LCD_COLS, rows=LCD_ROWS):
+        self.lcd = lcd
+        self.cols = cols
+        self.rows = rows
+        self.shadow = None # Characters on the display, None when unknown
+
+        # Counters
+        self.updates = 0
+        self.cells_written = 0
+        self.cursor_moves = 0
+
+    def invalidate(self):
+        """
+        Forgets the content of the display, the next draw() rewrites every cell.
+        Call it when something else wrote to the LCD.
+        """
+        self.shadow = None
+
+    def clear(self):
+        """
+        Clears the display.
+        """
+        self.lcd.clear()
+        self.shadow = [[' '] * self.cols for _ in range(self.rows)]
+
+    def draw(self, lines):
+        """
+        Writes the cells of lines that differ from the display content.
+
+        Args:
+            lines (list): Text of each row, shorter rows are padded with spaces.
+
+        Returns:
+            int: Number of cells written.
+        """
+        if self.shadow is None:
+            # Unknown content, every cell is written once, no clear() needed
+            self.shadow = [[None] * self.cols for _ in range(self.rows)]
+
+        written = 0
+        for row, line in enumerate(lines[:self.rows]):
+            line = line[:self.cols].ljust(self.cols)
+            shadow_row = self.shadow[row]
+            col = 0
+            while col < self.cols:
+                if line[col] == shadow_row[col]:
+                    col += 1
+                    continue
+                # Run of changed cells. A single unchanged cell inside a run is rewritten,
+                # it costs one data byte, the same as the cursor move it saves
+                end = col + 1
+                while end < self.cols and (line[end] != shadow_row[end] or
+                                           (end + 1 < self.cols and line[end + 1] != shadow_row[end + 1])):
+                    end += 1
+                self.lcd.cursor_pos = (row, col)
+                self.lcd.write_string(line[col:end])
+                shadow_row[col:end] = line[col:end]
+                self.cursor_moves += 1
+                written += end - col
+                col = end
+
+        self.updates += 1
+        self.cells_written += written
+        return written
+
+    def stats(self):
+        """
+        Returns the renderer counters.
+
+        Returns:
+            dict: Number of updates, cells written, cursor moves and mean cells written per update.
+        """
+        return {'updates': self.updates,
+                'cells_written': self.cells_written,
+                'cursor_moves': self.cursor_moves,
+                'mean_cells_per_update': self.cells_written / self.updates if self.updates else 0.0}
+
+
+class LCDScreen:
+    """
+    A layout drawn on an LCD through an LCDRenderer.
+
+    Args:
+        lcd (object): CharLCD object.
+        layout (LCDLayout): Layout of the screen.
+        renderer (LCDRenderer, optional): Renderer of the LCD, shared by the screens displayed on the same LCD.
+            Defaults to None, a renderer is then created.
+    """
+
+    def __init__(self, lcd, layout, renderer=None):
+        self.layout = layout
+        self.renderer = renderer if renderer is not None else LCDRenderer(lcd, layout.cols, layout.rows)
+
+    def show(self, values):
+        """
+        Displays values, only the changed cells are written.
+
+        Args:
+            values (sequence): One value per field of the layout.
+
+        Returns:
+            int: Number of cells written.
+        """
+        return self.renderer.draw(self.layout.render(values))
+
+
+_renderers = {} # id(lcd) -> (lcd, LCDRenderer), one renderer per physical display
+
+
+def get_renderer(lcd):
+    """
+    Returns the renderer of an LCD, created at the first call. All the screens of a display must go through
+    the same renderer, so that its shadow copy matches the display.
+
+    Args:
+        lcd (object): CharLCD object.
+
+    Returns:
+        LCDRenderer: The renderer of this LCD.
+    """
+    entry = _renderers.get(id(lcd))
+    if entry is None or entry[0] is not lcd:
+        entry = (lcd, LCDRenderer(lcd))
+        _renderers[id(lcd)] = entry
+    return entry[1]
+
+
+################################################
+"""
+Terminal
+"""
+
+def format_T_P_header(channels_T, channels_P):
+    """
+    Returns the header line of the T and P values printed by format_T_P().
+
+    Args:
+        channels_T (tuple): MCC 134 channels.
+        channels_P (tuple): MCC 128 channels.
+
+    Returns:
+        str: The header line.
+    """
+    return ''.join(['     Channel Temperature {}'.format(channel) for channel in channels_T] +
+                   ['     Channel Pressure {}'.format(channel) for channel in channels_P])
+
+
+def format_T_P(temperatures, pressures):
+    """
+    Returns the terminal text of a set of T and P values, one fixed-width field per channel.
+
+    Args:
+        temperatures (sequence): Temperatures in Celsius, or MCC 134 error values.
+        pressures (sequence): Pressures in bar.
+
+    Returns:
+        str: The text, without end of line character.
+    """
+    fields = []
+    for value_T in temperatures:
+        if value_T == mcc134.OPEN_TC_VALUE:
+            fields.append('     Open     ')
+        elif value_T == mcc134.OVERRANGE_TC_VALUE:
+            fields.append('     OverRange')
+        elif value_T == mcc134.COMMON_MODE_TC_VALUE:
+            fields.append('   Common Mode')
+        else:
+            fields.append('{:12.2f} C'.format(value_T))
+    for value_P_bar in pressures:
+        fields.append('{:12.2f} bar'.format(value_P_bar))
+    return ''.join(fields)
+
+
+class TerminalRenderer(threading.Thread):
+    """
+    Prints the latest T and P values on one terminal line at a fixed frame rate, from its own thread.
+
+    Typical use:
+        with TerminalRenderer(channels_T, channels_P, fps=10, writer=writer) as terminal:
+            for i in range(N_measures):
+                ... read ...
+                terminal.update(temperatures, pressures, i + 1)
+
+    Args:
+        channels_T (tuple): MCC 134 channels of the temperatures, empty if none.
+        channels_P (tuple): MCC 128 channels of the pressures.
+        fps (float, optional): Number of terminal updates per second. Defaults to 10.
+        writer (CSVWriterThread, optional): Writer whose dropped rows are added to the dropped counter. Defaults to None.
+        stream (file, optional): Output stream. Defaults to sys.stdout.
+        count_label (str, optional): Header of the sample count column. Defaults to 'Samples'.
+    """
+
+    def __init__(self, channels_T, channels_P, fps=10, writer=None, stream=None, count_label='Samples'):
+        threading.Thread.__init__(self, name='TerminalRenderer', daemon=True)
+        self.channels_T = tuple(channels_T)
+        self.channels_P = tuple(channels_P)
+        self.period = 1.0 / fps
+        self.writer = writer
+        self.stream = stream if stream is not None else sys.stdout
+        self.count_label = count_label
+        self.frames = 0
+
+        self._latest = None # (temperatures, pressures, samples, dropped), replaced as a whole by update()
+        self._stop_event = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, temperatures, pressures, samples, dropped=0):
+        """
+        Hands the latest values over to the renderer. Called from the sampling loop, it does no
+        formatting and no output. The sequences given must not be modified afterwards.
+
+        Args:
+            temperatures (sequence): Temperatures in Celsius, empty if none.
+            pressures (sequence): Pressures in bar.
+            samples (int): Number of samples (or frames, see count_label) acquired so far.
+            dropped (int, optional): Number of samples lost so far by the acquisition (missed slots,
+                overruns). Defaults to 0.
+        """
+        self._latest = (temperatures, pressures, samples, dropped)
+
+    def run(self):
+        """
+        Renderer loop: prints the latest values every frame period, only when they changed.
+        """
+        self.stream.write('\n{:>9}'.format(self.count_label) + format_T_P_header(self.channels_T, self.channels_P) +
+                          '        Rate  Dropped\n')
+        last_printed = None
+        last_samples = 0
+        last_time = time.perf_counter()
+        rate = 0.0
+
+        while True:
+            stopping = self._stop_event.wait(self.period)
+            latest = self._latest
+            if latest is not None and latest is not last_printed:
+                temperatures, pressures, samples, dropped = latest
+                now = time.perf_counter()
+                if now > last_time:
+                    rate = (samples - last_samples) / (now - last_time)
+                last_samples, last_time = samples, now
+                if self.writer is not None:
+                    dropped += self.writer.dropped_rows
+
+                self.stream.write('\r{:9d}{}{:9.1f} Hz{:9d}'.format(samples, format_T_P(temperatures, pressures),
+                                                                    rate, dropped))
+                self.stream.flush()
+                self.frames += 1
+                last_printed = latest
+            if stopping:
+                break
+
+        self.stream.write('\n')
+        self.stream.flush()
+
+    def close(self):
+        """
+        Prints the last values and stops the renderer thread.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,192 @@
+"""
+Purpose:
+    Single owner thread for the MCC HATs.
+
+    Description:
+        AcquisitionThread is the only thread that talks to the MCC 128 and
+        MCC 134 boards, so no board is ever accessed from two threads at the
+        same time. It takes a monitoring sample every monitor_period seconds
+        and publishes it as an immutable Snapshot in its latest attribute.
+        Publishing is a single reference assignment, so the display loop and
+        any other reader get the last sample set without a lock and without
+        touching the hardware.
+
+        GPIO trigger callbacks only call trigger(), which stamps the edge with
+        time.perf_counter_ns() and appends it to a deque (thread-safe, no lock
+        held by the caller) before waking the owner thread. The sample itself
+        is taken by the owner thread through the on_trigger handler, so the
+        callback returns within microseconds and is never stuck behind a slow
+        read. The delay between the edge stamp and the end of the read is kept
+        in the latency attribute (see acq_latency.py). Longer jobs, e.g. a
+        whole T_P_acq_csv() recording, are handed over with submit().
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+from daqhats import HatError
+from T_P_acq_func import get_current_T_P
+from acq_latency import LatencyRecorder
+
+
+################################################
+"""
+Data structures
+"""
+
+# Last sample set published by the acquisition thread
+# sequence: number of the snapshot, timestamp: time.perf_counter() at the end of the read,
+# T: temperatures in Celsius, P: pressures in bar, tag: trigger tag or None for a monitoring sample
+Snapshot = namedtuple('Snapshot', ['sequence', 'timestamp', 'T', 'P', 'tag'])
+
+
+################################################
+"""
+Acquisition thread
+"""
+
+class AcquisitionThread(threading.Thread):
+    """
+    Owner thread of the HATs of a session.
+
+    Args:
+        session (HatSession): Open session on the boards, used by this thread only once started.
+        channels_T (tuple): MCC 134 channels read for temperature.
+        channels_P (tuple): MCC 128 channels read for pressure.
+        monitor_period (float, optional): Period in seconds of the monitoring samples. Defaults to 0.1.
+        pressure_alarm (float, optional): Pressure threshold in bar for the safety alarm and system shutdown,
+            checked at every sample. Defaults to 130.
+        on_trigger (callable, optional): Handler of the trigger requests, called by this thread as
+            on_trigger(session, tag, trigger_ns) where trigger_ns is the time.perf_counter_ns() value taken
+            by trigger(). It reads the boards through the session and returns the T + P values it read,
+            which are then published as the latest snapshot, or None. It should record its trigger to
+            sample latency in the latency attribute as soon as the values are read. Defaults to None, a
+            sample is then read with get_current_T_P(), its latency recorded, and published.
+        latency_history (int, optional): Maximum number of trigger latencies kept for the report.
+            Defaults to None (keep all).
+    """
+
+    def __init__(self, session, channels_T, channels_P, monitor_period=0.1, pressure_alarm=130, on_trigger=None,
+                 latency_history=None):
+        threading.Thread.__init__(self, name='AcquisitionThread', daemon=True)
+        self.session = session
+        self.channels_T = tuple(channels_T)
+        self.channels_P = tuple(channels_P)
+        self.monitor_period = monitor_period
+        self.pressure_alarm = pressure_alarm
+        self.on_trigger = on_trigger
+
+        self.latest = None # Last published Snapshot, read without lock
+        self.sequence = 0
+        self.triggers_handled = 0
+        self.jobs_handled = 0
+        self.latency = LatencyRecorder(latency_history) # Trigger to sample latencies
+
+        self._triggers = deque() # (tag, trigger_ns), appended by the trigger callbacks
+        self._jobs = deque() # Callables job(session), appended by submit()
+        self._wakeup = threading.Event()
+        self._running = True
+
+    def trigger(self, tag=None):
+        """
+        Requests a triggered sample. Safe to call from a GPIO callback: it only timestamps the
+        request and queues it, the boards are read by the acquisition thread. Call it first thing
+        in the callback, its timestamp is the reference of the latency measurement.
+
+        Args:
+            tag (optional): Value passed back to on_trigger, e.g. the trigger index. Defaults to None.
+        """
+        self._triggers.append((tag, time.perf_counter_ns()))
+        self._wakeup.set()
+
+    def submit(self, job):
+        """
+        Queues a job to be run by the acquisition thread, which then owns the boards for the
+        whole duration of the job. Monitoring samples are paused meanwhile.
+
+        Args:
+            job (callable): Called as job(session).
+        """
+        self._jobs.append(job)
+        self._wakeup.set()
+
+    def stop(self):
+        """
+        Stops the acquisition thread after the current sample or job and waits for it.
+        Triggers already queued are still read before the thread ends.
+        """
+        self._running = False
+        self._wakeup.set()
+        if self.is_alive():
+            self.join()
+
+    def _publish(self, values, tag=None):
+        number_of_T = len(self.channels_T)
+        self.sequence += 1
+        # A new immutable object is built then published with a single assignment
+        self.latest = Snapshot(self.sequence, time.perf_counter(), tuple(values[:number_of_T]),
+                               tuple(values[number_of_T:]), tag)
+
+    def _read_sample(self):
+        return get_current_T_P(self.session, self.pressure_alarm, self.channels_T, self.channels_P)
+
+    def _handle_triggers(self):
+        while self._triggers:
+            tag, trigger_ns = self._triggers.popleft()
+            if self.on_trigger is not None:
+                values = self.on_trigger(self.session, tag, trigger_ns)
+            else:
+                values = self._read_sample()
+                self.latency.record(trigger_ns, time.perf_counter_ns())
+            if values is not None:
+                self._publish(values, tag)
+            self.triggers_handled += 1
+
+    def run(self):
+        """
+        Owner loop: triggered samples first, then jobs, then a monitoring sample when its deadline is reached.
+        """
+        next_monitor = time.perf_counter()
+
+        while self._running:
+            timeout = next_monitor - time.perf_counter()
+            if timeout > 0:
+                self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+            try:
+                # Triggered samples have priority over everything else
+                self._handle_triggers()
+
+                if self._jobs:
+                    job = self._jobs.popleft()
+                    job(self.session)
+                    self.jobs_handled += 1
+                    self._wakeup.set() # Go through the loop again, triggers may have arrived during the job
+                    next_monitor = time.perf_counter()
+                    continue
+
+                now = time.perf_counter()
+                if now >= next_monitor:
+                    self._publish(self._read_sample())
+                    next_monitor += self.monitor_period
+                    if next_monitor < now:
+                        # Monitoring fell behind (long trigger burst), restart the grid from now
+                        next_monitor = now + self.monitor_period
+
+            except (HatError, ValueError) as error:
+                # Keep the thread alive, the next sample may succeed
+                print('\n', error)
+
+        # Triggers received before stop() are not lost
+        try:
+            self._handle_triggers()
+        except (HatError, ValueError) as error:
+            print('\n', error)
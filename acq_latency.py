@@ -0,0 +1,122 @@
+"""
+Purpose:
+    Measure the delay between a trigger edge and the sample it produced.
+
+    Description:
+        Each trigger is stamped with time.perf_counter_ns() when the GPIO
+        callback is entered, and again when the T and P values of its sample
+        have been read. LatencyRecorder keeps the difference of the two stamps
+        for every trigger and reports the p50, p95, p99 and max latency and a
+        text histogram at the end of the session. This quantifies how well the
+        sensor data lines up with the frames of the synchronisation box.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+from collections import deque
+import numpy as np
+
+
+################################################
+"""
+Constants
+"""
+
+# Upper edges of the histogram bins in microseconds, the last bin takes everything above
+HISTOGRAM_BINS_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+HISTOGRAM_WIDTH = 40 # Number of characters of the longest histogram bar
+
+
+################################################
+"""
+Latency recorder
+"""
+
+class LatencyRecorder:
+    """
+    Trigger to sample latency statistics.
+
+    Typical use:
+        latency = LatencyRecorder()
+        ...
+        latency.record(trigger_ns, sample_ns) # For each trigger
+        ...
+        latency.print_report()
+
+    Args:
+        history (int, optional): Maximum number of latencies kept for the statistics, the oldest
+            ones are dropped first. Defaults to None (keep all).
+    """
+
+    def __init__(self, history=None):
+        self.latencies = deque(maxlen=history) # In nanoseconds
+        self.count = 0
+
+    def record(self, trigger_ns, sample_ns):
+        """
+        Records the latency of one trigger.
+
+        Args:
+            trigger_ns (int): time.perf_counter_ns() at the entry of the trigger callback.
+            sample_ns (int): time.perf_counter_ns() when the sample of this trigger was read.
+        """
+        self.latencies.append(sample_ns - trigger_ns)
+        self.count += 1
+
+    def stats(self):
+        """
+        Computes the latency statistics over the kept history.
+
+        Returns:
+            dict: Number of triggers recorded, and p50, p95, p99 and max latency in seconds.
+        """
+        if not self.latencies:
+            return {'count': self.count, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+
+        latencies = np.asarray(self.latencies, dtype=np.float64) * 1e-9
+        p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+
+        return {'count': self.count,
+                'p50': float(p50),
+                'p95': float(p95),
+                'p99': float(p99),
+                'max': float(latencies.max())}
+
+    def histogram(self):
+        """
+        Counts the kept latencies in the bins of HISTOGRAM_BINS_US.
+
+        Returns:
+            list: (label, count) tuples, one per bin.
+        """
+        edges = np.asarray(HISTOGRAM_BINS_US, dtype=np.float64) * 1e3 # In nanoseconds
+        counts = np.bincount(np.searchsorted(edges, np.asarray(self.latencies, dtype=np.float64), side='left'),
+                             minlength=len(edges) + 1)
+
+        labels = ['<= {} us'.format(edge) for edge in HISTOGRAM_BINS_US]
+        labels.append('> {} us'.format(HISTOGRAM_BINS_US[-1]))
+        return list(zip(labels, counts.tolist()))
+
+    def print_report(self, title='Trigger to sample latency'):
+        """
+        Prints the latency statistics and histogram in the terminal.
+
+        Args:
+            title (str, optional): First line of the report. Defaults to 'Trigger to sample latency'.
+        """
+        stats = self.stats()
+        print('\n{}: {} triggers'.format(title, stats['count']))
+        if not self.latencies:
+            return
+        print('p50 {:.3f} ms, p95 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms'.format(
+            stats['p50'] * 1e3, stats['p95'] * 1e3, stats['p99'] * 1e3, stats['max'] * 1e3))
+
+        histogram = self.histogram()
+        largest = max(count for label, count in histogram)
+        for label, count in histogram:
+            bar = '#' * int(round(HISTOGRAM_WIDTH * count / largest)) if largest else ''
+            print('{:>12} {:8d} {}'.format(label, count, bar))
@@ -0,0 +1,328 @@
+"""
+Purpose:
+    Monitor T and P with the acquisition, terminal, LCD and alarm each running at its own rate.
+
+    Description:
+        T_P_disp() reads, prints and redraws the LCD in the same loop, so a
+        slow HD44780 redraw (RPLCD bit-bangs the GPIO pins) caps the read rate.
+        AsyncMonitor splits this loop into asyncio tasks:
+            - acquisition: reads the boards at acquisition_rate, temperatures at
+              temperature_rate (the MCC 134 only updates its values once per
+              second), and publishes the latest Snapshot. The reads block, so
+              they run paced by a DeadlineScheduler in a dedicated thread,
+              which is the only one touching the boards. With an
+              AcquisitionThread (see acq_engine.py), its snapshots are used instead.
+            - terminal: prints the latest snapshot at terminal_rate.
+            - LCD: redraws the latest snapshot at lcd_rate, in its own thread.
+              A redraw still running when the next one is due is skipped.
+            - alarm: evaluates, at alarm_rate, the block of all pressures read
+              since the previous check with the alarm engine of the session (see
+              acq_alarm.py), so a short peak between two checks is not missed.
+        The tasks only share the latest snapshot, published with a single
+        reference assignment, so a 1 Hz LCD never slows a 1 kHz pressure stream.
+        A board read error stops all the tasks, as the alarm can no longer be
+        evaluated, and is raised again by run().
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sys import stdout
+
+from daqhats import HatError
+from T_P_acq_func import HatSession #T_P_acq_func needs to be in the same folders as this script
+from acq_engine import Snapshot #acq_engine needs to be in the same folders as this script
+from acq_scheduler import DeadlineScheduler #acq_scheduler needs to be in the same folders as this script
+from acq_display import LCDScreen, get_renderer, monitoring_layout, format_T_P, format_T_P_header #acq_display needs to be in the same folders as this script
+
+
+################################################
+"""
+Monitor
+"""
+
+class AsyncMonitor:
+    """
+    Asyncio T and P monitor.
+
+    Typical use:
+        monitor = AsyncMonitor(session=session, lcd=lcd, acquisition_rate=1000, lcd_rate=1)
+        asyncio.run(monitor.run()) # Or run_monitor(...), until Ctrl-C
+
+    Args:
+        channels_T (tuple, optional): MCC 134 channels read for temperature. Defaults to (0, 1).
+        channels_P (tuple, optional): MCC 128 channels read for pressure. Defaults to (0, 1).
+        session (HatSession, optional): Open session on the boards. Defaults to None, a new session is then opened,
+            unless engine is given.
+        engine (AcquisitionThread, optional): Acquisition thread owning the boards. If given, its snapshots are
+            displayed, no board is read by the monitor and the pressure alarm is left to the acquisition thread.
+            Defaults to None.
+        lcd (object, optional): CharLCD object. Defaults to None (no LCD output).
+        T_hot_wall (float, optional): Hot wall temperature in Celsius displayed on the LCD. Defaults to 50.
+        acquisition_rate (float, optional): Pressure read rate in Hz. Defaults to 10.
+        temperature_rate (float, optional): Temperature read rate in Hz. Defaults to 1.
+        terminal_rate (float, optional): Terminal refresh rate in Hz. Defaults to 2.
+        lcd_rate (float, optional): LCD refresh rate in Hz. Defaults to 1.
+        alarm_rate (float, optional): Pressure alarm check rate in Hz. Defaults to 20.
+        alarm_on (bool, optional): Whether to activate the safety alarm. Defaults to True.
+        pressure_alarm (float, optional): Pressure alarm threshold in bar. Defaults to 130.
+        terminal_output (bool, optional): Whether to display terminal output. Defaults to True.
+    """
+
+    def __init__(self, channels_T=(0, 1), channels_P=(0, 1), session=None, engine=None, lcd=None, T_hot_wall=50,
+                 acquisition_rate=10, temperature_rate=1, terminal_rate=2, lcd_rate=1, alarm_rate=20,
+                 alarm_on=True, pressure_alarm=130, terminal_output=True):
+        self.channels_T = tuple(channels_T)
+        self.channels_P = tuple(channels_P)
+        self.engine = engine
+        if engine is not None:
+            session = engine.session
+        elif session is None:
+            session = HatSession(self.channels_T, self.channels_P)
+        self.session = session
+        self.lcd = lcd
+        self.T_hot_wall = T_hot_wall
+        self.acquisition_rate = acquisition_rate
+        self.temperature_rate = temperature_rate
+        self.terminal_rate = terminal_rate
+        self.lcd_rate = lcd_rate
+        self.alarm_rate = alarm_rate
+        self.alarm_on = alarm_on
+        self.pressure_alarm = pressure_alarm
+        self.terminal_output = terminal_output
+        self.lcd_screen = None
+        if lcd is not None:
+            self.lcd_screen = LCDScreen(lcd, monitoring_layout(len(self.channels_T), len(self.channels_P)),
+                                        renderer=get_renderer(lcd))
+
+        self.latest = None # Last published Snapshot, read without lock
+        self.alarm = None
+        self.scheduler = None
+
+        # Task counters
+        self.terminal_updates = 0
+        self.lcd_updates = 0
+        self.lcd_skipped = 0
+        self.alarm_checks = 0
+
+        self._pending_P = [] # Pressures read since the last alarm check
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._start_time = None
+        self.error = None # Board read error that stopped the monitor
+
+    def current(self):
+        """
+        Returns the latest snapshot, the one of the acquisition thread if there is one.
+
+        Returns:
+            Snapshot: The latest snapshot, or None before the first read.
+        """
+        if self.engine is not None:
+            return self.engine.latest
+        return self.latest
+
+    def _acquisition_loop(self):
+        """
+        Blocking read loop, run in the acquisition thread until stop or a read error.
+        """
+        session = self.session
+        temperature_period = 1.0 / self.temperature_rate
+        temperatures = ()
+        next_temperature = time.perf_counter()
+        sequence = 0
+
+        self.scheduler = DeadlineScheduler(self.acquisition_rate, history=10000)
+        while not self._stop.is_set():
+            self.scheduler.wait()
+
+            try:
+                # Temperatures are sampled then held until the next temperature read
+                now = time.perf_counter()
+                if now >= next_temperature:
+                    temperatures = tuple(session.read_temperatures(self.channels_T).tolist())
+                    next_temperature = now + temperature_period
+
+                # From the MCC 128, or from the safety watchdog if one is attached to the session
+                pressures = tuple(session.read_pressures(self.channels_P).tolist())
+            except (HatError, ValueError) as error:
+                # Without pressures the alarm is blind: stop all the tasks, run() raises the error
+                print('\nError: monitor stopped,', error)
+                self.error = error
+                self._stop.set()
+                return
+
+            if self.alarm is not None:
+                with self._pending_lock:
+                    self._pending_P.append(pressures)
+
+            sequence += 1
+            self.latest = Snapshot(sequence, time.perf_counter(), temperatures, pressures, None)
+
+    async def _acquisition_task(self, loop, executor):
+        await loop.run_in_executor(executor, self._acquisition_loop)
+
+    async def _every(self, rate):
+        """
+        Async generator pacing a task on absolute deadlines of the event loop clock.
+        """
+        loop = asyncio.get_running_loop()
+        period = 1.0 / rate
+        deadline = loop.time()
+        while not self._stop.is_set():
+            yield
+            deadline += period
+            delay = deadline - loop.time()
+            if delay < 0:
+                # Late task, restart the grid instead of running back to back
+                deadline = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def _terminal_task(self):
+        last_sequence = None
+        async for _ in self._every(self.terminal_rate):
+            snapshot = self.current()
+            if snapshot is None or snapshot.sequence == last_sequence:
+                continue
+            last_sequence = snapshot.sequence
+            print(format_T_P(snapshot.T, snapshot.P), end='\r')
+            stdout.flush()
+            self.terminal_updates += 1
+
+    def _redraw_lcd(self, snapshot):
+        # Only the changed characters are written, see acq_display.py
+        self.lcd_screen.show(snapshot.T + (self.T_hot_wall,) + snapshot.P)
+
+    async def _lcd_task(self, loop, executor):
+        redraw = None
+        last_sequence = None
+        async for _ in self._every(self.lcd_rate):
+            if redraw is not None and not redraw.done():
+                # The LCD is slower than lcd_rate, skip this refresh rather than queueing redraws
+                self.lcd_skipped += 1
+                continue
+            snapshot = self.current()
+            if snapshot is None or not snapshot.T or snapshot.sequence == last_sequence:
+                continue
+            last_sequence = snapshot.sequence
+            redraw = loop.run_in_executor(executor, self._redraw_lcd, snapshot)
+            self.lcd_updates += 1
+        if redraw is not None:
+            await redraw
+
+    async def _alarm_task(self):
+        async for _ in self._every(self.alarm_rate):
+            with self._pending_lock:
+                block, self._pending_P = self._pending_P, []
+            self.alarm_checks += 1
+            if not block:
+                # No new sample since the last check, keep the current state
+                continue
+            # The pins are only written when the alarm state changes
+            self.alarm.evaluate(block)
+
+    async def run(self, duration=None):
+        """
+        Runs the monitor tasks.
+
+        Args:
+            duration (float, optional): Run time in seconds. Defaults to None (until cancelled or Ctrl-C).
+
+        Raises:
+            HatError: A board read failed, the monitor stopped.
+            ValueError: A pressure could not be read or converted, the monitor stopped.
+        """
+        loop = asyncio.get_running_loop()
+        acquisition_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='monitor_acquisition')
+        lcd_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='monitor_lcd')
+        self._stop.clear()
+        self.error = None
+        self._start_time = time.perf_counter()
+
+        tasks = []
+        if self.engine is None:
+            if self.alarm_on:
+                # None if a safety watchdog owns the alarm pins
+                self.alarm = self.session.get_alarm(self.pressure_alarm)
+            tasks.append(asyncio.ensure_future(self._acquisition_task(loop, acquisition_executor)))
+            if self.alarm is not None:
+                tasks.append(asyncio.ensure_future(self._alarm_task()))
+        if self.terminal_output:
+            print(format_T_P_header(self.channels_T, self.channels_P))
+            tasks.append(asyncio.ensure_future(self._terminal_task()))
+        if self.lcd is not None:
+            tasks.append(asyncio.ensure_future(self._lcd_task(loop, lcd_executor)))
+
+        try:
+            if duration is None:
+                await asyncio.gather(*tasks)
+            elif tasks:
+                # All the tasks end early on a read error
+                await asyncio.wait(tasks, timeout=duration)
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            # The acquisition and LCD threads finish their current read or redraw, then stop
+            self._stop.set()
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            acquisition_executor.shutdown(wait=True)
+            lcd_executor.shutdown(wait=True)
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """
+        Returns the task counters.
+
+        Returns:
+            dict: Samples read and effective acquisition rate (0 when an acquisition thread is used),
+            terminal and LCD updates, skipped LCD redraws, alarm checks and run time in seconds.
+        """
+        scheduler_stats = self.scheduler.stats() if self.scheduler is not None else {'samples': 0, 'effective_rate': 0.0}
+        run_time = time.perf_counter() - self._start_time if self._start_time is not None else 0.0
+        return {'samples': scheduler_stats['samples'],
+                'effective_rate': scheduler_stats['effective_rate'],
+                'terminal_updates': self.terminal_updates,
+                'lcd_updates': self.lcd_updates,
+                'lcd_skipped': self.lcd_skipped,
+                'alarm_checks': self.alarm_checks,
+                'run_time': run_time}
+
+    def print_report(self):
+        """
+        Prints the task counters in the terminal.
+        """
+        stats = self.stats()
+        print('\nMonitor report: {:.1f} s, {} samples at {:.3f} Hz, {} terminal updates, {} LCD updates '
+              '({} skipped), {} alarm checks'.format(stats['run_time'], stats['samples'], stats['effective_rate'],
+                                                     stats['terminal_updates'], stats['lcd_updates'],
+                                                     stats['lcd_skipped'], stats['alarm_checks']))
+
+
+def run_monitor(**kwargs):
+    """
+    Creates an AsyncMonitor and runs it until Ctrl-C, then prints its report.
+    The KeyboardInterrupt is handled by the calling script.
+
+    Args:
+        **kwargs: AsyncMonitor arguments.
+    """
+    monitor = AsyncMonitor(**kwargs)
+    try:
+        asyncio.run(monitor.run())
+    finally:
+        if monitor.terminal_output:
+            monitor.print_report()
+            if monitor.alarm is not None:
+                monitor.alarm.print_report()
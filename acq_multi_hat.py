@@ -0,0 +1,351 @@
+"""
+Purpose:
+    Synchronous acquisition of N MCC 128 boards, with MCC 134 temperatures on the same time base.
+
+    Description:
+        MultiHatStream generalises mcc128/multi_hat_synchronous_scan.py to any
+        number of MCC 128 boards. The first board is the master: it generates
+        the scan clock on its CLK terminal (and waits for its TRIG input if a
+        trigger mode is given), the other boards are started first with the
+        EXTCLOCK option and sample on this clock. The CLK terminals of all the
+        MCC 128 must be wired together.
+
+        Each board returns its own interleaved buffer. read() collects them,
+        merges the rows present on every board into one block, converts the
+        volts to bar with the calibration of each board and returns it with
+        named columns: N_measure, Time (k / actual scan rate from the first
+        sample, from the hardware clock), one pressure column per channel of
+        each board, then one temperature column per MCC 134 channel.
+
+        The MCC 134 cannot be scanned, its values are only updated once per
+        second. It is polled on its own thread (TemperaturePoller, see
+        acq_temperature.py), each reading stamped with time.perf_counter_ns().
+        The first sample of the scan is also located on this clock, so the
+        readings are aligned on the time of each row, by sample and hold or
+        linear interpolation.
+
+        The merged blocks are recorded and displayed by T_P_acq_multi(), with
+        the same CSV writer, binary recording, terminal renderer and pressure
+        alarm as T_P_acq_scan().
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import time
+import numpy as np
+
+from daqhats import hat_list, mcc128, mcc134, OptionFlags, HatIDs, HatError, TcTypes, AnalogInputMode, AnalogInputRange
+from daqhats_utils import chan_list_to_mask, validate_channels, input_mode_to_string, input_range_to_string, \
+PollBackoff #daqhats_utils needs to be in the same folders as this script
+from T_P_acq_func import READ_ALL_AVAILABLE, pressure_alarm_engine #T_P_acq_func needs to be in the same folders as this script
+from acq_calibration import Calibration, load_calibration #acq_calibration needs to be in the same folders as this script
+from acq_writer import CSVWriterThread, FSYNC_CLOSE #acq_writer needs to be in the same folders as this script
+from acq_binary import BinaryWriterThread #acq_binary needs to be in the same folders as this script
+from acq_display import TerminalRenderer #acq_display needs to be in the same folders as this script
+from acq_temperature import TemperaturePoller, MCC134_UPDATE_INTERVAL, ALIGN_HOLD #acq_temperature needs to be in the same folders as this script
+
+
+################################################
+"""
+Multi HAT stream
+"""
+
+class MultiHatStream:
+    """
+    Merged, timestamped stream of N synchronised MCC 128 boards and one optional MCC 134.
+
+    Typical use:
+        with MultiHatStream([(0, 1), (0, 1, 2)], scan_rate=1000, channels_134=(0, 1)) as stream:
+            print(stream.column_names)
+            while True:
+                block = stream.read() # None when no new row
+                ...
+
+    Args:
+        channels_128 (list): Channel tuple of each MCC 128, the first one is the master.
+        scan_rate (float): Requested scan rate in Hz, per channel.
+        addresses_128 (list, optional): Address of each MCC 128. Defaults to None, the MCC 128 found are then used
+            in order of address.
+        input_mode (AnalogInputMode, optional): Analog input mode of all MCC 128. Defaults to AnalogInputMode.SE.
+        input_range (AnalogInputRange, optional): Analog input range of all MCC 128. Defaults to AnalogInputRange.BIP_5V.
+        calibrations (list, optional): Calibration, or calibration file name, of each MCC 128. Defaults to None,
+            calibration.json next to this script is then used for all boards.
+        channels_134 (tuple, optional): MCC 134 channels read for temperature. Defaults to () (no temperature).
+        address_134 (int, optional): Address of the MCC 134. Defaults to None, the first MCC 134 found is then used.
+        tc_type (TcTypes, optional): Thermocouple type of the MCC 134 channels. Defaults to TcTypes.TYPE_K.
+        temperature_interval (float, optional): Period of the MCC 134 readings in seconds. Defaults to MCC134_UPDATE_INTERVAL.
+        temperature_alignment (str, optional): ALIGN_HOLD, each row gets the last reading before it, or ALIGN_LINEAR,
+            interpolated between the readings around it. Rows more recent than the last reading are held.
+            Defaults to ALIGN_HOLD.
+        trigger_mode (TriggerModes, optional): Trigger mode of the master TRIG input. Defaults to None (start at once).
+        buffer_seconds (float, optional): Size of the board buffers in seconds of scan. Defaults to 10.
+
+    Raises:
+        HatError: A board is not found.
+        ValueError: Invalid channel selection.
+    """
+
+    def __init__(self, channels_128, scan_rate, addresses_128=None, input_mode=AnalogInputMode.SE,
+                 input_range=AnalogInputRange.BIP_5V, calibrations=None, channels_134=(), address_134=None,
+                 tc_type=TcTypes.TYPE_K, temperature_interval=MCC134_UPDATE_INTERVAL,
+                 temperature_alignment=ALIGN_HOLD, trigger_mode=None, buffer_seconds=10):
+        self.channels_128 = [tuple(channels) for channels in channels_128]
+        number_of_boards = len(self.channels_128)
+        if number_of_boards == 0:
+            raise ValueError('Error: At least one MCC 128 is needed')
+
+        # MCC 128 boards, the first one is the master
+        if addresses_128 is None:
+            found = sorted(hat.address for hat in hat_list(filter_by_id=HatIDs.MCC_128))
+            if len(found) < number_of_boards:
+                raise HatError(0, 'Error: {} MCC 128 HATs requested - found {}'.format(number_of_boards, len(found)))
+            addresses_128 = found[:number_of_boards]
+        self.addresses_128 = list(addresses_128)
+        self.hats = [mcc128(address) for address in self.addresses_128]
+        for hat, channels in zip(self.hats, self.channels_128):
+            validate_channels(set(channels), hat.info().NUM_AI_CHANNELS[input_mode])
+            hat.a_in_mode_write(input_mode)
+            hat.a_in_range_write(input_range)
+        self.input_mode = input_mode
+        self.input_range = input_range
+
+        # One calibration per board, the channel numbers of each board are converted with its own models
+        if calibrations is None:
+            calibrations = [load_calibration()] * number_of_boards
+        self.calibrations = [calibration if isinstance(calibration, Calibration) else load_calibration(calibration)
+                             for calibration in calibrations]
+
+        # MCC 134, polled by its own thread once the stream is started
+        self.channels_134 = tuple(channels_134)
+        self.hat_134 = None
+        if self.channels_134:
+            if address_134 is None:
+                found = [hat.address for hat in hat_list(filter_by_id=HatIDs.MCC_134)]
+                if not found:
+                    raise HatError(0, 'Error: No MCC 134 HAT found')
+                address_134 = found[0]
+            self.hat_134 = mcc134(address_134)
+            for channel in self.channels_134:
+                self.hat_134.tc_type_write(channel, tc_type)
+        self.temperature_interval = temperature_interval
+        self.temperature_alignment = temperature_alignment
+        self.temperature_poller = None
+
+        self.scan_rate = scan_rate
+        self.actual_scan_rate = self.hats[0].a_in_scan_actual_rate(len(self.channels_128[0]), scan_rate)
+        self.trigger_mode = trigger_mode
+        self.buffer_samples = max(int(buffer_seconds * self.actual_scan_rate), 1000)
+
+        # Column names of the merged blocks, and labels of the pressure channels as board.channel
+        self.pressure_labels = ['{}.{}'.format(board, channel)
+                                for board, channels in enumerate(self.channels_128) for channel in channels]
+        self.column_names = (['N_measure', 'Time'] +
+                             ['Pressure {}'.format(label) for label in self.pressure_labels] +
+                             ['Temperature {}'.format(channel) for channel in self.channels_134])
+        self.number_of_P = len(self.pressure_labels)
+        self.number_of_T = len(self.channels_134)
+
+        self.samples = 0 # Rows returned by read()
+        self.running = False
+        self._pending = [np.empty((0, len(channels))) for channels in self.channels_128] # Rows not yet on every board
+        self._first_sample_ns = None # time.perf_counter_ns() of the first scan, located at the first read
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """
+        Starts the scans: the other boards first, waiting for the clock, then the master.
+        """
+        if self.hat_134 is not None:
+            # First reading taken here, before the first sample
+            self.temperature_poller = TemperaturePoller(self.hat_134, self.channels_134, self.temperature_interval)
+            self.temperature_poller.start()
+        master_options = OptionFlags.CONTINUOUS
+        if self.trigger_mode is not None:
+            self.hats[0].trigger_mode(self.trigger_mode)
+            master_options |= OptionFlags.EXTTRIGGER
+        for hat, channels in reversed(list(zip(self.hats, self.channels_128))):
+            options = master_options if hat is self.hats[0] else OptionFlags.CONTINUOUS | OptionFlags.EXTCLOCK
+            hat.a_in_scan_start(chan_list_to_mask(list(channels)), self.buffer_samples, self.scan_rate, options)
+        self.running = True
+
+    def stop(self):
+        """
+        Stops the scans and frees the board buffers.
+        """
+        self.running = False
+        for hat in self.hats:
+            hat.a_in_scan_stop()
+            hat.a_in_scan_cleanup()
+        if self.temperature_poller is not None:
+            self.temperature_poller.stop()
+            self.temperature_poller = None
+
+    def read(self):
+        """
+        Reads every board without waiting and returns the rows now available on all of them.
+
+        Returns:
+            numpy.ndarray: Merged block, one row per scan, columns as in column_names. None if no new row.
+
+        Raises:
+            HatError: Hardware or buffer overrun on a board, the boards are then no longer synchronous.
+        """
+        read_ns = time.perf_counter_ns()
+        master_rows = 0
+        for board, hat in enumerate(self.hats):
+            read_result = hat.a_in_scan_read(READ_ALL_AVAILABLE, 0)
+            if read_result.hardware_overrun or read_result.buffer_overrun:
+                raise HatError(self.addresses_128[board], 'Error: {} overrun'.format(
+                    'Hardware' if read_result.hardware_overrun else 'Buffer'))
+            number_of_channels = len(self.channels_128[board])
+            rows = len(read_result.data) // number_of_channels
+            if rows:
+                new = np.asarray(read_result.data).reshape(rows, number_of_channels)
+                self._pending[board] = np.concatenate((self._pending[board], new)) if len(self._pending[board]) else new
+            if board == 0:
+                master_rows = rows
+
+        # First scan located on the perf_counter clock: the last master row is about the read time
+        if self._first_sample_ns is None and master_rows:
+            self._first_sample_ns = read_ns - int((master_rows - 1) * 1e9 / self.actual_scan_rate)
+
+        rows = min(len(pending) for pending in self._pending)
+        if rows == 0:
+            return None
+
+        block = np.empty((rows, 2 + self.number_of_P + self.number_of_T))
+        block[:, 0] = np.arange(self.samples, self.samples + rows)
+        block[:, 1] = block[:, 0] / self.actual_scan_rate
+        column = 2
+        for board, channels in enumerate(self.channels_128):
+            block[:, column:column + len(channels)] = self.calibrations[board].convert(self._pending[board][:rows], channels)
+            self._pending[board] = self._pending[board][rows:]
+            column += len(channels)
+
+        if self.temperature_poller is not None:
+            # Readings aligned on the time of each row
+            block[:, column:] = self.temperature_poller.at(self._first_sample_ns + block[:, 1] * 1e9,
+                                                           self.temperature_alignment)
+
+        self.samples += rows
+        return block
+
+    def __str__(self):
+        return ('{} MCC 128 at addresses {} ({}, {}), channels {}, scan rate {:.3f} Hz | MCC 134 channels {}'.format(
+            len(self.hats), self.addresses_128, input_mode_to_string(self.input_mode),
+            input_range_to_string(self.input_range), self.channels_128, self.actual_scan_rate, self.channels_134))
+
+
+################################################
+"""
+Recording and display
+"""
+
+def T_P_acq_multi(stream, N_measures=None, terminal_output=True, data_filename="data_multi.csv", binary_filename=None,
+                  alarm_on=True, pressure_alarm=130, fsync=FSYNC_CLOSE, binary_dtype='float64', terminal_fps=10):
+    """
+    Records the merged blocks of a MultiHatStream to a CSV file and optionally to a binary file, and displays
+    the last values of each block in the terminal. The pressure alarm is checked over every block.
+
+    Args:
+        stream (MultiHatStream): Stream, not started yet.
+        N_measures (int, optional): Number of rows to record. Defaults to None (until Ctrl-C).
+        terminal_output (bool, optional): Whether to display terminal output. Defaults to True.
+        data_filename (str, optional): Name of the data CSV file, None to skip the CSV file. Defaults to "data_multi.csv".
+        binary_filename (str, optional): Name of the binary recording file, None to skip the binary file. Defaults to None.
+        alarm_on (bool, optional): Whether to activate the safety alarm. Defaults to True.
+        pressure_alarm (float, optional): Pressure alarm threshold in bar. Defaults to 130.
+        fsync (str, optional): fsync policy of the CSV writer. Defaults to FSYNC_CLOSE.
+        binary_dtype (str, optional): Data type of the binary recording, 'float32' or 'float64'. Defaults to 'float64'.
+        terminal_fps (float, optional): Terminal refresh rate in Hz. Defaults to 10.
+
+    Returns:
+        int: Number of rows recorded.
+    """
+    import datetime
+
+    csv_writer = None
+    binary_record = None
+    terminal = None
+    number_of_P = stream.number_of_P
+
+    formatted_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    acquisition_params = ["Date and time", formatted_datetime, "Number of measures: ", N_measures,
+                          "Requested scan rate: ", stream.scan_rate, "Hz", "Actual scan rate: ", stream.actual_scan_rate, "Hz",
+                          "MCC 128 addresses: ", ' '.join(str(address) for address in stream.addresses_128)]
+
+    try:
+        if data_filename is not None:
+            csv_writer = CSVWriterThread(data_filename, [acquisition_params, stream.column_names], fsync=fsync)
+            csv_writer.start()
+        if binary_filename is not None:
+            binary_record = BinaryWriterThread(binary_filename, stream.column_names, dtype=binary_dtype,
+                                               metadata={'date_and_time': formatted_datetime, 'number_of_measures': N_measures,
+                                                         'requested_scan_rate': stream.scan_rate,
+                                                         'actual_scan_rate': stream.actual_scan_rate,
+                                                         'addresses_128': stream.addresses_128,
+                                                         'input_mode': input_mode_to_string(stream.input_mode),
+                                                         'input_range': input_range_to_string(stream.input_range)})
+            binary_record.start()
+        alarm = pressure_alarm_engine(pressure_alarm) if alarm_on else None
+
+        if terminal_output:
+            print('\nAcquiring data from', stream, '... Press Ctrl-C to abort')
+            print('\nDate and time:', formatted_datetime)
+            terminal = TerminalRenderer(stream.channels_134, stream.pressure_labels, fps=terminal_fps, writer=csv_writer)
+            terminal.start()
+
+        stream.start()
+        backoff = PollBackoff(min_interval=0.001, max_interval=0.01) # Waits between empty reads, bounded by 10 ms
+
+        while N_measures is None or stream.samples < N_measures:
+            block = stream.read()
+            if block is None:
+                backoff.sleep()
+                continue
+            backoff.reset()
+            if N_measures is not None:
+                block = block[:N_measures - int(block[0, 0])]
+
+            # Pressure alarm check over the whole block, all boards together
+            if alarm is not None:
+                alarm.evaluate(block[:, 2:2 + number_of_P])
+
+            if csv_writer is not None:
+                csv_writer.write_rows(block.tolist())
+            if binary_record is not None:
+                binary_record.write_block(block)
+
+            # The block is not modified afterwards, the renderer only keeps a reference to its last row
+            if terminal is not None:
+                terminal.update(block[-1, 2 + number_of_P:], block[-1, 2:2 + number_of_P], int(block[-1, 0]) + 1)
+
+        if csv_writer is not None:
+            csv_writer.close()
+            if terminal_output:
+                csv_writer.print_report()
+
+        return min(stream.samples, N_measures) if N_measures is not None else stream.samples
+
+    except (HatError, ValueError) as error:
+        print('\n', error)
+
+    finally:
+        if terminal is not None:
+            terminal.close()
+        if stream.running:
+            stream.stop()
+        if csv_writer is not None:
+            csv_writer.close()
+        if binary_record is not None:
+            binary_record.close()
@@ -0,0 +1,139 @@
+"""
+Purpose:
+    Drift-free timing of software-timed acquisition loops.
+
+    Description:
+        A loop that does its work and then calls sleep(1/frequency) runs
+        slower than requested, because the read, print and write time of
+        each cycle adds up to the sleep. DeadlineScheduler instead computes
+        an absolute deadline for every sample from a monotonic clock
+        (time.perf_counter), so a late cycle does not shift the following
+        ones. Slots that are missed completely are either caught up or
+        counted as missed, the actual start time of every sample is
+        recorded and jitter statistics can be reported at the end of the run.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import time
+from collections import deque
+import numpy as np
+
+
+################################################
+"""
+Scheduler
+"""
+
+class DeadlineScheduler:
+    """
+    Paces a loop on absolute monotonic deadlines t0 + k / frequency.
+
+    Typical use:
+        scheduler = DeadlineScheduler(acq_frequency)
+        for i in range(N_measures):
+            scheduler.wait()
+            ... read, print, write ...
+        scheduler.print_report()
+
+    Args:
+        frequency (float): Loop frequency in Hz.
+        catch_up (bool, optional): What to do when one or more deadlines are already past.
+            If True, the missed slots are run back to back without sleeping until the loop
+            is on time again, so the number of samples per second is preserved.
+            If False, the missed slots are skipped and counted in missed_slots,
+            so the samples stay on the time grid. Defaults to False.
+        history (int, optional): Maximum number of timestamps kept for the statistics, the oldest
+            ones are dropped first. Use it for loops that never end. Defaults to None (keep all).
+    """
+
+    def __init__(self, frequency, catch_up=False, history=None):
+        if frequency <= 0:
+            raise ValueError('Error: Scheduler frequency must be positive')
+        self.period = 1.0 / frequency
+        self.catch_up = catch_up
+        self.history = history
+        self.start()
+        self.start_time = None
+
+    def start(self):
+        """
+        Sets the first deadline to now. Called automatically by the first wait().
+        """
+        self.start_time = time.perf_counter()
+        self.slot = 0
+        self.samples = 0
+        self.missed_slots = 0
+        self.timestamps = deque(maxlen=self.history) # Actual start time of each sample, in seconds from the first deadline
+        self.lateness = deque(maxlen=self.history) # Delay between the deadline and the actual start of each sample, in seconds
+
+    def wait(self):
+        """
+        Sleeps until the deadline of the next sample and records its timestamp.
+
+        Returns:
+            float: The actual start time of the sample, in seconds from the first deadline.
+        """
+        if self.start_time is None:
+            self.start()
+
+        deadline = self.start_time + self.slot * self.period
+        now = time.perf_counter()
+
+        if now < deadline:
+            time.sleep(deadline - now)
+            now = time.perf_counter()
+        elif not self.catch_up:
+            # Skip every slot whose deadline is already over, keep only the current one
+            late_slots = int((now - deadline) / self.period)
+            if late_slots > 0:
+                self.missed_slots += late_slots
+                self.slot += late_slots
+                deadline += late_slots * self.period
+
+        relative_time = now - self.start_time
+        self.timestamps.append(relative_time)
+        self.lateness.append(now - deadline)
+        self.slot += 1
+        self.samples += 1
+
+        return relative_time
+
+    def stats(self):
+        """
+        Computes the jitter statistics of the samples recorded so far.
+        Rate and lateness are computed over the kept history only.
+
+        Returns:
+            dict: Number of samples, number of missed slots, effective rate in Hz,
+            and mean, p99 and max lateness of the samples in seconds.
+        """
+        kept = len(self.timestamps)
+        if kept == 0:
+            return {'samples': 0, 'missed_slots': self.missed_slots, 'effective_rate': 0.0,
+                    'mean_lateness': 0.0, 'p99_lateness': 0.0, 'max_lateness': 0.0}
+
+        lateness = np.asarray(self.lateness)
+        duration = self.timestamps[-1] - self.timestamps[0]
+        effective_rate = (kept - 1) / duration if duration > 0 else 0.0
+
+        return {'samples': self.samples,
+                'missed_slots': self.missed_slots,
+                'effective_rate': effective_rate,
+                'mean_lateness': float(lateness.mean()),
+                'p99_lateness': float(np.percentile(lateness, 99)),
+                'max_lateness': float(lateness.max())}
+
+    def print_report(self):
+        """
+        Prints the jitter statistics of the run in the terminal.
+        """
+        stats = self.stats()
+        print('\nTiming report: {} samples, {} missed slots, requested rate {:.3f} Hz, effective rate {:.3f} Hz'.format(
+            stats['samples'], stats['missed_slots'], 1.0 / self.period, stats['effective_rate']))
+        print('Lateness: mean {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms'.format(
+            stats['mean_lateness'] * 1e3, stats['p99_lateness'] * 1e3, stats['max_lateness'] * 1e3))
@@ -0,0 +1,604 @@
+"""
+Purpose:
+    Shared memory ring buffers publishing the acquisition to other processes.
+
+    Description:
+        WatchdogBuffer holds the pressures in bar scanned by the safety
+        watchdog process (see safety_watchdog.py) and the state of the
+        watchdog: alarm and shutdown, trips, overruns, reaction latency.
+        TemperatureBuffer holds the temperatures read by the TemperaturePoller
+        (see acq_temperature.py) and the hot wall temperature of the run.
+
+        Each buffer has a single writer, which never takes a lock: a sequence
+        counter is odd while it writes, the readers copy the data and retry if
+        it changed in the meantime (read_consistent()).
+
+        Other processes, e.g. the live dashboard (T_P_dashboard.py), attach to
+        the buffers by name and never touch the boards. This module imports
+        neither the boards nor the GPIO pins, so attaching to a buffer has no
+        effect on the alarm and shutdown pins driven by the watchdog.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+
+################################################
+"""
+Constants
+"""
+
+WATCHDOG_BUFFER_NAME = 'tp_safety_watchdog' # Default name of the shared memory block
+MAX_CHANNELS = 8 # MCC 128 single ended channels
+
+# Status of the watchdog process
+STATUS_STARTING, STATUS_RUNNING, STATUS_STOPPED, STATUS_FAILED = 0, 1, 2, 3
+STATUS_NAMES = ('starting', 'running', 'stopped', 'failed')
+
+# Scheduling obtained by the watchdog process
+POLICY_NORMAL, POLICY_NICE, POLICY_FIFO = 0, 1, 2
+POLICY_NAMES = ('normal', 'nice', 'SCHED_FIFO')
+
+# Integer header fields
+(SEQUENCE, SAMPLES, CHANNELS, CAPACITY, STATUS, HEARTBEAT_NS, SHUTDOWN, BLOCKS, TRIPS, OVERRUNS,
+ LATENCY_LAST_NS, LATENCY_MAX_NS, LATENCY_TOTAL_NS, POLICY, LAST_READ_NS) = range(15)
+HEADER_FIELDS = 16
+# Float header fields
+SCAN_RATE, THRESHOLD = range(2)
+PARAMETER_FIELDS = 4
+
+TEMPERATURE_BUFFER_NAME = 'tp_temperatures' # Default name of the shared memory block of the temperatures
+MAX_TC_CHANNELS = 4 # MCC 134 thermocouple channels
+TEMPERATURE_HEADER_FIELDS = 4 # SEQUENCE, SAMPLES (readings), CHANNELS, CAPACITY
+# Float header fields of the temperature buffer
+INTERVAL, HOT_WALL = range(2)
+TEMPERATURE_PARAMETER_FIELDS = 2
+
+
+################################################
+"""
+Attachment and consistent reads
+"""
+
+def attach_memory(name):
+    """
+    Attaches to an existing shared memory block without registering it with the resource tracker of this process.
+    Before Python 3.13, attaching registers the block, and the tracker removes it when this process exits while
+    its owner still uses it.
+
+    Args:
+        name (str): Name of the shared memory block.
+
+    Returns:
+        multiprocessing.shared_memory.SharedMemory: The block.
+
+    Raises:
+        FileNotFoundError: No shared memory block with this name.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13 and later
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+
+def read_consistent(header, copy):
+    """
+    Copies data written by another process under a sequence counter, retrying until no write happened during the copy.
+
+    Args:
+        header (numpy.ndarray): Integer header of the buffer, header[SEQUENCE] is odd while a write is in progress.
+        copy (callable): Function without arguments returning a copy of the data.
+
+    Returns:
+        The result of the last call of copy().
+    """
+    while True:
+        sequence = int(header[SEQUENCE])
+        if sequence & 1:
+            time.sleep(0)
+            continue
+        result = copy()
+        if int(header[SEQUENCE]) == sequence:
+            return result
+
+################################################
+"""
+Shared memory buffer
+"""
+
+class WatchdogBuffer:
+    """
+    Shared memory ring buffer of the pressures scanned by the watchdog.
+
+    Layout: integer header, float parameters, MCC 128 channel numbers, then a ring of capacity rows
+    of pressures in bar, one column per channel. Row k of the scan is stored in ring row k % capacity.
+    The sequence counter is odd while the watchdog writes a block.
+
+    Typical use in another process:
+        buffer = WatchdogBuffer.attach()
+        samples, pressures = buffer.latest()
+        samples, block, read_ns = buffer.read_since(samples) # Later, the rows scanned since
+
+    Use create() or attach() rather than the constructor.
+    """
+
+    def __init__(self, memory, owner):
+        self.memory = memory
+        self.owner = owner
+        self.name = memory.name
+
+        header_bytes = HEADER_FIELDS * 8
+        parameter_bytes = PARAMETER_FIELDS * 8
+        channel_bytes = MAX_CHANNELS * 8
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        self.parameters = np.ndarray((PARAMETER_FIELDS,), dtype=np.float64, buffer=memory.buf, offset=header_bytes)
+        channel_table = np.ndarray((MAX_CHANNELS,), dtype=np.int64, buffer=memory.buf,
+                                   offset=header_bytes + parameter_bytes)
+        number_of_channels = int(self.header[CHANNELS])
+        self.capacity = int(self.header[CAPACITY])
+        self.channels = tuple(channel_table[:number_of_channels].tolist())
+        self.ring = np.ndarray((self.capacity, number_of_channels), dtype=np.float64, buffer=memory.buf,
+                               offset=header_bytes + parameter_bytes + channel_bytes)
+        self._columns = {channel: column for column, channel in enumerate(self.channels)}
+
+    @classmethod
+    def create(cls, channels, capacity, scan_rate, threshold, name=WATCHDOG_BUFFER_NAME):
+        """
+        Creates the shared memory block. A block left by a watchdog that was killed is replaced.
+
+        Args:
+            channels (tuple): MCC 128 channels scanned by the watchdog.
+            capacity (int): Number of rows of the ring.
+            scan_rate (float): Scan rate in Hz.
+            threshold (float): Pressure shutdown threshold in bar.
+            name (str, optional): Name of the shared memory block. Defaults to WATCHDOG_BUFFER_NAME.
+
+        Returns:
+            WatchdogBuffer: The buffer, owned by the caller, who unlinks it with close().
+        """
+        channels = tuple(channels)
+        if not 0 < len(channels) <= MAX_CHANNELS:
+            raise ValueError('Error: Invalid number of watchdog channels')
+        size = (HEADER_FIELDS + PARAMETER_FIELDS + MAX_CHANNELS + capacity * len(channels)) * 8
+        try:
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        header[:] = 0
+        header[CHANNELS] = len(channels)
+        header[CAPACITY] = capacity
+        parameters = np.ndarray((PARAMETER_FIELDS,), dtype=np.float64, buffer=memory.buf, offset=HEADER_FIELDS * 8)
+        parameters[:] = 0
+        parameters[SCAN_RATE] = scan_rate
+        parameters[THRESHOLD] = threshold
+        channel_table = np.ndarray((MAX_CHANNELS,), dtype=np.int64, buffer=memory.buf,
+                                   offset=(HEADER_FIELDS + PARAMETER_FIELDS) * 8)
+        channel_table[:] = -1
+        channel_table[:len(channels)] = channels
+        del header, parameters, channel_table # Views must be released before the memory can be closed
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name=WATCHDOG_BUFFER_NAME):
+        """
+        Attaches to the buffer of a running watchdog.
+
+        Args:
+            name (str, optional): Name of the shared memory block. Defaults to WATCHDOG_BUFFER_NAME.
+
+        Returns:
+            WatchdogBuffer: The buffer, read only by convention.
+
+        Raises:
+            FileNotFoundError: No watchdog buffer with this name.
+        """
+        return cls(attach_memory(name), owner=False)
+
+    def __reduce__(self):
+        # A process started with the spawn method attaches by name
+        return (WatchdogBuffer.attach, (self.name,))
+
+    ### Watchdog side, never blocks
+
+    def write_block(self, pressures, read_ns):
+        """
+        Appends a block of pressures to the ring. Called by the watchdog process only.
+
+        Args:
+            pressures (numpy.ndarray): One row per scan, one column per channel, in bar.
+            read_ns (int): time.perf_counter_ns() of the scan read that returned the block.
+        """
+        samples = int(self.header[SAMPLES])
+        rows = pressures[-self.capacity:]
+        first = (samples + len(pressures) - len(rows)) % self.capacity
+        count = len(rows)
+
+        self.header[SEQUENCE] += 1 # Odd: write in progress
+        end = min(first + count, self.capacity)
+        self.ring[first:end] = rows[:end - first]
+        self.ring[:count - (end - first)] = rows[end - first:]
+        self.header[SAMPLES] = samples + len(pressures)
+        self.header[LAST_READ_NS] = read_ns # Dates the rows, unlike the heartbeat also set by empty reads
+        self.header[SEQUENCE] += 1
+
+    def record_block(self, latency_ns, shutdown, trips, heartbeat_ns):
+        """
+        Publishes the state of the watchdog after a block. Called by the watchdog process only.
+        """
+        self.header[BLOCKS] += 1
+        self.header[LATENCY_LAST_NS] = latency_ns
+        self.header[LATENCY_TOTAL_NS] += latency_ns
+        if latency_ns > self.header[LATENCY_MAX_NS]:
+            self.header[LATENCY_MAX_NS] = latency_ns
+        self.header[SHUTDOWN] = shutdown
+        self.header[TRIPS] = trips
+        self.header[HEARTBEAT_NS] = heartbeat_ns
+
+    ### Reader side, never blocks the watchdog
+
+    def _read(self, copy):
+        return read_consistent(self.header, copy)
+
+    def latest(self, channels=None):
+        """
+        Returns the last scanned pressures.
+
+        Args:
+            channels (tuple, optional): MCC 128 channels, in the requested order. Defaults to None (all scanned channels).
+
+        Returns:
+            tuple: Number of rows scanned so far, and numpy.ndarray of pressures in bar (None before the first block).
+
+        Raises:
+            ValueError: A channel is not scanned by the watchdog.
+        """
+        columns = self.columns(channels)
+
+        def copy():
+            samples = int(self.header[SAMPLES])
+            if samples == 0:
+                return 0, None
+            return samples, self.ring[(samples - 1) % self.capacity, columns]
+        return self._read(copy)
+
+    def read_since(self, samples_seen, channels=None):
+        """
+        Returns the rows scanned since a previous read. Rows already overwritten in the ring are skipped.
+
+        Args:
+            samples_seen (int): Number of rows scanned at the previous read, 0 for all rows still in the ring.
+            channels (tuple, optional): MCC 128 channels, in the requested order. Defaults to None (all scanned channels).
+
+        Returns:
+            tuple: Number of rows scanned so far, to pass to the next call, numpy.ndarray of the new rows,
+            one column per channel, and time.perf_counter_ns() of the scan read of the last row (0 before the
+            first block).
+            Row k of the scan is at time k / scan_rate from the start of the scan.
+        """
+        columns = self.columns(channels)
+
+        def copy():
+            samples = int(self.header[SAMPLES])
+            first = max(samples_seen, samples - self.capacity)
+            indexes = np.arange(first, samples) % self.capacity
+            return samples, self.ring[indexes][:, columns], int(self.header[LAST_READ_NS])
+        return self._read(copy)
+
+    def columns(self, channels=None):
+        """
+        Returns the ring columns of MCC 128 channels.
+
+        Args:
+            channels (tuple, optional): MCC 128 channels. Defaults to None (all scanned channels).
+
+        Returns:
+            list: Column of each channel.
+
+        Raises:
+            ValueError: A channel is not scanned by the watchdog.
+        """
+        if channels is None:
+            return list(range(len(self.channels)))
+        try:
+            return [self._columns[channel] for channel in channels]
+        except KeyError:
+            raise ValueError('Error: MCC 128 channels {} are not all scanned by the safety watchdog {}'.format(
+                tuple(channels), self.channels))
+
+    @property
+    def status(self):
+        """
+        int: STATUS_STARTING, STATUS_RUNNING, STATUS_STOPPED or STATUS_FAILED.
+        """
+        return int(self.header[STATUS])
+
+    @property
+    def scan_rate(self):
+        """
+        float: Actual scan rate of the watchdog in Hz.
+        """
+        return float(self.parameters[SCAN_RATE])
+
+    @property
+    def threshold(self):
+        """
+        float: Pressure shutdown threshold in bar.
+        """
+        return float(self.parameters[THRESHOLD])
+
+    def heartbeat_age(self):
+        """
+        Returns the time since the last scan read of the watchdog.
+
+        Returns:
+            float: Age in seconds, or None before the first read.
+        """
+        heartbeat_ns = int(self.header[HEARTBEAT_NS])
+        if heartbeat_ns == 0:
+            return None
+        return (time.perf_counter_ns() - heartbeat_ns) * 1e-9
+
+    def stats(self):
+        """
+        Returns the state of the watchdog.
+
+        Returns:
+            dict: Status, scheduling policy, rows scanned, blocks, shutdown state, trips, overruns,
+            last, mean and max reaction latency in seconds.
+        """
+        header = self.header.copy()
+        blocks = int(header[BLOCKS])
+        return {'status': STATUS_NAMES[header[STATUS]],
+                'policy': POLICY_NAMES[header[POLICY]],
+                'samples': int(header[SAMPLES]),
+                'blocks': blocks,
+                'shutdown': bool(header[SHUTDOWN]),
+                'trips': int(header[TRIPS]),
+                'overruns': int(header[OVERRUNS]),
+                'latency_last': header[LATENCY_LAST_NS] * 1e-9,
+                'latency_mean': header[LATENCY_TOTAL_NS] / blocks * 1e-9 if blocks else 0.0,
+                'latency_max': header[LATENCY_MAX_NS] * 1e-9}
+
+    def close(self):
+        """
+        Detaches from the buffer, and removes it if it is owned by this process.
+        """
+        # Views must be released before the memory can be closed
+        self.header = self.parameters = self.ring = None
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                # Already removed, e.g. by the resource tracker of a process that attached to it
+                resource_tracker.unregister(self.memory._name, 'shared_memory')
+
+
+class TemperatureBuffer:
+    """
+    Shared memory ring buffer of the temperatures read by the TemperaturePoller.
+
+    Layout: integer header, float parameters, MCC 134 channel numbers, then a ring of capacity reading times
+    (time.perf_counter_ns(), the same clock in all processes) and a ring of capacity rows of temperatures in Celsius
+    (or MCC 134 error values), one column per channel.
+
+    Typical use in another process:
+        buffer = TemperatureBuffer.attach()
+        readings, times_ns, temperatures = buffer.read_since(0)
+
+    Use create() or attach() rather than the constructor.
+    """
+
+    def __init__(self, memory, owner):
+        self.memory = memory
+        self.owner = owner
+        self.name = memory.name
+
+        header_bytes = TEMPERATURE_HEADER_FIELDS * 8
+        parameter_bytes = TEMPERATURE_PARAMETER_FIELDS * 8
+        channel_bytes = MAX_TC_CHANNELS * 8
+        self.header = np.ndarray((TEMPERATURE_HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        self.parameters = np.ndarray((TEMPERATURE_PARAMETER_FIELDS,), dtype=np.float64, buffer=memory.buf,
+                                     offset=header_bytes)
+        channel_table = np.ndarray((MAX_TC_CHANNELS,), dtype=np.int64, buffer=memory.buf,
+                                   offset=header_bytes + parameter_bytes)
+        number_of_channels = int(self.header[CHANNELS])
+        self.capacity = int(self.header[CAPACITY])
+        self.channels = tuple(channel_table[:number_of_channels].tolist())
+        offset = header_bytes + parameter_bytes + channel_bytes
+        self.times = np.ndarray((self.capacity,), dtype=np.int64, buffer=memory.buf, offset=offset)
+        self.ring = np.ndarray((self.capacity, number_of_channels), dtype=np.float64, buffer=memory.buf,
+                               offset=offset + self.capacity * 8)
+        self._columns = {channel: column for column, channel in enumerate(self.channels)}
+
+    @classmethod
+    def create(cls, channels, capacity, interval, T_hot_wall=None, name=TEMPERATURE_BUFFER_NAME):
+        """
+        Creates the shared memory block. A block left by a process that was killed is replaced.
+
+        Args:
+            channels (tuple): MCC 134 channels read by the poller.
+            capacity (int): Number of readings kept.
+            interval (float): Period of the readings in seconds.
+            T_hot_wall (float, optional): Hot wall temperature of the run in Celsius. Defaults to None (unknown).
+            name (str, optional): Name of the shared memory block. Defaults to TEMPERATURE_BUFFER_NAME.
+
+        Returns:
+            TemperatureBuffer: The buffer, owned by the caller, who unlinks it with close().
+        """
+        channels = tuple(channels)
+        if not 0 < len(channels) <= MAX_TC_CHANNELS:
+            raise ValueError('Error: Invalid number of temperature channels')
+        size = (TEMPERATURE_HEADER_FIELDS + TEMPERATURE_PARAMETER_FIELDS + MAX_TC_CHANNELS
+                + capacity * (1 + len(channels))) * 8
+        try:
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((TEMPERATURE_HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        header[:] = 0
+        header[CHANNELS] = len(channels)
+        header[CAPACITY] = capacity
+        parameters = np.ndarray((TEMPERATURE_PARAMETER_FIELDS,), dtype=np.float64, buffer=memory.buf,
+                                offset=TEMPERATURE_HEADER_FIELDS * 8)
+        parameters[INTERVAL] = interval
+        parameters[HOT_WALL] = np.nan if T_hot_wall is None else T_hot_wall
+        channel_table = np.ndarray((MAX_TC_CHANNELS,), dtype=np.int64, buffer=memory.buf,
+                                   offset=(TEMPERATURE_HEADER_FIELDS + TEMPERATURE_PARAMETER_FIELDS) * 8)
+        channel_table[:] = -1
+        channel_table[:len(channels)] = channels
+        del header, parameters, channel_table # Views must be released before the memory can be closed
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name=TEMPERATURE_BUFFER_NAME):
+        """
+        Attaches to the buffer of a running temperature poller.
+
+        Args:
+            name (str, optional): Name of the shared memory block. Defaults to TEMPERATURE_BUFFER_NAME.
+
+        Returns:
+            TemperatureBuffer: The buffer, read only by convention.
+
+        Raises:
+            FileNotFoundError: No temperature buffer with this name.
+        """
+        return cls(attach_memory(name), owner=False)
+
+    def __reduce__(self):
+        # A process started with the spawn method attaches by name
+        return (TemperatureBuffer.attach, (self.name,))
+
+    ### Poller side, never blocks
+
+    def write(self, time_ns, temperatures):
+        """
+        Appends a reading to the ring. Called by the temperature poller only.
+
+        Args:
+            time_ns (int): time.perf_counter_ns() of the reading.
+            temperatures (numpy.ndarray): Temperature of each channel in Celsius, or MCC 134 error values.
+        """
+        readings = int(self.header[SAMPLES])
+        row = readings % self.capacity
+        self.header[SEQUENCE] += 1 # Odd: write in progress
+        self.times[row] = time_ns
+        self.ring[row] = temperatures
+        self.header[SAMPLES] = readings + 1
+        self.header[SEQUENCE] += 1
+
+    ### Reader side, never blocks the poller
+
+    def latest(self, channels=None):
+        """
+        Returns the last temperatures read.
+
+        Args:
+            channels (tuple, optional): MCC 134 channels, in the requested order. Defaults to None (all channels).
+
+        Returns:
+            tuple: Number of readings so far, time.perf_counter_ns() of the last one and numpy.ndarray of
+            temperatures in Celsius (None before the first reading).
+
+        Raises:
+            ValueError: A channel is not read by the poller.
+        """
+        columns = self.columns(channels)
+
+        def copy():
+            readings = int(self.header[SAMPLES])
+            if readings == 0:
+                return 0, None, None
+            row = (readings - 1) % self.capacity
+            return readings, int(self.times[row]), self.ring[row, columns]
+        return read_consistent(self.header, copy)
+
+    def read_since(self, readings_seen, channels=None):
+        """
+        Returns the readings since a previous read. Readings already overwritten in the ring are skipped.
+
+        Args:
+            readings_seen (int): Number of readings at the previous read, 0 for all readings still in the ring.
+            channels (tuple, optional): MCC 134 channels, in the requested order. Defaults to None (all channels).
+
+        Returns:
+            tuple: Number of readings so far, to pass to the next call, numpy.ndarray of their
+            time.perf_counter_ns() and numpy.ndarray of the new temperatures, one column per channel.
+        """
+        columns = self.columns(channels)
+
+        def copy():
+            readings = int(self.header[SAMPLES])
+            first = max(readings_seen, readings - self.capacity)
+            indexes = np.arange(first, readings) % self.capacity
+            return readings, self.times[indexes], self.ring[indexes][:, columns]
+        return read_consistent(self.header, copy)
+
+    def columns(self, channels=None):
+        """
+        Returns the ring columns of MCC 134 channels.
+
+        Args:
+            channels (tuple, optional): MCC 134 channels. Defaults to None (all channels).
+
+        Returns:
+            list: Column of each channel.
+
+        Raises:
+            ValueError: A channel is not read by the poller.
+        """
+        if channels is None:
+            return list(range(len(self.channels)))
+        try:
+            return [self._columns[channel] for channel in channels]
+        except KeyError:
+            raise ValueError('Error: MCC 134 channels {} are not all published {}'.format(
+                tuple(channels), self.channels))
+
+    @property
+    def interval(self):
+        """
+        float: Period of the readings in seconds.
+        """
+        return float(self.parameters[INTERVAL])
+
+    @property
+    def T_hot_wall(self):
+        """
+        float: Hot wall temperature of the run in Celsius, None if unknown.
+        """
+        value = float(self.parameters[HOT_WALL])
+        return None if np.isnan(value) else value
+
+    def close(self):
+        """
+        Detaches from the buffer, and removes it if it is owned by this process.
+        """
+        # Views must be released before the memory can be closed
+        self.header = self.parameters = self.times = self.ring = None
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                # Already removed, e.g. by the resource tracker of a process that attached to it
+                resource_tracker.unregister(self.memory._name, 'shared_memory')
@@ -0,0 +1,222 @@
+"""
+Purpose:
+    Poll the MCC 134 thermocouples on their own thread and align them on the pressure samples.
+
+    Description:
+        The MCC 134 only updates its thermocouple values about once per second,
+        and each t_in_read() call takes time, so reading the temperatures at
+        every pressure sample caps the pressure rate for nothing (the CSV files
+        show the same temperature for many consecutive rows).
+
+        TemperaturePoller reads all the thermocouple channels once per update
+        interval from its own thread, the only one touching the MCC 134 once
+        started. Each reading is stamped with time.perf_counter_ns() and kept
+        in a short history; the latest one is published with a single reference
+        assignment, so readers never wait for a conversion. A failed reading
+        (HatError) is counted and the poller keeps polling; age() tells how old
+        the last reading is, and latest_values() can replace readings older
+        than max_age by NaN, so stale temperatures are never recorded as new.
+
+        align_temperatures() joins the readings onto the timeline of the
+        pressure samples, by sample and hold (last reading at or before each
+        sample) or by linear interpolation between the two readings around each
+        sample. The MCC 134 error values (open thermocouple, over range, common
+        mode) are never interpolated, they are held.
+
+        With a TemperatureBuffer (see acq_shared.py), every reading is also
+        published in shared memory, for other processes such as the live
+        dashboard, which then never read the MCC 134.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from daqhats import mcc134, HatError
+
+
+################################################
+"""
+Constants
+"""
+
+MCC134_UPDATE_INTERVAL = 1.0 # Seconds between two updates of the MCC 134 thermocouple values
+STALE_INTERVALS = 3 # Readings older than this number of intervals are stale
+ALIGN_HOLD = 'hold'
+ALIGN_LINEAR = 'linear'
+TC_ERROR_VALUES = (mcc134.OPEN_TC_VALUE, mcc134.OVERRANGE_TC_VALUE, mcc134.COMMON_MODE_TC_VALUE)
+
+
+################################################
+"""
+Alignment
+"""
+
+def align_temperatures(readings_ns, readings, times_ns, mode=ALIGN_HOLD):
+    """
+    Aligns temperature readings onto sample times.
+
+    Args:
+        readings_ns (numpy.ndarray): time.perf_counter_ns() of each reading, increasing.
+        readings (numpy.ndarray): One row per reading, one column per channel.
+        times_ns (numpy.ndarray): Sample times on the same clock.
+        mode (str, optional): ALIGN_HOLD, the last reading at or before each sample, or ALIGN_LINEAR, interpolated
+            between the readings around each sample. Samples before the first reading get the first reading,
+            samples after the last one get the last one. Defaults to ALIGN_HOLD.
+
+    Returns:
+        numpy.ndarray: One row per sample, one column per channel.
+    """
+    readings_ns = np.asarray(readings_ns, dtype=np.float64)
+    readings = np.asarray(readings, dtype=np.float64)
+    times_ns = np.asarray(times_ns, dtype=np.float64)
+
+    index = np.maximum(np.searchsorted(readings_ns, times_ns, side='right') - 1, 0)
+    held = readings[index]
+    if mode == ALIGN_HOLD or len(readings_ns) < 2:
+        return held
+    if mode != ALIGN_LINEAR:
+        raise ValueError('Error: Unknown temperature alignment {}'.format(mode))
+
+    # Interpolation between readings index and index + 1, only inside the range of the readings
+    after = np.minimum(index + 1, len(readings_ns) - 1)
+    span = readings_ns[after] - readings_ns[index]
+    weight = np.where(span > 0, (times_ns - readings_ns[index]) / np.where(span > 0, span, 1), 0.0)
+    weight = np.clip(weight, 0.0, 1.0)[:, np.newaxis]
+    interpolated = held + weight * (readings[after] - held)
+
+    # Error values are held, never mixed with a temperature
+    error = np.isin(held, TC_ERROR_VALUES) | np.isin(readings[after], TC_ERROR_VALUES)
+    return np.where(error, held, interpolated)
+
+
+################################################
+"""
+Temperature poller
+"""
+
+class TemperaturePoller(threading.Thread):
+    """
+    Reads the MCC 134 thermocouples at their update interval and caches the latest values.
+
+    Typical use:
+        poller = TemperaturePoller(hat_134, (0, 1))
+        poller.start()
+        temperatures = poller.latest_values() # Never waits for a conversion
+        ...
+        poller.stop()
+
+    Args:
+        hat_134 (mcc134): MCC 134 board, used by this thread only once started.
+        channels (tuple): Thermocouple channels.
+        interval (float, optional): Period of the readings in seconds. Defaults to MCC134_UPDATE_INTERVAL.
+        history (int, optional): Number of readings kept for the alignment. Defaults to 64.
+        buffer (TemperatureBuffer, optional): Shared memory buffer each reading is published in, written by the
+            poller only. Defaults to None (not published).
+    """
+
+    def __init__(self, hat_134, channels, interval=MCC134_UPDATE_INTERVAL, history=64, buffer=None):
+        threading.Thread.__init__(self, name='TemperaturePoller', daemon=True)
+        self.hat_134 = hat_134
+        self.channels = tuple(channels)
+        self.interval = interval
+        self.readings = 0
+        self.errors = 0 # Failed readings, the previous values are kept
+        self.last_error = None
+        self.buffer = buffer
+
+        self._history = deque(maxlen=history) # (time.perf_counter_ns(), values) of the last readings
+        self._stop_event = threading.Event()
+        self.latest = None # Last (time.perf_counter_ns(), values), read without lock
+
+        # First reading before start(), so the cache is never empty
+        self._read()
+
+    def _read(self):
+        values = np.array([self.hat_134.t_in_read(channel) for channel in self.channels])
+        reading = (time.perf_counter_ns(), values)
+        self._history.append(reading)
+        self.latest = reading
+        self.readings += 1
+        if self.buffer is not None:
+            self.buffer.write(*reading)
+
+    def run(self):
+        # Readings at t0 + k * interval, whatever the time spent reading
+        deadline = time.perf_counter()
+        while True:
+            deadline += self.interval
+            if self._stop_event.wait(max(deadline - time.perf_counter(), 0)):
+                break
+            try:
+                self._read()
+            except HatError as error:
+                # Board or bus error, try again at the next deadline. The age of the cache tells readers it is stale
+                self.errors += 1
+                self.last_error = error
+
+    def stop(self):
+        """
+        Stops the poller thread after its current reading.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def age(self):
+        """
+        Returns the time since the last successful reading.
+
+        Returns:
+            float: Age in seconds.
+        """
+        return (time.perf_counter_ns() - self.latest[0]) * 1e-9
+
+    def latest_values(self, channels=None, max_age=None):
+        """
+        Returns the last temperatures read, without waiting.
+
+        Args:
+            channels (tuple, optional): Channels, in the requested order. Defaults to None (all channels of the poller).
+            max_age (float, optional): Maximum age in seconds of the reading, NaN is returned for an older one,
+                e.g. when the poller can no longer read the MCC 134. Defaults to None (no limit).
+
+        Returns:
+            numpy.ndarray: Temperatures in Celsius, MCC 134 error values, or NaN if the reading is stale.
+
+        Raises:
+            ValueError: A channel is not polled.
+        """
+        reading_ns, values = self.latest
+        if channels is not None and tuple(channels) != self.channels:
+            try:
+                values = values[[self.channels.index(channel) for channel in channels]]
+            except ValueError:
+                raise ValueError('Error: MCC 134 channels {} are not all polled {}'.format(tuple(channels),
+                                                                                          self.channels))
+        if max_age is not None and (time.perf_counter_ns() - reading_ns) * 1e-9 > max_age:
+            return np.full(values.shape, np.nan)
+        return values
+
+    def at(self, times_ns, mode=ALIGN_HOLD):
+        """
+        Aligns the kept readings onto sample times, see align_temperatures().
+
+        Args:
+            times_ns (numpy.ndarray): Sample times, on the time.perf_counter_ns() clock.
+            mode (str, optional): ALIGN_HOLD or ALIGN_LINEAR. Defaults to ALIGN_HOLD.
+
+        Returns:
+            numpy.ndarray: One row per sample, one column per channel.
+        """
+        history = list(self._history) # Snapshot, the poller thread may append meanwhile
+        readings_ns = [stamp for stamp, values in history]
+        readings = [values for stamp, values in history]
+        return align_temperatures(readings_ns, readings, times_ns, mode)
@@ -0,0 +1,108 @@
+"""
+Purpose:
+    Wait for GPIO trigger edges without spinning.
+
+    Description:
+        EdgeWaiter registers a GPIO event callback on a pin and hands every
+        edge over to the waiting thread through a condition variable. The
+        waiting thread sleeps in the kernel until the callback notifies it,
+        so an idle script uses no CPU, unlike a `while True: pass` loop, and
+        wakes up as soon as the edge is detected. Every edge is stamped with
+        time.perf_counter_ns() in the callback and the delay until the waiting
+        thread wakes up is kept in a LatencyRecorder (see acq_latency.py).
+
+        RPi.GPIO.wait_for_edge() would also sleep, but it cannot be combined
+        with the event callbacks already registered by the trigger scripts,
+        and it loses the edges arriving while the thread is busy. Here the
+        edges are counted by the callback and none is lost.
+
+        For status polling of the MCC HATs, see PollBackoff and
+        wait_for_trigger() in daqhats_utils.py.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import threading
+import time
+from collections import deque
+import RPi.GPIO as GPIO
+
+from acq_latency import LatencyRecorder #acq_latency needs to be in the same folders as this script
+
+
+################################################
+"""
+Edge waiter
+"""
+
+class EdgeWaiter:
+    """
+    GPIO edges delivered to a waiting thread.
+
+    Typical use:
+        waiter = EdgeWaiter(trigger_pin, GPIO.RISING)
+        while True:
+            edge_ns = waiter.wait()
+            ... handle the edge ...
+
+    Args:
+        pin (int): GPIO pin, already set up as an input.
+        edge (int, optional): GPIO.RISING, GPIO.FALLING or GPIO.BOTH. Defaults to GPIO.RISING.
+        bouncetime (int, optional): Debounce time in ms of the GPIO event detection. Defaults to None (no debounce).
+        latency_history (int, optional): Maximum number of wake-up latencies kept for the report. Defaults to None (keep all).
+    """
+
+    def __init__(self, pin, edge=GPIO.RISING, bouncetime=None, latency_history=None):
+        self.pin = pin
+        self.edges = 0 # Edges detected by the callback
+        self.latency = LatencyRecorder(latency_history) # Callback to waiting thread wake-up latencies
+
+        self._pending = deque() # time.perf_counter_ns() of the edges not yet returned by wait()
+        self._condition = threading.Condition()
+
+        if bouncetime is None:
+            GPIO.add_event_detect(pin, edge, callback=self._callback)
+        else:
+            GPIO.add_event_detect(pin, edge, callback=self._callback, bouncetime=bouncetime)
+
+    def _callback(self, channel):
+        edge_ns = time.perf_counter_ns()
+        with self._condition:
+            self._pending.append(edge_ns)
+            self.edges += 1
+            self._condition.notify_all()
+
+    @property
+    def pending(self):
+        """
+        int: Number of edges detected but not yet returned by wait().
+        """
+        return len(self._pending)
+
+    def wait(self, timeout=None):
+        """
+        Sleeps until an edge is detected and returns it. Edges detected while the caller was
+        busy are returned first, one per call.
+
+        Args:
+            timeout (float, optional): Maximum wait in seconds. Defaults to None (wait forever).
+
+        Returns:
+            int: time.perf_counter_ns() taken by the GPIO callback at the edge, or None if the timeout expired.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending, timeout):
+                return None
+            edge_ns = self._pending.popleft()
+        self.latency.record(edge_ns, time.perf_counter_ns())
+        return edge_ns
+
+    def close(self):
+        """
+        Stops the event detection on the pin.
+        """
+        GPIO.remove_event_detect(self.pin)
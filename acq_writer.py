@@ -0,0 +1,353 @@
+"""
+Purpose:
+    Write acquisition data to disk without delaying the sampling loop.
+
+    Description:
+        CSVWriterThread owns the CSV file and runs on its own thread. The
+        sampling loop only puts rows in a bounded queue, the writer thread
+        takes them out in batches, writes them with writerows(), flushes the
+        file every flush_rows rows or flush_interval seconds and optionally
+        calls os.fsync() according to the fsync policy. An SD card write stall
+        therefore delays the writer thread, never a read from the HATs.
+        Queue depth, dropped rows and write latency counters are available
+        while the thread runs and in the final report.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import csv
+import os
+import time
+import threading
+import queue
+
+
+################################################
+"""
+Constants
+"""
+
+FSYNC_NEVER = 'never' # Leave the data in the OS cache, the OS writes it when it wants
+FSYNC_FLUSH = 'flush' # fsync after every flush, safest but slowest on SD cards
+FSYNC_CLOSE = 'close' # fsync once when the file is closed
+
+_STOP = object() # Queue sentinel asking the writer thread to finish
+
+
+################################################
+"""
+Writer thread
+"""
+
+class CSVWriterThread(threading.Thread):
+    """
+    Background CSV writer fed through a bounded queue.
+
+    Typical use:
+        with CSVWriterThread("data.csv", header_rows=[params, columns]) as writer:
+            for i in range(N_measures):
+                ... read ...
+                writer.write_row(row)
+
+    Args:
+        filename (str): Name of the CSV file.
+        header_rows (list, optional): Rows written before any data row. Defaults to no header.
+        mode (str, optional): File open mode, 'w' to overwrite or 'a' to append. Defaults to 'w'.
+        queue_size (int, optional): Maximum number of queued items (rows or blocks of rows). Defaults to 10000.
+        flush_rows (int, optional): Number of written rows after which the file is flushed. Defaults to 500.
+        flush_interval (float, optional): Maximum time in seconds between two flushes. Defaults to 1.0.
+        fsync (str, optional): fsync policy, FSYNC_NEVER, FSYNC_FLUSH or FSYNC_CLOSE. Defaults to FSYNC_CLOSE.
+        block_when_full (bool, optional): If True, write_row() waits when the queue is full.
+            If False, the row is dropped and counted in dropped_rows, so the sampling loop
+            is never delayed. Defaults to False.
+    """
+
+    def __init__(self, filename, header_rows=(), mode='w', queue_size=10000, flush_rows=500,
+                 flush_interval=1.0, fsync=FSYNC_CLOSE, block_when_full=False):
+        if fsync not in (FSYNC_NEVER, FSYNC_FLUSH, FSYNC_CLOSE):
+            raise ValueError('Error: Invalid fsync policy {}'.format(fsync))
+        threading.Thread.__init__(self, name='CSVWriterThread', daemon=True)
+
+        self.filename = filename
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.block_when_full = block_when_full
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # Counters, written by the writer thread and read by anyone
+        self.rows_written = 0
+        self.dropped_rows = 0
+        self.max_queue_depth = 0
+        self.flush_count = 0
+        self.write_count = 0
+        self.total_write_time = 0.0
+        self.max_write_time = 0.0
+        self.error = None
+
+        # The file and header are created right away, so an invalid path fails in the caller thread
+        self.file = open(filename, mode=mode, newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerows(header_rows)
+        self.file.flush()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def queue_depth(self):
+        """
+        int: Number of items currently waiting in the queue.
+        """
+        return self.queue.qsize()
+
+    def write_row(self, row):
+        """
+        Queues one data row. Called from the sampling loop.
+
+        Args:
+            row (list): The data row.
+
+        Returns:
+            bool: True if the row was queued, False if it was dropped because the queue was full.
+        """
+        return self._put([row], 1)
+
+    def write_rows(self, rows):
+        """
+        Queues a block of data rows as a single queue item, e.g. one block of a scan.
+
+        Args:
+            rows (list): List of data rows.
+
+        Returns:
+            bool: True if the rows were queued, False if they were dropped because the queue was full.
+        """
+        return self._put(rows, len(rows))
+
+    def _put(self, rows, number_of_rows):
+        try:
+            self.queue.put(rows, block=self.block_when_full)
+        except queue.Full:
+            self.dropped_rows += number_of_rows
+            return False
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def run(self):
+        """
+        Writer thread loop: waits for rows, writes them in batches and flushes periodically.
+        """
+        last_flush = time.monotonic()
+        unflushed_rows = 0
+        running = True
+
+        try:
+            while running:
+                try:
+                    batch = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    batch = []
+
+                # Take everything already waiting, so rows are written in one call
+                while True:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if batch and batch[-1] is _STOP:
+                    batch.pop()
+                    running = False
+
+                if batch:
+                    write_start = time.perf_counter()
+                    for rows in batch:
+                        self.writer.writerows(rows)
+                        unflushed_rows += len(rows)
+                    write_time = time.perf_counter() - write_start
+                    self.write_count += 1
+                    self.total_write_time += write_time
+                    if write_time > self.max_write_time:
+                        self.max_write_time = write_time
+
+                now = time.monotonic()
+                if unflushed_rows and (unflushed_rows >= self.flush_rows or now - last_flush >= self.flush_interval
+                                       or not running):
+                    self._flush()
+                    self.rows_written += unflushed_rows
+                    unflushed_rows = 0
+                    last_flush = now
+
+        except OSError as error:
+            # Storage error, keep the message for the caller and stop writing
+            self.error = error
+            print('\nCSV writer error:', error)
+
+        finally:
+            if self.fsync != FSYNC_NEVER and not self.file.closed:
+                try:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                except OSError:
+                    pass
+            self.file.close()
+
+    def _flush(self):
+        write_start = time.perf_counter()
+        self.file.flush()
+        if self.fsync == FSYNC_FLUSH:
+            os.fsync(self.file.fileno())
+        flush_time = time.perf_counter() - write_start
+        self.flush_count += 1
+        self.total_write_time += flush_time
+        if flush_time > self.max_write_time:
+            self.max_write_time = flush_time
+
+    def close(self):
+        """
+        Writes the remaining rows, closes the file and waits for the writer thread to finish.
+        """
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join()
+        elif not self.file.closed:
+            # Thread never started, only the header was written
+            self.file.close()
+
+    def stats(self):
+        """
+        Returns the writer counters.
+
+        Returns:
+            dict: Rows written and dropped, current and max queue depth, number of flushes,
+            mean and max write latency in seconds.
+        """
+        operations = self.write_count + self.flush_count
+        return {'rows_written': self.rows_written,
+                'dropped_rows': self.dropped_rows,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'flush_count': self.flush_count,
+                'mean_write_time': self.total_write_time / operations if operations else 0.0,
+                'max_write_time': self.max_write_time}
+
+    def print_report(self):
+        """
+        Prints the writer counters in the terminal.
+        """
+        stats = self.stats()
+        print('\nWriter report ({}): {} rows written, {} rows dropped, max queue depth {}, {} flushes'.format(
+            self.filename, stats['rows_written'], stats['dropped_rows'], stats['max_queue_depth'], stats['flush_count']))
+        print('Write latency: mean {:.3f} ms, max {:.3f} ms'.format(
+            stats['mean_write_time'] * 1e3, stats['max_write_time'] * 1e3))
+
+
+################################################
+"""
+Crash-safe streaming log
+"""
+
+def recover_csv_log(filename):
+    """
+    Recovers a CSV log left open by a session that did not end cleanly (power cut, kill, crash).
+
+    A log is left open when its marker file filename + '.open' still exists. The partial row
+    that may have been cut by the crash is removed, the file is renamed to
+    <name>_recovered_<date>.csv so the next session does not overwrite it, and the marker is removed.
+
+    Args:
+        filename (str): Name of the CSV log.
+
+    Returns:
+        str: Name of the recovered file, or None if there was nothing to recover.
+    """
+    import datetime
+
+    marker = filename + '.open'
+    if not os.path.exists(marker):
+        return None
+    if not os.path.exists(filename):
+        os.remove(marker)
+        return None
+
+    # Cut everything after the last complete line
+    with open(filename, 'rb+') as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            file.seek(position - step)
+            chunk = file.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position < size:
+            file.truncate(position)
+        file.flush()
+        os.fsync(file.fileno())
+
+    stem, extension = os.path.splitext(filename)
+    recovered_filename = '{}_recovered_{}{}'.format(stem, datetime.datetime.now().strftime("%Y%m%d-%H%M%S"), extension)
+    os.rename(filename, recovered_filename)
+    os.remove(marker)
+
+    return recovered_filename
+
+
+class StreamingCSVLog(CSVWriterThread):
+    """
+    Append-only CSV log that survives a crash of the acquisition script.
+
+    Rows are streamed to disk by the writer thread, flushed and fsynced every flush_interval
+    seconds, so at most the last flush_interval seconds are lost on a power cut, and memory
+    stays bounded by the queue size whatever the length of the experiment. While the log is
+    open, a marker file filename + '.open' exists. It is removed by close(), so a log whose
+    marker is still there at start-up was not closed cleanly and is recovered first
+    (see recover_csv_log()). The writer thread is started by the constructor.
+
+    Args:
+        filename (str): Name of the CSV log.
+        header_rows (list, optional): Rows written at the beginning of the log. Defaults to no header.
+        flush_rows (int, optional): Number of written rows after which the log is flushed. Defaults to 500.
+        flush_interval (float, optional): Maximum time in seconds between two flushes. Defaults to 1.0.
+        fsync (str, optional): fsync policy. Defaults to FSYNC_FLUSH.
+        queue_size (int, optional): Maximum number of queued rows. Defaults to 10000.
+    """
+
+    def __init__(self, filename, header_rows=(), flush_rows=500, flush_interval=1.0, fsync=FSYNC_FLUSH,
+                 queue_size=10000):
+        self.recovered_filename = recover_csv_log(filename)
+        if self.recovered_filename is not None:
+            print('Previous log was not closed cleanly, recovered as', self.recovered_filename)
+
+        self.marker = filename + '.open'
+        with open(self.marker, 'w') as marker:
+            marker.write(str(os.getpid()))
+
+        CSVWriterThread.__init__(self, filename, header_rows, mode='w', queue_size=queue_size,
+                                 flush_rows=flush_rows, flush_interval=flush_interval, fsync=fsync)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.start()
+
+    def close(self):
+        """
+        Writes the remaining rows, closes the log and removes its marker file.
+        """
+        CSVWriterThread.close(self)
+        if os.path.exists(self.marker):
+            os.remove(self.marker)
@@ -2,6 +2,7 @@
     This file contains helper functions for the MCC DAQ HAT Python examples.
 """
 from __future__ import print_function
+from time import sleep, monotonic
 from daqhats import hat_list, HatError, AnalogInputMode, \
     AnalogInputRange, TcTypes
 
@@ -206,3 +207,82 @@ def validate_channels(channel_set, number_of_channels):
     if not channel_set.issubset(valid_chans):
         raise ValueError('Error: Invalid channel selected - must be '
                          '{} - {}'.format(min(valid_chans), max(valid_chans)))
+
+
+class PollBackoff(object):
+    """
+    Sleep helper for status polling loops. The first polls are close together,
+    then the interval doubles at each empty poll up to max_interval, so a long
+    wait costs almost no CPU while the detection delay stays below max_interval.
+
+    Args:
+        min_interval (float): First sleep interval in seconds.
+        max_interval (float): Largest sleep interval in seconds, ie. the bound
+            of the detection delay once the backoff has grown.
+
+    """
+    def __init__(self, min_interval=0.0002, max_interval=0.005):
+        # type: (float, float) -> None
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+    def reset(self):
+        # type: () -> None
+        """
+        Restarts from min_interval, call it when a poll found something.
+        """
+        self.interval = self.min_interval
+
+    def sleep(self):
+        # type: () -> float
+        """
+        Sleeps for the current interval, then doubles it up to max_interval.
+
+        Returns:
+            float: The interval slept, in seconds.
+
+        """
+        interval = self.interval
+        sleep(interval)
+        self.interval = min(2 * interval, self.max_interval)
+        return interval
+
+
+def wait_for_trigger(hat, timeout=None, min_interval=0.0002,
+                     max_interval=0.005):
+    # type: (object, float, float, float) -> float
+    """
+    This function waits until the scan of the specified HAT device is
+    triggered or stopped, by reading its status with an adaptive backoff
+    (see PollBackoff) instead of a busy loop.
+
+    Args:
+        hat: The HAT device object (mcc118, mcc128, ...) on which a scan with
+            the OptionFlags.EXTTRIGGER option was started.
+        timeout (float): Maximum wait in seconds, None to wait forever.
+        min_interval (float): First status polling interval in seconds.
+        max_interval (float): Largest status polling interval in seconds.
+
+    Returns:
+        float: Upper bound of the trigger detection delay in seconds, ie. the
+        time between the last status read before the trigger and the first
+        one after it. None if the scan stopped or the timeout expired before
+        the trigger.
+
+    """
+    backoff = PollBackoff(min_interval, max_interval)
+    start = monotonic()
+    previous_read = start
+
+    while True:
+        status = hat.a_in_scan_status()
+        status_read = monotonic()
+        if status.triggered:
+            return status_read - previous_read
+        if not status.running:
+            return None
+        if timeout is not None and status_read - start >= timeout:
+            return None
+        previous_read = status_read
+        backoff.sleep()
@@ -27,7 +27,8 @@ from sys import stdout
 from daqhats import mcc128, OptionFlags, TriggerModes, HatIDs, HatError, \
     AnalogInputMode, AnalogInputRange
 from daqhats_utils import select_hat_device, enum_mask_to_string, \
-    chan_list_to_mask, input_mode_to_string, input_range_to_string
+    chan_list_to_mask, input_mode_to_string, input_range_to_string, \
+    wait_for_trigger
 
 CURSOR_BACK_2 = '\x1b[2D'
 ERASE_TO_END_OF_LINE = '\x1b[0K'
@@ -96,7 +97,10 @@ def main():
         try:
             # wait for the external trigger to occur
             print('\nWaiting for trigger ... hit Ctrl-C to cancel the trigger')
-            wait_for_trigger(hat)
+            detection_delay = wait_for_trigger(hat)
+            if detection_delay is not None:
+                print('Trigger detected within {:.3f} ms'.format(
+                    detection_delay * 1e3))
 
             print('\nStarting scan ... Press Ctrl-C to stop\n')
 
@@ -119,30 +123,6 @@ def main():
         print('\n', err)
 
 
-def wait_for_trigger(hat):
-    """
-    Monitor the status of the specified HAT device in a loop until the
-    triggered status is True or the running status is False.
-
-    Args:
-        hat (mcc128): The mcc128 HAT device object on which the status will
-            be monitored.
-
-    Returns:
-        None
-
-    """
-    # Read the status only to determine when the trigger occurs.
-    is_running = True
-    is_triggered = False
-    while is_running and not is_triggered:
-        status = hat.a_in_scan_status()
-        is_running = status.running
-        is_triggered = status.triggered
-        if not is_triggered:
-            sleep(0.001)
-
-
 def read_and_display_data(hat, samples_per_channel, num_channels):
     """
     Reads data from the specified channels on the specified DAQ HAT devices
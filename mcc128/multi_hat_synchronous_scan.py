@@ -29,7 +29,8 @@ from sys import stdout
 from daqhats import hat_list, mcc128, OptionFlags, HatIDs, TriggerModes, \
     HatError, AnalogInputMode, AnalogInputRange
 from daqhats_utils import enum_mask_to_string, chan_list_to_mask, \
-    validate_channels, input_mode_to_string, input_range_to_string
+    validate_channels, input_mode_to_string, input_range_to_string, \
+    wait_for_trigger
 
 # Constants
 DEVICE_COUNT = 2
@@ -131,7 +132,10 @@ def main():
 
         try:
             # Monitor the trigger status on the master device.
-            wait_for_trigger(hats[MASTER])
+            detection_delay = wait_for_trigger(hats[MASTER])
+            if detection_delay is not None:
+                print('Trigger detected within {:.3f} ms\n'.format(
+                    detection_delay * 1e3))
             # Read and display data for all devices until scan completes
             # or overrun is detected.
             read_and_display_data(hats, chans)
@@ -149,28 +153,6 @@ def main():
             hat.a_in_scan_cleanup()
 
 
-def wait_for_trigger(hat):
-    """
-    Monitor the status of the specified HAT device in a loop until the
-    triggered status is True or the running status is False.
-
-    Args:
-        hat (mcc128): The mcc128 HAT device object on which the status will
-            be monitored.
-
-    Returns:
-        None
-
-    """
-    # Read the status only to determine when the trigger occurs.
-    is_running = True
-    is_triggered = False
-    while is_running and not is_triggered:
-        status = hat.a_in_scan_status()
-        is_running = status.running
-        is_triggered = status.triggered
-
-
 def read_and_display_data(hats, chans):
     """
     Reads data from the specified channels on the specified DAQ HAT devices
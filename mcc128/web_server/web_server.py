@@ -2,9 +2,9 @@
 #  -*- coding: utf-8 -*-
 """
 This example demonstrates a simple web server providing visualization of data
-from a MCC 128 DAQ HAT device for a single client.  It makes use of the Dash
-Python framework for web-based interfaces and a plotly graph.  To install the
-dependencies for this example, run:
+from a MCC 128 DAQ HAT device for any number of clients.  It makes use of the
+Dash Python framework for web-based interfaces and a plotly graph.  To install
+the dependencies for this example, run:
    $ pip install dash
 
 Running this example:
@@ -17,18 +17,54 @@ Running this example:
 Stopping this example:
 1. To stop the server press Ctrl+C in the terminal window where there server
    was started.
+
+The scan is read by a single background thread (ScanProducer), started with
+the acquisition, into a NumPy ring buffer kept on the server.  The browsers
+never read the MCC 128: each one only holds the sample count it has already
+plotted (its cursor in the ring buffer), and each timer tick sends it the
+samples read since then, appended to the strip chart with the dcc.Graph
+extendData property.  The board is read at the same rate whatever the number
+of connected clients, a new client joins the running acquisition, and the
+cost of a tick is proportional to the new samples, not to the number of
+samples displayed.  The Configure, Start and Stop clicks of all the clients
+are serialized: a board configured by one client is reserved for it until it
+starts the acquisition (or for CONFIGURE_TIMEOUT seconds).
+
+Windows longer than POINTS_PER_TRACE samples (up to MAX_DECIMATED_SAMPLES,
+i.e. minutes to hours of data) are decimated on the server as the samples
+arrive (see Decimator), to the minimum and maximum of each bucket of samples
+or to one point per bucket with the Largest Triangle Three Buckets (LTTB)
+algorithm.  The chart then holds a fixed number of points per channel, so the
+server CPU time and the browser render time do not grow with the window.
+
+The samples (or decimated points) are also pushed as they are read, without a
+request per update, on the /stream Server-Sent Events endpoint: a "config"
+event describing the acquisition, then one "frame" event per read, holding a
+base64 encoded binary frame.  A frame is a little-endian header of the
+sequence number of its first row (uint64), its number of rows (uint32) and
+columns (uint32), followed by the rows as float32 values (float64 for the
+decimated points, whose sample numbers do not fit in a float32).  The id of
+each event is the acquisition number and the sequence number following its
+last row, so a client reconnecting with the Last-Event-ID header (or the from
+query parameter) resumes where it stopped, within the ring buffer, and a
+client reconnecting after a restart starts with the new acquisition.
 """
 import socket
 import json
-from time import sleep
-from collections import deque
-from dash import Dash
+import threading
+import struct
+import base64
+import uuid
+from time import sleep, monotonic
+import numpy as np
+from flask import Response, request
+from dash import Dash, no_update
 from dash.dependencies import Input, Output, State
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objs as go
 from daqhats import (hat_list, mcc128, HatIDs, OptionFlags, AnalogInputMode,
-                     AnalogInputRange)
+                     AnalogInputRange, HatError)
 
 
 _app = Dash(__name__)   # pylint: disable=invalid-name,no-member
@@ -36,17 +72,348 @@ _app.css.config.serve_locally = True
 _app.scripts.config.serve_locally = True
 
 _HAT = None  # Store the hat object in a global for use in multiple callbacks.
+_RING = None  # Server-side buffer of the samples to display, see SampleRing.
+_PRODUCER = None  # Thread reading the scan into _RING, see ScanProducer.
+_CONFIG = None  # Settings of the acquisition, shown to the clients joining it.
+_OWNER = None  # (client id, time) of the last Configure, see reserved_by_other
+_LOCK = threading.Lock()  # Serializes the Configure, Start and Stop clicks.
 
 MCC128_CHANNEL_COUNT = 8
+MAX_SAMPLES_TO_DISPLAY = 1000
+MAX_DECIMATED_SAMPLES = 100000000
+POINTS_PER_TRACE = 1000  # Points per channel sent to the chart when decimating
+DECIMATION_NONE = 'none'
+DECIMATION_MINMAX = 'minmax'
+DECIMATION_LTTB = 'lttb'
+READ_INTERVAL = 0.1  # Seconds between two reads of the scan buffer
+CONFIGURE_TIMEOUT = 60.0  # Seconds a configured board stays reserved
+STREAM_KEEPALIVE = 1.0  # Seconds without samples before a stream keepalive
+STREAM_FRAME_HEADER = struct.Struct('<QII')  # First sequence, rows, columns
 ALL_AVAILABLE = -1
 RETURN_IMMEDIATELY = 0
 
 
-def create_hat_selector():
+class SampleRing(object):
+    """
+    NumPy ring buffer of the last samples read from the MCC 128, shared by the
+    callbacks of all the clients.  Each sample is numbered by its position in
+    the scan (the sequence number), so each client can request the samples it
+    has not plotted yet without removing them for the other clients.
+
+    Args:
+        capacity (int): The number of samples kept, at least the number of
+            samples displayed by any client.
+        number_of_channels (int): The number of channels of each sample.
+    """
+
+    def __init__(self, capacity, number_of_channels):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, number_of_channels))
+        self.sample_count = 0  # Total number of samples appended
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+
+    def append(self, values, num_chans):
+        """
+        Appends interleaved samples, as returned by a_in_scan_read.
+
+        Args:
+            values (list[float]): The interleaved channel values.
+            num_chans (int): The number of channels of each sample.
+
+        Returns:
+            int: The updated total sample count.
+        """
+        num_samples_read = len(values) // num_chans
+        if num_samples_read == 0:
+            return self.sample_count
+        block = np.asarray(values).reshape(num_samples_read, num_chans)
+        # Only the last capacity samples can be displayed
+        block = block[-self.capacity:]
+        with self._lock:
+            first = self.sample_count + num_samples_read - len(block)
+            rows = np.arange(first, first + len(block)) % self.capacity
+            self.data[rows] = block
+            self.sample_count += num_samples_read
+            self._appended.notify_all()
+            return self.sample_count
+
+    def wait(self, sequence, timeout):
+        """
+        Waits until samples are appended after the specified sequence number.
+
+        Args:
+            sequence (int): The sample count already received by the client.
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: True if samples were appended after the sequence number.
+        """
+        with self._appended:
+            return self._appended.wait_for(
+                lambda: self.sample_count > sequence, timeout)
+
+    def since(self, sequence, limit=None):
+        """
+        Returns the samples appended after the specified sequence number,
+        limited to the ones still in the buffer.
+
+        Args:
+            sequence (int): The sample count already received by the client.
+            limit (int): The maximum number of samples returned, the most
+                recent ones.  Defaults to None (all the samples in the buffer).
+
+        Returns:
+            tuple: The sample numbers (numpy.ndarray) and the values, one row
+            per sample and one column per channel (numpy.ndarray).
+        """
+        with self._lock:
+            first = max(sequence, self.sample_count - self.capacity)
+            if limit is not None:
+                first = max(first, self.sample_count - limit)
+            samples = np.arange(first, self.sample_count)
+            return samples, self.data[samples % self.capacity]
+
+
+class Decimator(object):
+    """
+    Streaming decimation of the samples read from the MCC 128 to a fixed
+    number of points per channel, appended to a SampleRing.  The samples are
+    grouped in buckets of window / buckets samples as they arrive, and each
+    complete bucket is reduced once, so the cost per sample does not depend on
+    the window:
+
+    - DECIMATION_MINMAX keeps the minimum and the maximum of each bucket, in
+      time order, so the envelope of the signal and every spike stay visible.
+    - DECIMATION_LTTB keeps the point of each bucket forming the largest
+      triangle with the point kept in the previous bucket and the average of
+      the next bucket.  A bucket is reduced when the next one is complete.
+
+    The point kept for a channel is not at the same sample as the point kept
+    for another channel, so each row appended to the ring holds the sample
+    numbers of all the channels followed by their values.
+
+    Args:
+        method (str): DECIMATION_MINMAX or DECIMATION_LTTB.
+        window (int): The number of samples to be displayed.
+        ring (SampleRing): The buffer of the points, with 2 * num_chans
+            columns and a capacity of points rows.
+        points (int): The number of points per channel in the window.
+    """
+
+    def __init__(self, method, window, ring, points=POINTS_PER_TRACE):
+        self.method = method
+        buckets = points // 2 if method == DECIMATION_MINMAX else points
+        self.bucket_size = max(1, -(-int(window) // buckets))
+        self.ring = ring
+        self.sample_count = 0  # Total number of samples appended
+        self._pending = None  # Samples of the incomplete bucket
+        # LTTB: first sample number and samples of the bucket waiting for the
+        # next one, and sample numbers and values of the last points kept.
+        self._previous = None
+        self._selected = None
+
+    def append(self, values, num_chans):
+        """
+        Appends interleaved samples, as returned by a_in_scan_read, and the
+        points of the buckets they complete to the ring.
+
+        Args:
+            values (list[float]): The interleaved channel values.
+            num_chans (int): The number of channels of each sample.
+
+        Returns:
+            int: The updated total sample count.
+        """
+        num_samples_read = len(values) // num_chans
+        if num_samples_read == 0:
+            return self.sample_count
+        block = np.asarray(values).reshape(num_samples_read, num_chans)
+        if self._pending is not None:
+            block = np.concatenate((self._pending, block))
+        # Sample number of the first sample of the block
+        first = self.sample_count + num_samples_read - len(block)
+        self.sample_count += num_samples_read
+
+        num_buckets = len(block) // self.bucket_size
+        end = num_buckets * self.bucket_size
+        self._pending = block[end:]
+        if num_buckets:
+            buckets = block[:end].reshape(num_buckets, self.bucket_size,
+                                          num_chans)
+            if self.method == DECIMATION_MINMAX:
+                rows = self._min_max(buckets, first)
+            else:
+                rows = self._lttb(buckets, first)
+            if len(rows):
+                self.ring.append(rows.ravel(), 2 * num_chans)
+        return self.sample_count
+
+    @staticmethod
+    def _min_max(buckets, first):
+        num_buckets, bucket_size, num_chans = buckets.shape
+        index_min = buckets.argmin(axis=1)
+        index_max = buckets.argmax(axis=1)
+        # Two points per bucket and channel, in time order.
+        index = np.stack((np.minimum(index_min, index_max),
+                          np.maximum(index_min, index_max)), axis=1)
+        values = np.take_along_axis(buckets, index, axis=1)
+        samples = (first + bucket_size * np.arange(num_buckets)[:, None, None]
+                   + index)
+        return np.concatenate((samples, values), axis=2).reshape(
+            2 * num_buckets, 2 * num_chans)
+
+    def _lttb(self, buckets, first):
+        num_buckets, bucket_size, num_chans = buckets.shape
+        offsets = np.arange(bucket_size)
+        channels = np.arange(num_chans)
+        rows = []
+        if self._selected is None:
+            # The first sample is always kept.
+            self._selected = (np.full(num_chans, float(first)), buckets[0, 0])
+            rows.append(np.concatenate(self._selected))
+        for bucket in range(num_buckets):
+            start = first + bucket * bucket_size
+            if self._previous is not None:
+                previous_start, previous = self._previous
+                # Average of the next bucket, i.e. of this bucket.
+                average_x = start + (bucket_size - 1) / 2.0
+                average_y = buckets[bucket].mean(axis=0)
+                selected_x, selected_y = self._selected
+                previous_x = (previous_start + offsets)[:, None]
+                area = np.abs((selected_x - average_x)
+                              * (previous - selected_y)
+                              - (selected_x - previous_x)
+                              * (average_y - selected_y))
+                chosen = area.argmax(axis=0)
+                self._selected = ((previous_start + chosen).astype(float),
+                                  previous[chosen, channels])
+                rows.append(np.concatenate(self._selected))
+            self._previous = (start, buckets[bucket])
+        return np.array(rows).reshape(-1, 2 * num_chans)
+
+
+def max_samples_to_display(decimation):
+    """
+    Returns the maximum number of samples to be displayed with the specified
+    decimation.
+
+    Args:
+        decimation (str): DECIMATION_NONE, DECIMATION_MINMAX or
+            DECIMATION_LTTB.
+    """
+    if decimation == DECIMATION_NONE:
+        return MAX_SAMPLES_TO_DISPLAY
+    return MAX_DECIMATED_SAMPLES
+
+
+def use_decimation(decimation, samples_to_display):
+    """
+    Returns True if the samples are decimated before being displayed, i.e. if
+    a decimation is selected and the window holds more samples than points.
+
+    Args:
+        decimation (str): DECIMATION_NONE, DECIMATION_MINMAX or
+            DECIMATION_LTTB.
+        samples_to_display (float): The number of samples to be displayed.
+    """
+    return (decimation != DECIMATION_NONE
+            and samples_to_display > POINTS_PER_TRACE)
+
+
+class ScanProducer(threading.Thread):
+    """
+    Background thread reading the MCC 128 scan into the shared SampleRing,
+    directly or through a Decimator.  It is the only reader of the board, so
+    the read cost does not depend on the number of clients and no client takes
+    samples from another.
+
+    Args:
+        hat (mcc128): The MCC 128 object, with the scan started.
+        ring (SampleRing or Decimator): The buffer the samples are appended
+            to.
+        num_chans (int): The number of channels in the scan.
+        read_interval (float): Seconds between two reads of the scan buffer.
+    """
+
+    def __init__(self, hat, ring, num_chans, read_interval=READ_INTERVAL):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.hat = hat
+        self.ring = ring
+        self.num_chans = num_chans
+        self.read_interval = read_interval
+        self.hardware_overrun = False
+        self.buffer_overrun = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.read_interval):
+            # By specifying -1 for the samples_per_channel parameter, the
+            # timeout is ignored and all available data is read.
+            read_result = self.hat.a_in_scan_read(ALL_AVAILABLE,
+                                                  RETURN_IMMEDIATELY)
+            self.hardware_overrun = (self.hardware_overrun
+                                     or read_result.hardware_overrun)
+            self.buffer_overrun = (self.buffer_overrun
+                                   or read_result.buffer_overrun)
+            self.ring.append(read_result.data, self.num_chans)
+            if not read_result.running:
+                # The scan stopped on an overrun.
+                break
+
+    def stop(self):
+        """
+        Stops the thread after its current read.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+def acquisition_running():
+    """
+    Returns True if the scan producer is running, i.e. if a client started an
+    acquisition and the scan did not stop on an overrun.
+    """
+    producer = globals()['_PRODUCER']
+    return producer is not None and producer.is_alive()
+
+
+def acquisition_started():
+    """
+    Returns True if a client started an acquisition and nobody stopped it yet.
+    A scan stopped on an overrun is still started: the board stays in use until
+    Stop stops and cleans up the scan.
+    """
+    return globals()['_PRODUCER'] is not None
+
+
+def reserved_by_other(client_id):
+    """
+    Returns True if another client configured the board and did not start
+    the acquisition yet.  The reservation expires after CONFIGURE_TIMEOUT
+    seconds, so a client closing its page after Configure does not keep the
+    board.
+
+    Args:
+        client_id (str): The id of the client, see serve_layout.
+    """
+    owner = globals()['_OWNER']
+    return (owner is not None and owner[0] != client_id
+            and monotonic() - owner[1] < CONFIGURE_TIMEOUT)
+
+
+def create_hat_selector(selection=None):
     """
     Gets a list of available MCC 128 devices and creates a corresponding
     dash-core-components Dropdown element for the user interface.
 
+    Args:
+        selection (str): A string representation of a JSON object containing
+            the descriptor of the selected HAT.  Defaults to None (the first
+            HAT).
+
     Returns:
         dcc.Dropdown: A dash-core-components Dropdown object.
     """
@@ -59,8 +426,7 @@ def create_hat_selector():
         option = {'label': label, 'value': json.dumps(hat._asdict())}
         hat_selection_options.append(option)
 
-    selection = None
-    if hat_selection_options:
+    if selection is None and hat_selection_options:
         selection = hat_selection_options[0]['value']
 
     return dcc.Dropdown(        # pylint: disable=no-member
@@ -68,128 +434,201 @@ def create_hat_selector():
         value=selection, clearable=False)
 
 
-def init_chart_data(number_of_channels, number_of_samples):
+def init_chart_data():
     """
-    Initializes the chart with the specified number of samples.
+    Initializes the chart state.  The samples themselves are kept on the
+    server (see SampleRing), the state only holds the number of samples sent
+    to the chart and the overrun flags, so its size does not depend on the
+    number of samples displayed.
+
+    Returns:
+        str: A string representation of a JSON object containing the chart
+        state.
+    """
+    chart_data = {'sample_count': 0, 'hardware_overrun': False,
+                  'buffer_overrun': False}
+
+    return json.dumps(chart_data)
+
+
+def create_strip_chart_figure(active_channels):
+    """
+    Creates the strip chart figure, with one empty serie per active channel.
 
     Args:
-        number_of_channels (int): The number of channels to be displayed.
-        number_of_samples (int): The number of samples to be displayed.
+        active_channels ([int]): A list of integers corresponding to the user
+            selected Active channel checkboxes.
 
     Returns:
-        str: A string representation of a JSON object containing the chart data.
+        object: A figure object for a dash-core-components Graph.
     """
-    samples = []
-    for i in range(number_of_samples):
-        samples.append(i)
-    data = []
-    for _ in range(number_of_channels):
-        data.append([None]*number_of_samples)
+    plot_data = []
+    colors = ['#DD3222', '#FFC000', '#3482CB', '#FF6A00',
+              '#75B54A', '#808080', '#6E1911', '#806000']
+    # Create an empty serie for each active channel.
+    for channel in active_channels:
+        scatter_serie = go.Scatter(
+            x=[],
+            y=[],
+            name='Channel {0:d}'.format(channel),
+            marker={'color': colors[channel]}
+        )
+        plot_data.append(scatter_serie)
 
-    chart_data = {'data': data, 'samples': samples, 'sample_count': 0}
+    figure = {
+        'data': plot_data,
+        'layout': go.Layout(
+            xaxis=dict(title='Samples', autorange=True),
+            yaxis=dict(title='Voltage'),
+            margin={'l': 40, 'r': 40, 't': 50, 'b': 40, 'pad': 0},
+            showlegend=True,
+            title='Strip Chart'
+        )
+    }
 
-    return json.dumps(chart_data)
+    return figure
 
 
-# Define the HTML layout for the user interface, consisting of
-# dash-html-components and dash-core-components.
-# pylint: disable=no-member
-_app.layout = html.Div([
-    html.H1(
-        children='MCC 128 DAQ HAT Web Server Example',
-        id='exampleTitle'
-    ),
-    html.Div([
+def serve_layout():
+    """
+    Creates the HTML layout for the user interface, consisting of
+    dash-html-components and dash-core-components.  The layout is created
+    for each client that loads the page, so a client joining a running
+    acquisition gets its settings, status and strip chart.
+
+    Returns:
+        html.Div: The root element of the user interface.
+    """
+    config = {'hat': None, 'range': AnalogInputRange.BIP_10V,
+              'sample_rate': 1000.0, 'samples_to_display': 100,
+              'decimation': DECIMATION_MINMAX, 'channels': [0],
+              'status': None}
+    if acquisition_started():
+        config = globals()['_CONFIG']
+
+    # pylint: disable=no-member
+    return html.Div([
+        html.H1(
+            children='MCC 128 DAQ HAT Web Server Example',
+            id='exampleTitle'
+        ),
+        html.Div([
+            html.Div(
+                id='rightContent',
+                children=[
+                    dcc.Graph(id='stripChart', style={'height': 500},
+                              figure=create_strip_chart_figure(
+                                  config['channels'])),
+                    html.Div(id='errorDisplay',
+                             children='',
+                             style={'font-weight': 'bold', 'color': 'red'})
+                ], style={'width': '100%', 'box-sizing': 'border-box',
+                          'float': 'left', 'padding-left': 320}
+            ),
+            html.Div(
+                id='leftContent',
+                children=[
+                    html.Label('Select a HAT...',
+                               style={'font-weight': 'bold'}),
+                    create_hat_selector(config['hat']),
+                    html.Label('Range',
+                               style={'font-weight': 'bold',
+                                      'display': 'block', 'margin-top': 10}),
+                    dcc.Dropdown(id='rangeSelector',
+                                 options=[{'label': '± 10V',
+                                           'value': AnalogInputRange.BIP_10V},
+                                          {'label': '± 5V',
+                                           'value': AnalogInputRange.BIP_5V},
+                                          {'label': '± 2V',
+                                           'value': AnalogInputRange.BIP_2V},
+                                          {'label': '± 1V',
+                                           'value': AnalogInputRange.BIP_1V}],
+                                 value=config['range'], clearable=False),
+                    html.Label('Sample Rate (Hz)',
+                               style={'font-weight': 'bold',
+                                      'display': 'block', 'margin-top': 10}),
+                    dcc.Input(id='sampleRate', type='number', max=100000.0,
+                              step=1, value=config['sample_rate'],
+                              style={'width': 100, 'display': 'block'}),
+                    html.Label('Samples to display',
+                               style={'font-weight': 'bold',
+                                      'display': 'block', 'margin-top': 10}),
+                    dcc.Input(id='samplesToDisplay', type='number', min=1,
+                              max=MAX_DECIMATED_SAMPLES, step=1,
+                              value=config['samples_to_display'],
+                              style={'width': 100, 'display': 'block'}),
+                    html.Label('Decimation',
+                               style={'font-weight': 'bold',
+                                      'display': 'block', 'margin-top': 10}),
+                    dcc.Dropdown(id='decimationSelector',
+                                 options=[{'label': 'None (max 1000 samples)',
+                                           'value': DECIMATION_NONE},
+                                          {'label': 'Min/max envelope',
+                                           'value': DECIMATION_MINMAX},
+                                          {'label': 'LTTB',
+                                           'value': DECIMATION_LTTB}],
+                                 value=config['decimation'],
+                                 clearable=False),
+                    html.Label('Active Channels',
+                               style={'font-weight': 'bold',
+                                      'display': 'block', 'margin-top': 10}),
+                    dcc.Checklist(
+                        id='channelSelections',
+                        options=[
+                            {'label': 'Channel 0', 'value': 0},
+                            {'label': 'Channel 1', 'value': 1},
+                            {'label': 'Channel 2', 'value': 2},
+                            {'label': 'Channel 3', 'value': 3},
+                            {'label': 'Channel 4', 'value': 4},
+                            {'label': 'Channel 5', 'value': 5},
+                            {'label': 'Channel 6', 'value': 6},
+                            {'label': 'Channel 7', 'value': 7},
+                        ],
+                        labelStyle={'display': 'block'},
+                        value=config['channels']
+                    ),
+                    html.Button(
+                        children='Configure',
+                        id='startStopButton',
+                        style={'width': 100, 'height': 35,
+                               'text-align': 'center', 'margin-top': 10}
+                    ),
+                ], style={'width': 320, 'box-sizing': 'border-box',
+                          'padding': 10, 'position': 'absolute', 'top': 0,
+                          'left': 0}
+            ),
+        ], style={'position': 'relative', 'display': 'block',
+                  'overflow': 'hidden'}),
+        dcc.Interval(
+            id='timer',
+            interval=1000*60*60*24,  # in milliseconds
+            n_intervals=0
+        ),
+        html.Div(
+            id='chartData',
+            style={'display': 'none'},
+            children=init_chart_data()
+        ),
+        html.Div(
+            id='chartInfo',
+            style={'display': 'none'},
+            children=json.dumps({'sample_count': 0})
+        ),
         html.Div(
-            id='rightContent',
-            children=[
-                dcc.Graph(id='stripChart', style={'height': 500}),
-                html.Div(id='errorDisplay',
-                         children='',
-                         style={'font-weight': 'bold', 'color': 'red'})
-            ], style={'width': '100%', 'box-sizing': 'border-box',
-                      'float': 'left', 'padding-left': 320}
+            id='status',
+            style={'display': 'none'},
+            children=config['status']
         ),
         html.Div(
-            id='leftContent',
-            children=[
-                html.Label('Select a HAT...', style={'font-weight': 'bold'}),
-                create_hat_selector(),
-                html.Label('Range',
-                           style={'font-weight': 'bold',
-                                  'display': 'block', 'margin-top': 10}),
-                dcc.Dropdown(id='rangeSelector',
-                             options=[{'label': '± 10V',
-                                       'value': AnalogInputRange.BIP_10V},
-                                      {'label': '± 5V',
-                                       'value': AnalogInputRange.BIP_5V},
-                                      {'label': '± 2V',
-                                       'value': AnalogInputRange.BIP_2V},
-                                      {'label': '± 1V',
-                                       'value': AnalogInputRange.BIP_1V}],
-                             value=AnalogInputRange.BIP_10V, clearable=False),
-                html.Label('Sample Rate (Hz)',
-                           style={'font-weight': 'bold', 'display': 'block',
-                                  'margin-top': 10}),
-                dcc.Input(id='sampleRate', type='number', max=100000.0,
-                          step=1, value=1000.0,
-                          style={'width': 100, 'display': 'block'}),
-                html.Label('Samples to display',
-                           style={'font-weight': 'bold',
-                                  'display': 'block', 'margin-top': 10}),
-                dcc.Input(id='samplesToDisplay', type='number', min=1,
-                          max=1000, step=1, value=100,
-                          style={'width': 100, 'display': 'block'}),
-                html.Label('Active Channels',
-                           style={'font-weight': 'bold', 'display': 'block',
-                                  'margin-top': 10}),
-                dcc.Checklist(
-                    id='channelSelections',
-                    options=[
-                        {'label': 'Channel 0', 'value': 0},
-                        {'label': 'Channel 1', 'value': 1},
-                        {'label': 'Channel 2', 'value': 2},
-                        {'label': 'Channel 3', 'value': 3},
-                        {'label': 'Channel 4', 'value': 4},
-                        {'label': 'Channel 5', 'value': 5},
-                        {'label': 'Channel 6', 'value': 6},
-                        {'label': 'Channel 7', 'value': 7},
-                    ],
-                    labelStyle={'display': 'block'},
-                    value=[0]
-                ),
-                html.Button(
-                    children='Configure',
-                    id='startStopButton',
-                    style={'width': 100, 'height': 35, 'text-align': 'center',
-                           'margin-top': 10}
-                ),
-            ], style={'width': 320, 'box-sizing': 'border-box', 'padding': 10,
-                      'position': 'absolute', 'top': 0, 'left': 0}
+            id='clientId',
+            style={'display': 'none'},
+            children=uuid.uuid4().hex
         ),
-    ], style={'position': 'relative', 'display': 'block',
-              'overflow': 'hidden'}),
-    dcc.Interval(
-        id='timer',
-        interval=1000*60*60*24,  # in milliseconds
-        n_intervals=0
-    ),
-    html.Div(
-        id='chartData',
-        style={'display': 'none'},
-        children=init_chart_data(1, 1000)
-    ),
-    html.Div(
-        id='chartInfo',
-        style={'display': 'none'},
-        children=json.dumps({'sample_count': 0})
-    ),
-    html.Div(
-        id='status',
-        style={'display': 'none'}
-    ),
-])
-# pylint: enable=no-member
+    ])
+    # pylint: enable=no-member
+
+
+_app.layout = serve_layout
 
 @_app.callback(
     Output('status', 'children'),
@@ -198,15 +637,20 @@ _app.layout = html.Div([
      State('hatSelector', 'value'),
      State('sampleRate', 'value'),
      State('samplesToDisplay', 'value'),
+     State('decimationSelector', 'value'),
      State('rangeSelector', 'value'),
-     State('channelSelections', 'value')]
+     State('channelSelections', 'value'),
+     State('clientId', 'children')]
 )   # pylint: disable=too-many-arguments
 def start_stop_click(n_clicks, button_label, hat_descriptor_json_str,
-                     sample_rate_val, samples_to_display, input_range,
-                     active_channels):
+                     sample_rate_val, samples_to_display, decimation,
+                     input_range, active_channels, client_id):
     """
     A callback function to change the application status when the Configure,
-    Start or Stop button is clicked.
+    Start or Stop button is clicked.  The clicks of all the clients are
+    serialized: a board configured by a client can only be configured again
+    by this client until it starts the acquisition, and only this client can
+    start it.
 
     Args:
         n_clicks (int): Number of button clicks - triggers the callback.
@@ -215,9 +659,12 @@ def start_stop_click(n_clicks, button_label, hat_descriptor_json_str,
             containing the descriptor for the selected MCC 128 DAQ HAT.
         sample_rate_val (float): The user specified sample rate value.
         samples_to_display (float): The number of samples to be displayed.
+        decimation (str): The decimation of the displayed samples -
+            DECIMATION_NONE, DECIMATION_MINMAX or DECIMATION_LTTB.
         input_range (int): The analog input voltage range.
         active_channels ([int]): A list of integers corresponding to the user
             selected Active channel checkboxes.
+        client_id (str): The id of the client, see serve_layout.
 
     Returns:
         str: The new application status - "idle", "configured", "running"
@@ -225,43 +672,89 @@ def start_stop_click(n_clicks, button_label, hat_descriptor_json_str,
 
     """
     output = 'idle'
-    if n_clicks is not None and n_clicks > 0:
+    if n_clicks is None or n_clicks <= 0:
+        return output
+
+    with _LOCK:
+        # pylint: disable=global-statement
+        global _HAT, _RING, _CONFIG, _OWNER, _PRODUCER
         if button_label == 'Configure':
-            if (1 < samples_to_display <= 1000
-                    and active_channels
-                    and sample_rate_val <= (100000 / len(active_channels))):
-                # If configuring, create the hat object.
-                if hat_descriptor_json_str:
-                    hat_descriptor = json.loads(hat_descriptor_json_str)
-                    # The hat object is retained as a global for use in
-                    # other callbacks.
-                    global _HAT     # pylint: disable=global-statement
-                    _HAT = mcc128(hat_descriptor['address'])
-                    # Change to AnalogInputMode.DIFF for differential inputs.
-                    _HAT.a_in_mode_write(AnalogInputMode.SE)
-                    _HAT.a_in_range_write(input_range)
-                    output = 'configured'
-            else:
+            if acquisition_started() or reserved_by_other(client_id):
+                # Another client is acquiring from the board or configured it.
+                output = 'error'
+            elif not (1 < samples_to_display
+                      <= max_samples_to_display(decimation)
+                      and active_channels
+                      and sample_rate_val <= 100000 / len(active_channels)):
                 output = 'error'
+            elif hat_descriptor_json_str:
+                # If configuring, create the hat object.  The hat object is
+                # retained as a global for use in other callbacks.
+                hat_descriptor = json.loads(hat_descriptor_json_str)
+                _HAT = mcc128(hat_descriptor['address'])
+                # Change to AnalogInputMode.DIFF for differential inputs.
+                _HAT.a_in_mode_write(AnalogInputMode.SE)
+                _HAT.a_in_range_write(input_range)
+                # New server-side buffer for the configured channels, large
+                # enough for the window of any client.  The rows of decimated
+                # points hold the sample numbers and the values of all the
+                # channels.
+                if use_decimation(decimation, samples_to_display):
+                    _RING = SampleRing(POINTS_PER_TRACE,
+                                       2 * len(active_channels))
+                else:
+                    _RING = SampleRing(MAX_SAMPLES_TO_DISPLAY,
+                                       len(active_channels))
+                # Settings shown to the clients joining the acquisition.
+                acquisition = _CONFIG['acquisition'] + 1 if _CONFIG else 1
+                _CONFIG = {'acquisition': acquisition,
+                           'hat': hat_descriptor_json_str,
+                           'range': input_range,
+                           'sample_rate': sample_rate_val,
+                           'samples_to_display': samples_to_display,
+                           'decimation': decimation,
+                           'channels': active_channels,
+                           'status': 'running'}
+                # The board is reserved for this client until it starts.
+                _OWNER = (client_id, monotonic())
+                output = 'configured'
         elif button_label == 'Start':
+            if (acquisition_started() or _OWNER is None
+                    or _OWNER[0] != client_id):
+                # Started by another client, or configured again by another
+                # client after the reservation expired.
+                return 'error'
             # If starting, call the a_in_scan_start function.
             sample_rate = float(sample_rate_val)
             channel_mask = 0x0
             for channel in active_channels:
                 channel_mask |= 1 << channel
-            hat = globals()['_HAT']
             # Buffer 5 seconds of data
             samples_to_buffer = int(5 * sample_rate)
-            hat.a_in_scan_start(channel_mask, samples_to_buffer,
-                                sample_rate, OptionFlags.CONTINUOUS)
+            try:
+                _HAT.a_in_scan_start(channel_mask, samples_to_buffer,
+                                     sample_rate, OptionFlags.CONTINUOUS)
+            except HatError:
+                return 'error'
+            # A single thread reads the scan for all the clients, through
+            # the decimator for the long windows.
+            sink = _RING
+            if use_decimation(decimation, samples_to_display):
+                sink = Decimator(decimation, samples_to_display, sink)
+            _PRODUCER = ScanProducer(_HAT, sink, len(active_channels))
+            _PRODUCER.start()
+            _OWNER = None
             sleep(0.5)
             output = 'running'
         elif button_label == 'Stop':
-            # If stopping, call the a_in_scan_stop and a_in_scan_cleanup
-            # functions.
-            hat = globals()['_HAT']
-            hat.a_in_scan_stop()
-            hat.a_in_scan_cleanup()
+            # If stopping, stop the scan producer then call the
+            # a_in_scan_stop and a_in_scan_cleanup functions.  The scan may
+            # already have been stopped from another client.
+            if _PRODUCER is not None:
+                _PRODUCER.stop()
+                _PRODUCER = None
+                _HAT.a_in_scan_stop()
+                _HAT.a_in_scan_cleanup()
             output = 'idle'
 
     return output
@@ -282,13 +775,14 @@ def update_timer_interval(acq_state, chart_data_json_str, chart_info_json_str,
     disabled while processing data by setting the interval to 1 day and then
     re-enabled when the data read has been plotted.  The interval value when
     enabled is calculated based on the data throughput necessary with a minimum
-    of 500 ms and maximum of 4 seconds.
+    of 500 ms and maximum of 4 seconds.  Decimated windows are displayed with
+    POINTS_PER_TRACE points per channel whatever their number of samples.
 
     Args:
         acq_state (str): The application state of "idle", "configured",
             "running" or "error" - triggers the callback.
         chart_data_json_str (str): A string representation of a JSON object
-            containing the current chart data - triggers the callback.
+            containing the current chart state - triggers the callback.
         chart_info_json_str (str): A string representation of a JSON object
             containing the current chart status - triggers the callback.
         active_channels ([int]): A list of integers corresponding to the user
@@ -305,11 +799,13 @@ def update_timer_interval(acq_state, chart_data_json_str, chart_info_json_str,
 
     if acq_state == 'running':
         # Activate the timer when the sample count displayed to the chart
-        # matches the sample count of data read from the HAT device.
-        if 0 < chart_info['sample_count'] == chart_data['sample_count']:
+        # matches the sample count of data read from the HAT device, or
+        # while waiting for the first samples (or decimated points).
+        if chart_info['sample_count'] == chart_data['sample_count']:
             # Determine the refresh rate based on the amount of data being
             # displayed.
-            refresh_rate = int(num_channels * samples_to_display / 2)
+            points = min(samples_to_display, POINTS_PER_TRACE)
+            refresh_rate = int(num_channels * points / 2)
             if refresh_rate < 500:
                 refresh_rate = 500  # Minimum of 500 ms
 
@@ -376,6 +872,21 @@ def disable_samples_to_disp_input(acq_state):
     return disabled
 
 
+@_app.callback(
+    Output('decimationSelector', 'disabled'),
+    [Input('status', 'children')]
+)
+def disable_decimation_selector_dropdown(acq_state):
+    """
+    A callback function to disable the decimation selector dropdown when the
+    application status changes to configured or running.
+    """
+    disabled = False
+    if acq_state == 'configured' or acq_state == 'running':
+        disabled = True
+    return disabled
+
+
 @_app.callback(
     Output('channelSelections', 'options'),
     [Input('status', 'children')]
@@ -420,185 +931,132 @@ def update_start_stop_button_name(acq_state):
 
 
 @_app.callback(
-    Output('chartData', 'children'),
+    [Output('chartData', 'children'),
+     Output('stripChart', 'extendData')],
     [Input('timer', 'n_intervals'),
      Input('status', 'children')],
     [State('chartData', 'children'),
      State('samplesToDisplay', 'value'),
+     State('decimationSelector', 'value'),
      State('channelSelections', 'value')]
-)
+)   # pylint: disable=too-many-arguments
 def update_strip_chart_data(_n_intervals, acq_state, chart_data_json_str,
-                            samples_to_display_val, active_channels):
+                            samples_to_display_val, decimation,
+                            active_channels):
     """
-    A callback function to update the chart data stored in the chartData HTML
-    div element.  The chartData element is used to store the existing data
-    values, which allows sharing of data between callback functions.  Global
-    variables cannot be used to share data between callbacks (see
-    https://dash.plot.ly/sharing-data-between-callbacks).
+    A callback function to append the new samples to the strip chart.  The
+    samples are read by the scan producer into the server-side ring buffer,
+    shared by all the clients.  Only the samples that the chart of this client
+    has not received yet, from the sample count stored in its chartData HTML
+    div element, are sent with the extendData property of the chart.  Global
+    variables cannot be used to share per-client data between callbacks (see
+    https://dash.plot.ly/sharing-data-between-callbacks), so the cursor of each
+    client is kept in its browser.  For a decimated window, the ring buffer
+    holds the decimated points and the cursor counts points, not samples.
 
     Args:
         _n_intervals (int): Number of timer intervals - triggers the callback.
         acq_state (str): The application state of "idle", "configured",
             "running" or "error" - triggers the callback.
         chart_data_json_str (str): A string representation of a JSON object
-            containing the current chart data.
+            containing the current chart state.
         samples_to_display_val (float): The number of samples to be displayed.
+        decimation (str): The decimation of the displayed samples.
         active_channels ([int]): A list of integers corresponding to the user
             selected active channel checkboxes.
 
     Returns:
-        str: A string representation of a JSON object containing the updated
-        chart data.
+        tuple: A string representation of a JSON object containing the updated
+        chart state, and the extendData update of the strip chart (or no_update
+        when there is no new sample).
     """
-    updated_chart_data = chart_data_json_str
     samples_to_display = int(samples_to_display_val)
     num_channels = len(active_channels)
     if acq_state == 'running':
-        hat = globals()['_HAT']
-        if hat is not None:
+        producer = globals()['_PRODUCER']
+        ring = globals()['_RING']
+        if producer is not None and ring is not None:
             chart_data = json.loads(chart_data_json_str)
-
-            # By specifying -1 for the samples_per_channel parameter, the
-            # timeout is ignored and all available data is read.
-            read_result = hat.a_in_scan_read(ALL_AVAILABLE, RETURN_IMMEDIATELY)
-
-            if ('hardware_overrun' not in chart_data.keys()
-                    or not chart_data['hardware_overrun']):
-                chart_data['hardware_overrun'] = read_result.hardware_overrun
-            if ('buffer_overrun' not in chart_data.keys()
-                    or not chart_data['buffer_overrun']):
-                chart_data['buffer_overrun'] = read_result.buffer_overrun
-
-            # Add the samples read to the chart_data object.
-            sample_count = add_samples_to_data(samples_to_display, num_channels,
-                                               chart_data, read_result)
-
-            # Update the total sample count.
-            chart_data['sample_count'] = sample_count
-            updated_chart_data = json.dumps(chart_data)
+            overrun = (producer.hardware_overrun, producer.buffer_overrun)
+            overrun_changed = overrun != (chart_data['hardware_overrun'],
+                                          chart_data['buffer_overrun'])
+            chart_data['hardware_overrun'] = producer.hardware_overrun
+            chart_data['buffer_overrun'] = producer.buffer_overrun
+            # The scan stops on an overrun, the board waits for Stop.
+            stopped = not producer.is_alive()
+            overrun_changed = (overrun_changed
+                               or stopped != chart_data.get('stopped', False))
+            chart_data['stopped'] = stopped
+
+            # Send only the samples not yet received by the chart.
+            decimated = use_decimation(decimation, samples_to_display)
+            max_points = POINTS_PER_TRACE if decimated else samples_to_display
+            samples, values = ring.since(chart_data['sample_count'],
+                                         max_points)
+            if not len(samples):
+                if overrun_changed:
+                    return json.dumps(chart_data), no_update
+                return no_update, no_update
+            chart_data['sample_count'] = int(samples[-1]) + 1
+            if decimated:
+                # Each point holds the sample numbers of the channels, then
+                # their values.
+                x_values = values[:, :num_channels].T.tolist()
+                y_values = values[:, num_channels:].T.tolist()
+            else:
+                x_values = [samples.tolist()] * num_channels
+                y_values = values.T.tolist()
+            extend_data = ({'x': x_values, 'y': y_values},
+                           list(range(num_channels)), max_points)
+            return json.dumps(chart_data), extend_data
 
     elif acq_state == 'configured':
-        # Clear the data in the strip chart when Configure is clicked.
-        updated_chart_data = init_chart_data(num_channels, samples_to_display)
-
-    return updated_chart_data
-
-
-def add_samples_to_data(samples_to_display, num_chans, chart_data, read_result):
-    """
-    Adds the samples read from the mcc128 hat device to the chart_data object
-    used to update the strip chart.
-
-    Args:
-        samples_to_display (int): The number of samples to be displayed.
-        num_chans (int): The number of selected channels.
-        chart_data (dict): A dictionary containing the data used to update the
-            strip chart display.
-        read_result (namedtuple): A namedtuple containing status and data
-            returned from the mcc128 read.
-
-    Returns:
-        int: The updated total sample count after the data is added.
-
-    """
-    num_samples_read = int(len(read_result.data) / num_chans)
-    current_sample_count = int(chart_data['sample_count'])
-
-    # Convert lists to deque objects with the maximum length set to the number
-    # of samples to be displayed.  This will pop off the oldest data
-    # automatically when new data is appended.
-    chart_data['samples'] = deque(chart_data['samples'],
-                                  maxlen=samples_to_display)
-    for chan in range(num_chans):
-        chart_data['data'][chan] = deque(chart_data['data'][chan],
-                                         maxlen=samples_to_display)
+        # Clear the chart state when Configure is clicked.
+        return init_chart_data(), no_update
 
-    start_sample = 0
-    if num_samples_read > samples_to_display:
-        start_sample = num_samples_read - samples_to_display
-
-    for sample in range(start_sample, num_samples_read):
-        chart_data['samples'].append(current_sample_count + sample)
-        for chan in range(num_chans):
-            data_index = sample * num_chans + chan
-            chart_data['data'][chan].append(read_result.data[data_index])
-
-    # Convert deque objects back to lists so they can be written to to div
-    # element.
-    chart_data['samples'] = list(chart_data['samples'])
-    for chan in range(num_chans):
-        chart_data['data'][chan] = list(chart_data['data'][chan])
-
-    return current_sample_count + num_samples_read
+    return no_update, no_update
 
 
 @_app.callback(
     Output('stripChart', 'figure'),
-    [Input('chartData', 'children')],
+    [Input('status', 'children')],
     [State('channelSelections', 'value')]
 )
-def update_strip_chart(chart_data_json_str, active_channels):
+def update_strip_chart(acq_state, active_channels):
     """
-    A callback function to update the strip chart display when new data is read.
+    A callback function to create the strip chart, with one empty serie per
+    active channel, when the application status changes to configured.  The
+    samples are then appended by update_strip_chart_data through the
+    extendData property of the chart.
 
     Args:
-        chart_data_json_str (str): A string representation of a JSON object
-            containing the current chart data - triggers the callback.
+        acq_state (str): The application state of "idle", "configured",
+            "running" or "error" - triggers the callback.
         active_channels ([int]): A list of integers corresponding to the user
             selected Active channel checkboxes.
 
     Returns:
-        object: A figure object for a dash-core-components Graph, updated with
-        the most recently read data.
+        object: A figure object for a dash-core-components Graph.
     """
-    data = []
-    xaxis_range = [0, 1000]
-    chart_data = json.loads(chart_data_json_str)
-    if 'samples' in chart_data and chart_data['samples']:
-        xaxis_range = [min(chart_data['samples']), max(chart_data['samples'])]
-    if 'data' in chart_data:
-        data = chart_data['data']
-
-    plot_data = []
-    colors = ['#DD3222', '#FFC000', '#3482CB', '#FF6A00',
-              '#75B54A', '#808080', '#6E1911', '#806000']
-    # Update the serie data for each active channel.
-    for chan_idx, channel in enumerate(active_channels):
-        scatter_serie = go.Scatter(
-            x=list(chart_data['samples']),
-            y=list(data[chan_idx]),
-            name='Channel {0:d}'.format(channel),
-            marker={'color': colors[channel]}
-        )
-        plot_data.append(scatter_serie)
-
-    figure = {
-        'data': plot_data,
-        'layout': go.Layout(
-            xaxis=dict(title='Samples', range=xaxis_range),
-            yaxis=dict(title='Voltage'),
-            margin={'l': 40, 'r': 40, 't': 50, 'b': 40, 'pad': 0},
-            showlegend=True,
-            title='Strip Chart'
-        )
-    }
+    if acq_state != 'configured' and acq_state is not None:
+        return no_update
 
-    return figure
+    return create_strip_chart_figure(active_channels)
 
 
 @_app.callback(
     Output('chartInfo', 'children'),
-    [Input('stripChart', 'figure')],
+    [Input('stripChart', 'extendData')],
     [State('chartData', 'children')]
 )
-def update_chart_info(_figure, chart_data_json_str):
+def update_chart_info(_extend_data, chart_data_json_str):
     """
     A callback function to set the sample count for the number of samples that
     have been displayed on the chart.
 
     Args:
-        _figure (object): A figure object for a dash-core-components Graph for
-            the strip chart - triggers the callback.
+        _extend_data (tuple): The samples appended to the strip chart -
+            triggers the callback.
         chart_data_json_str (str): A string representation of a JSON object
             containing the current chart data - triggers the callback.
 
@@ -619,10 +1077,13 @@ def update_chart_info(_figure, chart_data_json_str):
     [State('hatSelector', 'value'),
      State('sampleRate', 'value'),
      State('samplesToDisplay', 'value'),
-     State('channelSelections', 'value')]
+     State('decimationSelector', 'value'),
+     State('channelSelections', 'value'),
+     State('clientId', 'children')]
 )  # pylint: disable=too-many-arguments
 def update_error_message(chart_data_json_str, acq_state, hat_selection,
-                         sample_rate, samples_to_display, active_channels):
+                         sample_rate, samples_to_display, decimation,
+                         active_channels, client_id):
     """
     A callback function to display error messages.
 
@@ -635,8 +1096,10 @@ def update_error_message(chart_data_json_str, acq_state, hat_selection,
             containing the descriptor for the selected MCC 128 DAQ HAT.
         sample_rate (float): The user specified sample rate value.
         samples_to_display (float): The number of samples to be displayed.
+        decimation (str): The decimation of the displayed samples.
         active_channels ([int]): A list of integers corresponding to the user
             selected Active channel checkboxes.
+        client_id (str): The id of the client, see serve_layout.
 
     Returns:
         str: The error message to display.
@@ -645,15 +1108,19 @@ def update_error_message(chart_data_json_str, acq_state, hat_selection,
     error_message = ''
     if acq_state == 'running':
         chart_data = json.loads(chart_data_json_str)
-        if ('hardware_overrun' in chart_data.keys()
-                and chart_data['hardware_overrun']):
+        if chart_data['hardware_overrun']:
             error_message += 'Hardware overrun occurred; '
-        if ('buffer_overrun' in chart_data.keys()
-                and chart_data['buffer_overrun']):
+        if chart_data['buffer_overrun']:
             error_message += 'Buffer overrun occurred; '
+        if chart_data.get('stopped'):
+            error_message += 'Acquisition stopped, click Stop; '
     elif acq_state == 'error':
         num_active_channels = len(active_channels)
         max_sample_rate = 100000
+        if acquisition_started():
+            error_message += 'Acquisition running from another client; '
+        elif reserved_by_other(client_id):
+            error_message += 'HAT configured by another client; '
         if not hat_selection:
             error_message += 'Invalid HAT selection; '
         if num_active_channels <= 0:
@@ -663,12 +1130,102 @@ def update_error_message(chart_data_json_str, acq_state, hat_selection,
         if sample_rate > max_sample_rate:
             error_message += 'Invalid Sample Rate (max: '
             error_message += str(max_sample_rate) + '); '
-        if samples_to_display <= 1 or samples_to_display > 1000:
-            error_message += 'Invalid Samples to display (range: 2-1000); '
+        max_samples = max_samples_to_display(decimation)
+        if samples_to_display <= 1 or samples_to_display > max_samples:
+            error_message += 'Invalid Samples to display (range: 2-'
+            error_message += str(max_samples) + '); '
 
     return error_message
 
 
+def stream_frames(ring, sequence):
+    """
+    Generates the Server-Sent Events of the /stream endpoint, one frame event
+    each time the scan producer appends samples to the ring buffer, until the
+    acquisition stops.  The end event holds the overrun flags of the scan, so
+    a client knows if it stopped on an overrun.
+
+    Args:
+        ring (SampleRing): The ring buffer of the acquisition.
+        sequence (int): The sequence number of the first row to send.
+
+    Yields:
+        str: The Server-Sent Events.
+    """
+    config = globals()['_CONFIG']
+    decimated = use_decimation(config['decimation'],
+                               config['samples_to_display'])
+    dtype = '<f8' if decimated else '<f4'
+    yield 'event: config\ndata: {0}\n\n'.format(json.dumps(
+        {'acquisition': config['acquisition'],
+         'channels': config['channels'],
+         'sample_rate': config['sample_rate'],
+         'decimation': config['decimation'] if decimated else DECIMATION_NONE,
+         'dtype': 'float64' if decimated else 'float32'}))
+
+    while acquisition_running() and ring is globals()['_RING']:
+        if not ring.wait(sequence, STREAM_KEEPALIVE):
+            # A comment keeps the connection open through proxies.
+            yield ': keepalive\n\n'
+            continue
+        samples, values = ring.since(sequence)
+        if not len(samples):
+            continue
+        sequence = int(samples[-1]) + 1
+        frame = (STREAM_FRAME_HEADER.pack(int(samples[0]), values.shape[0],
+                                          values.shape[1])
+                 + values.astype(dtype).tobytes())
+        yield 'id: {0:d}-{1:d}\nevent: frame\ndata: {2}\n\n'.format(
+            config['acquisition'], sequence,
+            base64.b64encode(frame).decode('ascii'))
+
+    producer = globals()['_PRODUCER']
+    overrun = {'hardware_overrun': False, 'buffer_overrun': False}
+    if producer is not None:
+        overrun = {'hardware_overrun': producer.hardware_overrun,
+                   'buffer_overrun': producer.buffer_overrun}
+    yield 'event: end\ndata: {0}\n\n'.format(json.dumps(overrun))
+
+
+@_app.server.route('/stream')
+def stream():
+    """
+    The Server-Sent Events endpoint pushing the samples of the running
+    acquisition, see stream_frames.  The stream starts at the Last-Event-ID
+    header of a reconnecting client, or at the from query parameter, or with
+    the next samples read.  A Last-Event-ID of a previous acquisition, or a
+    sequence ahead of the ring buffer, starts with the next samples read.
+
+    Returns:
+        flask.Response: The event stream, or a 503 response when no
+        acquisition is running.
+    """
+    ring = globals()['_RING']
+    if not acquisition_running() or ring is None:
+        return Response('No acquisition running', status=503,
+                        mimetype='text/plain')
+
+    sequence = ring.sample_count
+    last_event_id = request.headers.get('Last-Event-ID')
+    try:
+        if last_event_id is not None:
+            # Event ids are "<acquisition>-<sequence>".
+            acquisition, event_sequence = last_event_id.split('-')
+            if int(acquisition) == globals()['_CONFIG']['acquisition']:
+                sequence = int(event_sequence)
+        elif request.args.get('from') is not None:
+            sequence = int(request.args.get('from'))
+    except ValueError:
+        pass
+    # A client ahead of the ring buffer would only get keepalives.
+    sequence = min(sequence, ring.sample_count)
+
+    return Response(stream_frames(ring, sequence),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
 def get_ip_address():
     """ Utility function to get the IP address of the device. """
     ip_address = '127.0.0.1'  # Default to localhost
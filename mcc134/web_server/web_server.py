@@ -2,9 +2,9 @@
 #  -*- coding: utf-8 -*-
 """
 This example demonstrates a simple web server providing visualization of data
-from a MCC 134 DAQ HAT device for a single client.  It makes use of the Dash
-Python framework for web-based interfaces and a plotly graph.  To install the
-dependencies for this example, run:
+from a MCC 134 DAQ HAT device for any number of clients.  It makes use of the
+Dash Python framework for web-based interfaces and a plotly graph.  To install
+the dependencies for this example, run:
    $ pip install dash
 
 Running this example:
@@ -17,16 +17,31 @@ Running this example:
 Stopping this example:
 1. To stop the server press Ctrl+C in the terminal window where there server
    was started.
+
+The thermocouples are read by a single background thread
+(TemperatureProducer), started with the acquisition, into a NumPy ring buffer
+kept on the server.  The browsers never read the MCC 134: each one only holds
+the sample count it has already plotted (its cursor in the ring buffer), and
+each timer tick adds the samples read since then to its chart.  The board is
+read at the same rate whatever the number of connected clients, and a new
+client joins the running acquisition.  The Configure, Start and Stop clicks
+of all the clients are serialized: a board configured by one client is
+reserved for it until it starts the acquisition (or for CONFIGURE_TIMEOUT
+seconds).
 """
 import socket
 import json
+import threading
+import time
+import uuid
 from collections import deque
-from dash import Dash
+import numpy as np
+from dash import Dash, no_update
 from dash.dependencies import Input, Output, State
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objs as go
-from daqhats import hat_list, mcc134, HatIDs, TcTypes
+from daqhats import hat_list, mcc134, HatIDs, TcTypes, HatError
 
 
 _app = Dash(__name__)   # pylint: disable=invalid-name,no-member
@@ -34,15 +49,155 @@ _app.css.config.serve_locally = True
 _app.scripts.config.serve_locally = True
 
 _HAT = None  # Store the hat object in a global for use in multiple callbacks.
+_RING = None  # Server-side buffer of the samples to display, see SampleRing.
+_PRODUCER = None  # Thread reading the board into _RING.
+_CONFIG = None  # Settings of the acquisition, shown to the clients joining it.
+_OWNER = None  # (client id, time) of the last Configure, see reserved_by_other
+_LOCK = threading.Lock()  # Serializes the Configure, Start and Stop clicks.
 
 MCC134_CHANNEL_COUNT = 4
+MAX_SAMPLES_TO_DISPLAY = 1000
+CONFIGURE_TIMEOUT = 60.0  # Seconds a configured board stays reserved
+
+
+class SampleRing(object):
+    """
+    NumPy ring buffer of the last samples read from the MCC 134, shared by the
+    callbacks of all the clients.  Each sample is numbered by its position in
+    the acquisition (the sequence number), so each client can request the
+    samples it has not plotted yet without removing them for the other
+    clients.
+
+    Args:
+        capacity (int): The number of samples kept, at least the number of
+            samples displayed by any client.
+        number_of_channels (int): The number of channels of each sample.
+    """
+
+    def __init__(self, capacity, number_of_channels):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, number_of_channels))
+        self.sample_count = 0  # Total number of samples appended
+        self._lock = threading.Lock()
+
+    def append(self, values):
+        """
+        Appends one sample.
+
+        Args:
+            values (list[float]): The value of each channel.
+
+        Returns:
+            int: The updated total sample count.
+        """
+        with self._lock:
+            self.data[self.sample_count % self.capacity] = values
+            self.sample_count += 1
+            return self.sample_count
+
+    def since(self, sequence, limit=None):
+        """
+        Returns the samples appended after the specified sequence number,
+        limited to the ones still in the buffer.
+
+        Args:
+            sequence (int): The sample count already received by the client.
+            limit (int): The maximum number of samples returned, the most
+                recent ones.  Defaults to None (all the samples in the buffer).
+
+        Returns:
+            tuple: The sample numbers (numpy.ndarray) and the values, one row
+            per sample and one column per channel (numpy.ndarray).
+        """
+        with self._lock:
+            first = max(sequence, self.sample_count - self.capacity)
+            if limit is not None:
+                first = max(first, self.sample_count - limit)
+            samples = np.arange(first, self.sample_count)
+            return samples, self.data[samples % self.capacity]
+
+
+class TemperatureProducer(threading.Thread):
+    """
+    Background thread reading the active thermocouple channels into the shared
+    SampleRing at the selected rate.  It is the only reader of the board, so
+    the read cost does not depend on the number of clients.  A failed read is
+    counted in read_errors and the thread keeps reading.
+
+    Args:
+        hat (mcc134): The MCC 134 object, with the TC types written.
+        ring (SampleRing): The buffer the samples are appended to.
+        channels ([int]): The active channels.
+        seconds_per_sample (float): The time between two samples.
+    """
+
+    def __init__(self, hat, ring, channels, seconds_per_sample):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.hat = hat
+        self.ring = ring
+        self.channels = list(channels)
+        self.seconds_per_sample = seconds_per_sample
+        self.read_errors = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        # Samples at t0 + k * seconds_per_sample, whatever the read time.
+        deadline = time.monotonic()
+        while True:
+            try:
+                self.ring.append([self.hat.t_in_read(channel)
+                                  for channel in self.channels])
+            except HatError:
+                # Shown to the clients, the next read is tried on time.
+                self.read_errors += 1
+            deadline += self.seconds_per_sample
+            if self._stop_event.wait(max(deadline - time.monotonic(), 0)):
+                break
+
+    def stop(self):
+        """
+        Stops the thread after its current read.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+def acquisition_running():
+    """
+    Returns True if the temperature producer is running, i.e. if a client
+    started an acquisition.
+    """
+    producer = globals()['_PRODUCER']
+    return producer is not None and producer.is_alive()
+
+
+def reserved_by_other(client_id):
+    """
+    Returns True if another client configured the board and did not start
+    the acquisition yet.  The reservation expires after CONFIGURE_TIMEOUT
+    seconds, so a client closing its page after Configure does not keep the
+    board.
 
+    Args:
+        client_id (str): The id of the client, see serve_layout.
+    """
+    owner = globals()['_OWNER']
+    return (owner is not None and owner[0] != client_id
+            and time.monotonic() - owner[1] < CONFIGURE_TIMEOUT)
 
-def create_hat_selector():
+
+def create_hat_selector(selection=None):
     """
     Gets a list of available MCC 134 devices and creates a corresponding
     dash-core-components Dropdown element for the user interface.
 
+    Args:
+        selection (str): A string representation of a JSON object containing
+            the descriptor of the selected HAT.  Defaults to None (the first
+            HAT).
+
     Returns:
         dcc.Dropdown: A dash-core-components Dropdown object.
     """
@@ -55,8 +210,7 @@ def create_hat_selector():
         option = {'label': label, 'value': json.dumps(hat._asdict())}
         hat_selection_options.append(option)
 
-    selection = None
-    if hat_selection_options:
+    if selection is None and hat_selection_options:
         selection = hat_selection_options[0]['value']
 
     return dcc.Dropdown(    # pylint: disable=no-member
@@ -99,106 +253,133 @@ _TC_TYPE_OPTIONS = [{'label': 'J', 'value': TcTypes.TYPE_J},
                     {'label': 'N', 'value': TcTypes.TYPE_N}]
 
 # pylint: disable=no-member
-_app.layout = html.Div([
-    html.H1(
-        children='MCC 134 DAQ HAT Web Server Example',
-        id='exampleTitle'),
-    html.Div(
-        children=[
-            html.Div(
-                id='rightContent',
-                children=[
-                    dcc.Graph(id='stripChart'),
-                    html.Div(id='errorDisplay',
-                             children='',
-                             style={'font-weight': 'bold', 'color': 'red'})],
-                style={'width': '100%', 'box-sizing': 'border-box',
-                       'float': 'left', 'padding-left': 320}),
-            html.Div(
-                id='leftContent',
-                children=[
-                    html.Label('Select a HAT...',
-                               style={'font-weight': 'bold'}),
-                    create_hat_selector(),
-                    html.Label('Seconds per sample',
-                               style={'font-weight': 'bold', 'display': 'block',
-                                      'margin-top': 10}),
-                    dcc.Input(id='secondsPerSample', type='number',
-                              step=1, value=1.0, min=1.0,
-                              style={'width': 100, 'display': 'block'}),
-                    html.Label('Samples to display',
-                               style={'font-weight': 'bold',
-                                      'display': 'block', 'margin-top': 10}),
-                    dcc.Input(id='samplesToDisplay', type='number', min=2,
-                              max=1000, step=1, value=100,
-                              style={'width': 100, 'display': 'block'}),
-                    html.Div(
-                        children=[
-                            html.Label('Active Channels',
-                                       style={'font-weight': 'bold',
-                                              'display': 'block',
-                                              'margin-top': 10,
-                                              'margin-bottom': 8}),
-                            dcc.Checklist(
-                                id='channelSelections',
-                                options=[
-                                    {'label': 'Channel 0', 'value': 0},
-                                    {'label': 'Channel 1', 'value': 1},
-                                    {'label': 'Channel 2', 'value': 2},
-                                    {'label': 'Channel 3', 'value': 3}],
-                                labelStyle={'display': 'block', 'height': 36},
-                                value=[0])],
-                        style={'float': 'left', 'width': 150}),
-                    html.Div(
-                        id='tcTypeSelectors',
-                        children=[
-                            html.Label('TC Type',
-                                       style={'font-weight': 'bold',
-                                              'display': 'block',
-                                              'margin-top': 10}),
-                            dcc.Dropdown(id='tcTypeSelector0',
-                                         options=_TC_TYPE_OPTIONS,
-                                         value=TcTypes.TYPE_J,
-                                         clearable=False),
-                            dcc.Dropdown(id='tcTypeSelector1',
-                                         options=_TC_TYPE_OPTIONS,
-                                         value=TcTypes.TYPE_J,
-                                         clearable=False),
-                            dcc.Dropdown(id='tcTypeSelector2',
-                                         options=_TC_TYPE_OPTIONS,
-                                         value=TcTypes.TYPE_J,
-                                         clearable=False),
-                            dcc.Dropdown(id='tcTypeSelector3',
-                                         options=_TC_TYPE_OPTIONS,
-                                         value=TcTypes.TYPE_J,
-                                         clearable=False)],
-                        style={'float': 'left', 'width': 150,
-                               'margin-bottom': 8}),
-                    html.Button(
-                        children='Configure',
-                        id='startStopButton',
-                        style={'width': 100, 'height': 35,
-                               'text-align': 'center', 'margin-top': 30})],
-                style={'width': 320, 'box-sizing': 'border-box', 'padding': 10,
-                       'position': 'absolute', 'top': 0, 'left': 0})],
-        style={'position': 'relative', 'display': 'block',
-               'overflow': 'hidden', 'padding-bottom': 100}),
-    dcc.Interval(
-        id='timer',
-        interval=1000*60*60*24,  # in milliseconds
-        n_intervals=0),
-    html.Div(
-        id='chartData',
-        style={'display': 'none'},
-        children=init_chart_data(1, 1000)),
-    html.Div(
-        id='chartInfo',
-        style={'display': 'none'},
-        children=json.dumps({'sample_count': 0})),
-    html.Div(
-        id='status',
-        style={'display': 'none'}),
-])
+def serve_layout():
+    """
+    Creates the HTML layout for the user interface, consisting of
+    dash-html-components and dash-core-components.  The layout is created for
+    each client that loads the page, so a client joining a running
+    acquisition gets its settings and status.
+
+    Returns:
+        html.Div: The root element of the user interface.
+    """
+    config = {'hat': None, 'seconds_per_sample': 1.0,
+              'samples_to_display': 100, 'channels': [0],
+              'tc_types': [TcTypes.TYPE_J] * MCC134_CHANNEL_COUNT,
+              'status': None}
+    chart_data = init_chart_data(1, MAX_SAMPLES_TO_DISPLAY)
+    if acquisition_running():
+        config = globals()['_CONFIG']
+        chart_data = init_chart_data(len(config['channels']),
+                                     int(config['samples_to_display']))
+
+    tc_type_selectors = [html.Label('TC Type',
+                                    style={'font-weight': 'bold',
+                                           'display': 'block',
+                                           'margin-top': 10})]
+    for channel in range(MCC134_CHANNEL_COUNT):
+        tc_type_selectors.append(
+            dcc.Dropdown(id='tcTypeSelector{0:d}'.format(channel),
+                         options=_TC_TYPE_OPTIONS,
+                         value=config['tc_types'][channel],
+                         clearable=False))
+
+    return html.Div([
+        html.H1(
+            children='MCC 134 DAQ HAT Web Server Example',
+            id='exampleTitle'),
+        html.Div(
+            children=[
+                html.Div(
+                    id='rightContent',
+                    children=[
+                        dcc.Graph(id='stripChart'),
+                        html.Div(id='errorDisplay',
+                                 children='',
+                                 style={'font-weight': 'bold',
+                                        'color': 'red'})],
+                    style={'width': '100%', 'box-sizing': 'border-box',
+                           'float': 'left', 'padding-left': 320}),
+                html.Div(
+                    id='leftContent',
+                    children=[
+                        html.Label('Select a HAT...',
+                                   style={'font-weight': 'bold'}),
+                        create_hat_selector(config['hat']),
+                        html.Label('Seconds per sample',
+                                   style={'font-weight': 'bold',
+                                          'display': 'block',
+                                          'margin-top': 10}),
+                        dcc.Input(id='secondsPerSample', type='number',
+                                  step=1, value=config['seconds_per_sample'],
+                                  min=1.0,
+                                  style={'width': 100, 'display': 'block'}),
+                        html.Label('Samples to display',
+                                   style={'font-weight': 'bold',
+                                          'display': 'block',
+                                          'margin-top': 10}),
+                        dcc.Input(id='samplesToDisplay', type='number', min=2,
+                                  max=MAX_SAMPLES_TO_DISPLAY, step=1,
+                                  value=config['samples_to_display'],
+                                  style={'width': 100, 'display': 'block'}),
+                        html.Div(
+                            children=[
+                                html.Label('Active Channels',
+                                           style={'font-weight': 'bold',
+                                                  'display': 'block',
+                                                  'margin-top': 10,
+                                                  'margin-bottom': 8}),
+                                dcc.Checklist(
+                                    id='channelSelections',
+                                    options=[
+                                        {'label': 'Channel 0', 'value': 0},
+                                        {'label': 'Channel 1', 'value': 1},
+                                        {'label': 'Channel 2', 'value': 2},
+                                        {'label': 'Channel 3', 'value': 3}],
+                                    labelStyle={'display': 'block',
+                                                'height': 36},
+                                    value=config['channels'])],
+                            style={'float': 'left', 'width': 150}),
+                        html.Div(
+                            id='tcTypeSelectors',
+                            children=tc_type_selectors,
+                            style={'float': 'left', 'width': 150,
+                                   'margin-bottom': 8}),
+                        html.Button(
+                            children='Configure',
+                            id='startStopButton',
+                            style={'width': 100, 'height': 35,
+                                   'text-align': 'center',
+                                   'margin-top': 30})],
+                    style={'width': 320, 'box-sizing': 'border-box',
+                           'padding': 10, 'position': 'absolute', 'top': 0,
+                           'left': 0})],
+            style={'position': 'relative', 'display': 'block',
+                   'overflow': 'hidden', 'padding-bottom': 100}),
+        dcc.Interval(
+            id='timer',
+            interval=1000*60*60*24,  # in milliseconds
+            n_intervals=0),
+        html.Div(
+            id='chartData',
+            style={'display': 'none'},
+            children=chart_data),
+        html.Div(
+            id='chartInfo',
+            style={'display': 'none'},
+            children=json.dumps({'sample_count': 0})),
+        html.Div(
+            id='status',
+            style={'display': 'none'},
+            children=config['status']),
+        html.Div(
+            id='clientId',
+            style={'display': 'none'},
+            children=uuid.uuid4().hex),
+    ])
+
+
+_app.layout = serve_layout
 # pylint: enable=no-member
 
 
@@ -207,29 +388,40 @@ _app.layout = html.Div([
     [Input('startStopButton', 'n_clicks')],
     [State('startStopButton', 'children'),
      State('hatSelector', 'value'),
+     State('secondsPerSample', 'value'),
+     State('samplesToDisplay', 'value'),
      State('channelSelections', 'value'),
      State('tcTypeSelector0', 'value'),
      State('tcTypeSelector1', 'value'),
      State('tcTypeSelector2', 'value'),
-     State('tcTypeSelector3', 'value')]
+     State('tcTypeSelector3', 'value'),
+     State('clientId', 'children')]
 )   # pylint: disable=too-many-arguments
 def start_stop_click(n_clicks, button_label, hat_descriptor_json_str,
-                     active_channels, tc_type0, tc_type1, tc_type2, tc_type3):
+                     seconds_per_sample, samples_to_display, active_channels,
+                     tc_type0, tc_type1, tc_type2, tc_type3, client_id):
     """
     A callback function to change the application status when the Configure,
-    Start or Stop button is clicked.
+    Start or Stop button is clicked.  The clicks of all the clients are
+    serialized: a board configured by a client can only be configured again
+    by this client until it starts the acquisition, and only this client can
+    start it.
 
     Args:
         n_clicks (int): Number of button clicks - triggers the callback.
         button_label (str): The current label on the button.
         hat_descriptor_json_str (str): A string representation of a JSON object
             containing the descriptor for the selected MCC 134 DAQ HAT.
+        seconds_per_sample (float): The user specified sample rate value in
+            seconds per sample.
+        samples_to_display (float): The number of samples to be displayed.
         active_channels ([int]): A list of integers corresponding to the user
             selected Active channel checkboxes.
         tc_type0 (TcTypes): The selected TC Type for channel 0.
         tc_type1 (TcTypes): The selected TC Type for channel 0.
         tc_type2 (TcTypes): The selected TC Type for channel 0.
         tc_type3 (TcTypes): The selected TC Type for channel 0.
+        client_id (str): The id of the client, see serve_layout.
 
     Returns:
         str: The new application status - "idle", "configured", "running"
@@ -237,27 +429,59 @@ def start_stop_click(n_clicks, button_label, hat_descriptor_json_str,
 
     """
     output = 'idle'
-    if n_clicks is not None and n_clicks > 0:
-        output = 'error'
+    if n_clicks is None or n_clicks <= 0:
+        return output
+
+    output = 'error'
+    with _LOCK:
+        # pylint: disable=global-statement
+        global _HAT, _RING, _CONFIG, _OWNER, _PRODUCER
         if button_label == 'Configure':
-            # If configuring, create the hat object.
-            if hat_descriptor_json_str:
+            # If configuring, create the hat object, unless another client is
+            # acquiring from the board or configured it.
+            if (hat_descriptor_json_str and not acquisition_running()
+                    and not reserved_by_other(client_id)):
                 hat_descriptor = json.loads(hat_descriptor_json_str)
                 # The hat object is retained as a global for use in
                 # other callbacks.
-                global _HAT     # pylint: disable=global-statement
                 _HAT = mcc134(hat_descriptor['address'])
 
                 if active_channels:
-                    # Set the TC type for all active channels to the selected TC
-                    # type prior to acquiring data.
+                    # Set the TC type for all active channels to the selected
+                    # TC type prior to acquiring data.
                     tc_types = [tc_type0, tc_type1, tc_type2, tc_type3]
                     for channel in active_channels:
                         _HAT.tc_type_write(channel, tc_types[channel])
+                    # New server-side buffer for the configured channels,
+                    # large enough for the window of any client.
+                    _RING = SampleRing(MAX_SAMPLES_TO_DISPLAY,
+                                       len(active_channels))
+                    # Settings shown to the clients joining the acquisition.
+                    _CONFIG = {'hat': hat_descriptor_json_str,
+                               'seconds_per_sample': seconds_per_sample,
+                               'samples_to_display': samples_to_display,
+                               'channels': active_channels,
+                               'tc_types': tc_types,
+                               'status': 'running'}
+                    # The board is reserved for this client until it starts.
+                    _OWNER = (client_id, time.monotonic())
                     output = 'configured'
         elif button_label == 'Start':
-            output = 'running'
+            # A single thread reads the board for all the clients, started by
+            # the client that configured it.
+            if (not acquisition_running() and _OWNER is not None
+                    and _OWNER[0] == client_id):
+                _PRODUCER = TemperatureProducer(_HAT, _RING, active_channels,
+                                                float(seconds_per_sample))
+                _PRODUCER.start()
+                _OWNER = None
+                output = 'running'
         elif button_label == 'Stop':
+            # The acquisition may already have been stopped from another
+            # client.
+            if _PRODUCER is not None:
+                _PRODUCER.stop()
+                _PRODUCER = None
             output = 'idle'
 
     return output
@@ -410,7 +634,10 @@ def update_strip_chart_data(_n_intervals, acq_state, chart_data_json_str,
     div element.  The chartData element is used to store the existing data
     values, which allows sharing of data between callback functions.  Global
     variables cannot be used to share data between callbacks (see
-    https://dash.plot.ly/sharing-data-between-callbacks).
+    https://dash.plot.ly/sharing-data-between-callbacks).  The samples are read
+    by the temperature producer into the server-side ring buffer, shared by all
+    the clients, and only the samples that this client has not received yet
+    are added to its chart data.
 
     Args:
         _n_intervals (int): Number of timer intervals - triggers the callback.
@@ -430,9 +657,22 @@ def update_strip_chart_data(_n_intervals, acq_state, chart_data_json_str,
     samples_to_display = int(samples_to_display_val)
     num_channels = len(active_channels)
     if acq_state == 'running':
-        hat = globals()['_HAT']
-        if hat is not None:
+        ring = globals()['_RING']
+        if ring is not None:
             chart_data = json.loads(chart_data_json_str)
+            producer = globals()['_PRODUCER']
+            read_errors = producer.read_errors if producer is not None else 0
+            errors_changed = read_errors != chart_data.get('read_errors', 0)
+            chart_data['read_errors'] = read_errors
+
+            # Samples read since the last update of this client.
+            samples, values = ring.since(chart_data['sample_count'],
+                                         samples_to_display)
+            if not len(samples):
+                # No new sample, e.g. the reads fail: report the errors.
+                if errors_changed:
+                    return json.dumps(chart_data)
+                return no_update
 
             # Reset error flags
             chart_data['open_tc_error'] = False
@@ -440,8 +680,7 @@ def update_strip_chart_data(_n_intervals, acq_state, chart_data_json_str,
             chart_data['common_mode_range_error'] = False
 
             data = []
-            for channel in active_channels:
-                temp_val = hat.t_in_read(channel)
+            for temp_val in values.flatten().tolist():
                 if temp_val == mcc134.OPEN_TC_VALUE:
                     chart_data['open_tc_error'] = True
                     data.append(None)
@@ -454,7 +693,9 @@ def update_strip_chart_data(_n_intervals, acq_state, chart_data_json_str,
                 else:
                     data.append(temp_val)
 
-            # Add the samples read to the chart_data object.
+            # Add the samples read to the chart_data object, from the first
+            # one still in the ring buffer.
+            chart_data['sample_count'] = int(samples[0])
             sample_count = add_samples_to_data(samples_to_display, num_channels,
                                                chart_data, data)
 
@@ -612,10 +853,11 @@ def update_chart_info(_figure, chart_data_json_str):
     [Input('chartData', 'children'),
      Input('status', 'children')],
     [State('hatSelector', 'value'),
-     State('channelSelections', 'value')]
+     State('channelSelections', 'value'),
+     State('clientId', 'children')]
 )  # pylint: disable=too-many-arguments
 def update_error_message(chart_data_json_str, acq_state, hat_selection,
-                         active_channels):
+                         active_channels, client_id):
     """
     A callback function to display error messages.
 
@@ -628,6 +870,7 @@ def update_error_message(chart_data_json_str, acq_state, hat_selection,
             containing the descriptor for the selected MCC 134 DAQ HAT.
         active_channels ([int]): A list of integers corresponding to the user
             selected Active channel checkboxes.
+        client_id (str): The id of the client, see serve_layout.
 
     Returns:
         str: The error message to display.
@@ -644,8 +887,15 @@ def update_error_message(chart_data_json_str, acq_state, hat_selection,
         if ('common_mode_range_error' in chart_data.keys()
                 and chart_data['common_mode_range_error']):
             error_message += 'Temp outside common-mode range; '
+        if chart_data.get('read_errors'):
+            error_message += 'HAT read errors: {0}; '.format(
+                chart_data['read_errors'])
     elif acq_state == 'error':
         num_active_channels = len(active_channels)
+        if acquisition_running():
+            error_message += 'Acquisition running from another client; '
+        elif reserved_by_other(client_id):
+            error_message += 'HAT configured by another client; '
         if not hat_selection:
             error_message += 'Invalid HAT selection; '
         if num_active_channels <= 0:
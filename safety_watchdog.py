@@ -0,0 +1,306 @@
+"""
+Purpose:
+    Independent watchdog process for the overpressure shutdown.
+
+    Description:
+        Without the watchdog, the pressure alarm is evaluated by whichever
+        loop is running (T_P_disp(), T_P_acq_csv(), get_current_T_P()...), so
+        its reaction time depends on the LCD writes, CSV writes and prints of
+        this loop, and there is no protection at all between two loops.
+
+        SafetyWatchdog is a separate process which owns the MCC 128 pressure
+        channels. It runs a continuous hardware-clocked scan at scan_rate,
+        converts each block to bar, evaluates the shutdown rule over the whole
+        block (see acq_alarm.py) and drives the alarm and system shutdown pins.
+        It asks for real-time scheduling (SCHED_FIFO) and falls back to a
+        lower nice value when not allowed. It never waits on the rest of the
+        system: the pressures are published in a shared memory ring buffer
+        (WatchdogBuffer, see acq_shared.py), guarded by a sequence counter. The watchdog never
+        takes a lock, the readers copy the data and retry if the watchdog
+        wrote in the meantime.
+
+        The reaction latency of each block is measured as the age of its
+        oldest sample when the pins have been written: the time since the read,
+        plus one scan period per sample of the block. Its last, mean and max
+        values are published in the buffer. If the watchdog fails (board error,
+        exception), it raises the alarm and the system shutdown before exiting.
+        It ignores Ctrl+C, which the terminal also sends to it, and is only
+        stopped by stop().
+
+        Other processes, e.g. a web dashboard, attach to the buffer by name
+        with WatchdogBuffer.attach(). A HatSession with an attached watchdog
+        (HatSession.attach_watchdog()) reads its pressures from the buffer
+        instead of the MCC 128, and leaves the alarm pins to the watchdog.
+        The scan mode functions (T_P_acq_scan(), T_P_acq_frames()) cannot run
+        while the watchdog scans the MCC 128.
+
+"""
+
+################################################
+"""
+Imports
+"""
+
+import multiprocessing
+import os
+import signal
+import time
+import numpy as np
+
+from daqhats import mcc128, OptionFlags, HatError
+from daqhats_utils import chan_list_to_mask, PollBackoff #daqhats_utils needs to be in the same folders as this script
+from T_P_acq_func import sound_alarm, no_sound_alarm, system_shutdown, no_system_shutdown, READ_ALL_AVAILABLE, \
+pressure_alarm_hysteresis, pressure_alarm_debounce, pressure_alarm_latch #T_P_acq_func needs to be in the same folders as this script
+from acq_alarm import AlarmEngine, AlarmRule #acq_alarm needs to be in the same folders as this script
+from acq_shared import WatchdogBuffer, WATCHDOG_BUFFER_NAME, STATUS_RUNNING, STATUS_STOPPED, STATUS_FAILED, \
+STATUS_NAMES, POLICY_NORMAL, POLICY_NICE, POLICY_FIFO, SAMPLES, STATUS, HEARTBEAT_NS, SHUTDOWN, OVERRUNS, POLICY, \
+SCAN_RATE #acq_shared needs to be in the same folders as this script
+
+
+################################################
+"""
+Watchdog process
+"""
+
+class SafetyWatchdog(multiprocessing.Process):
+    """
+    Watchdog process scanning the pressure channels and driving the alarm and system shutdown pins.
+
+    Typical use:
+        session = HatSession(channels_134, channels_128)
+        watchdog = SafetyWatchdog(session, pressure_alarm=130, scan_rate=1000)
+        watchdog.start()
+        session.attach_watchdog(watchdog) # The session now reads its pressures from the watchdog
+        ...
+        watchdog.stop()
+        watchdog.print_report()
+        watchdog.close()
+
+    Args:
+        session (HatSession): Session whose MCC 128 address, channels, input mode, range and calibration are used.
+        pressure_alarm (float, optional): Pressure shutdown threshold in bar. Defaults to 130.
+        scan_rate (float, optional): Scan rate in Hz per channel. Defaults to 1000.
+        hysteresis (float, optional): The shutdown is released when all pressures are below pressure_alarm - hysteresis.
+            Defaults to pressure_alarm_hysteresis.
+        debounce (int, optional): Number of consecutive samples above pressure_alarm needed for the shutdown.
+            Defaults to pressure_alarm_debounce.
+        latch (bool, optional): Whether the shutdown stays on until the watchdog is restarted. Defaults to pressure_alarm_latch.
+        poll_interval (float, optional): Longest wait in seconds between two scan reads when no sample is available,
+            it bounds the reaction latency. Defaults to 0.001.
+        buffer_seconds (float, optional): Duration of the shared ring buffer in seconds. Defaults to 10.
+        priority (int, optional): SCHED_FIFO priority of the watchdog process, 1 to 99. Defaults to 50.
+        cpu (int, optional): CPU the watchdog process is pinned to. Defaults to None (any CPU).
+        name (str, optional): Name of the shared memory block. Defaults to WATCHDOG_BUFFER_NAME.
+    """
+
+    def __init__(self, session, pressure_alarm=130, scan_rate=1000, hysteresis=pressure_alarm_hysteresis,
+                 debounce=pressure_alarm_debounce, latch=pressure_alarm_latch, poll_interval=0.001,
+                 buffer_seconds=10, priority=50, cpu=None, name=WATCHDOG_BUFFER_NAME):
+        multiprocessing.Process.__init__(self, name='SafetyWatchdog', daemon=True)
+        self.address = session.address_128
+        self.channels = session.channels_128
+        self.input_mode = session.input_mode
+        self.input_range = session.input_range
+        self.calibration = session.calibration
+        self.pressure_alarm = pressure_alarm
+        self.scan_rate = scan_rate
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+        self.latch = latch
+        self.poll_interval = poll_interval
+        self.priority = priority
+        self.cpu = cpu
+
+        capacity = max(int(buffer_seconds * scan_rate), 1)
+        self.buffer = WatchdogBuffer.create(self.channels, capacity, scan_rate, pressure_alarm, name=name)
+        self._stop_event = multiprocessing.Event()
+
+    ### Watchdog process
+
+    def _raise_priority(self):
+        if self.cpu is not None:
+            os.sched_setaffinity(0, {self.cpu})
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+            return POLICY_FIFO
+        except (AttributeError, PermissionError, OSError):
+            pass
+        try:
+            os.nice(-10)
+            return POLICY_NICE
+        except (PermissionError, OSError):
+            return POLICY_NORMAL
+
+    def _print_warning(self, output, active):
+        if output == 'shutdown' and active:
+            print('\nWatchdog : Pressure above ', self.pressure_alarm, ' bar, system shutdown')
+        elif output == 'shutdown':
+            print('\nWatchdog : Pressure back below ', self.pressure_alarm - self.hysteresis, ' bar')
+
+    def run(self):
+        # Ctrl+C in the terminal reaches this process too: the watchdog is only stopped by stop()
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        buffer = self.buffer
+        buffer.header[POLICY] = self._raise_priority()
+
+        rule = AlarmRule('watchdog pressure above {} bar'.format(self.pressure_alarm), self.pressure_alarm,
+                         ('alarm', 'shutdown'), hysteresis=self.hysteresis, debounce=self.debounce, latch=self.latch)
+        engine = AlarmEngine([rule], outputs={'alarm': (sound_alarm, no_sound_alarm),
+                                              'shutdown': (system_shutdown, no_system_shutdown)},
+                             on_transition=self._print_warning)
+
+        hat = None
+        number_of_channels = len(self.channels)
+        channel_mask = chan_list_to_mask(list(self.channels))
+        scan_buffer = max(int(self.scan_rate), 1000) # Samples per channel of the board buffer, 1 s at least
+        backoff = PollBackoff(min_interval=min(0.0002, self.poll_interval), max_interval=self.poll_interval)
+
+        try:
+            hat = mcc128(self.address)
+            hat.a_in_mode_write(self.input_mode)
+            hat.a_in_range_write(self.input_range)
+            actual_scan_rate = hat.a_in_scan_actual_rate(number_of_channels, self.scan_rate)
+            buffer.parameters[SCAN_RATE] = actual_scan_rate
+            period_ns = int(1e9 / actual_scan_rate)
+
+            hat.a_in_scan_start(channel_mask, scan_buffer, self.scan_rate, OptionFlags.CONTINUOUS)
+            buffer.header[STATUS] = STATUS_RUNNING
+
+            while not self._stop_event.is_set():
+                read_result = hat.a_in_scan_read(READ_ALL_AVAILABLE, 0)
+                read_ns = time.perf_counter_ns()
+
+                if read_result.hardware_overrun or read_result.buffer_overrun:
+                    # Samples were lost, restart the scan. The alarm state is kept
+                    buffer.header[OVERRUNS] += 1
+                    hat.a_in_scan_stop()
+                    hat.a_in_scan_cleanup()
+                    hat.a_in_scan_start(channel_mask, scan_buffer, self.scan_rate, OptionFlags.CONTINUOUS)
+                    continue
+
+                samples_read = len(read_result.data) // number_of_channels
+                if samples_read == 0:
+                    buffer.header[HEARTBEAT_NS] = read_ns
+                    backoff.sleep()
+                    continue
+                backoff.reset()
+
+                # Pins first, then publication
+                pressures = self.calibration.convert(
+                    np.asarray(read_result.data).reshape(samples_read, number_of_channels), self.channels)
+                engine.evaluate(pressures)
+                done_ns = time.perf_counter_ns()
+
+                # Age of the oldest sample of the block when the pins are written
+                latency_ns = done_ns - read_ns + samples_read * period_ns
+                buffer.write_block(pressures, read_ns)
+                buffer.record_block(latency_ns, engine.output_state['shutdown'], rule.trips, read_ns)
+
+            buffer.header[STATUS] = STATUS_STOPPED
+
+        except Exception:
+            # Fail safe: the pressure is no longer watched (board error, bug), not on a normal stop
+            buffer.header[STATUS] = STATUS_FAILED
+            sound_alarm()
+            system_shutdown()
+            buffer.header[SHUTDOWN] = 1
+            raise
+
+        finally:
+            if hat is not None:
+                try:
+                    hat.a_in_scan_stop()
+                    hat.a_in_scan_cleanup()
+                except HatError:
+                    pass
+
+    ### Main process
+
+    def wait_ready(self, timeout=5.0):
+        """
+        Waits until the watchdog has published its first block.
+
+        Args:
+            timeout (float, optional): Maximum wait in seconds. Defaults to 5.
+
+        Raises:
+            HatError: The watchdog failed or did not start in time.
+        """
+        deadline = time.monotonic() + timeout
+        backoff = PollBackoff(max_interval=0.01)
+        while self.buffer.header[SAMPLES] == 0:
+            if self.buffer.status == STATUS_FAILED or not self.is_alive() or time.monotonic() > deadline:
+                raise HatError(self.address, 'Safety watchdog did not start')
+            backoff.sleep()
+
+    def alive(self, max_age=0.5):
+        """
+        Checks that the watchdog process is running and still reading the board.
+
+        Args:
+            max_age (float, optional): Maximum age in seconds of the last scan read. Defaults to 0.5.
+
+        Returns:
+            bool: True if the watchdog is healthy.
+        """
+        age = self.buffer.heartbeat_age()
+        return (self.is_alive() and self.buffer.status == STATUS_RUNNING and age is not None and age < max_age)
+
+    def latest_pressures(self, channels):
+        """
+        Returns the last pressures scanned by the watchdog, without waiting on it.
+
+        Args:
+            channels (tuple): MCC 128 channels, in the requested order.
+
+        Returns:
+            numpy.ndarray: Pressures in bar.
+
+        Raises:
+            HatError: The watchdog is not running.
+            ValueError: A channel is not scanned by the watchdog.
+        """
+        if self.buffer.status != STATUS_RUNNING:
+            raise HatError(self.address, 'Safety watchdog {}'.format(STATUS_NAMES[self.buffer.status]))
+        samples, pressures = self.buffer.latest(channels)
+        if pressures is None:
+            raise HatError(self.address, 'Safety watchdog has no sample yet')
+        return pressures
+
+    def stop(self, timeout=2.0):
+        """
+        Stops the scan and the watchdog process. The alarm and shutdown pins are left as they are.
+
+        Args:
+            timeout (float, optional): Maximum wait in seconds for the process to stop. Defaults to 2.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        if self.is_alive():
+            self.terminate()
+            self.join(timeout)
+
+    def close(self):
+        """
+        Removes the shared memory buffer. To call once the watchdog is stopped.
+        """
+        self.buffer.close()
+
+    def stats(self):
+        """
+        Returns the state of the watchdog, see WatchdogBuffer.stats().
+        """
+        return self.buffer.stats()
+
+    def print_report(self):
+        """
+        Prints the state and reaction latency of the watchdog in the terminal.
+        """
+        stats = self.stats()
+        print('\nSafety watchdog report: {} ({}), {} samples at {:.1f} Hz in {} blocks, {} overruns'.format(
+            stats['status'], stats['policy'], stats['samples'], self.buffer.scan_rate, stats['blocks'],
+            stats['overruns']))
+        print('Shutdown {}, {} trips, reaction latency last {:.3f} ms, mean {:.3f} ms, max {:.3f} ms'.format(
+            'ON' if stats['shutdown'] else 'off', stats['trips'], stats['latency_last'] * 1e3,
+            stats['latency_mean'] * 1e3, stats['latency_max'] * 1e3))